@@ -1,11 +1,14 @@
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, Response, request, jsonify, send_file
 from flask_cors import CORS
 import os
 import uuid
 from dotenv import load_dotenv
 
 from olx_ai_edx.models import UserProfile, Skill
-from olx_ai_edx.ai_gen import AIGenerator, CourseGenerationManager, UserInteractionManager
+from olx_ai_edx.ai_gen import AIGenerator, CourseGenerationManager, UserInteractionManager, LLMResponseCache, \
+    create_backend_from_env, metric_sinks_from_env, PrometheusTextSink, QuestionBank, ProgressiveAssessment, \
+    AdaptiveAssessment, ModelTiers, provider_limits_from_env, CheckpointStore, get_single_flight, JobQueue, \
+    TokenBudgetExceeded, render_queue_metrics
 from olx_ai_edx.export import OLXExporter
 
 # 加载环境变量
@@ -17,13 +20,161 @@ CORS(app, resources={r"/api/*": {"origins": "http://127.0.0.1:5500"}})
 # 存储用户会话状态
 sessions = {}
 
+# 所有会话共享的LLM响应缓存
+llm_cache = LLMResponseCache.from_env()
+
+# 所有会话共享的LLM调用指标接收器，/metrics以Prometheus文本格式输出
+prometheus_sink = PrometheusTextSink()
+metric_sinks = metric_sinks_from_env() + [prometheus_sink]
+
+# 所有会话共享的评估题库，热门技能的评估问题无需等待模型生成
+question_bank = QuestionBank.from_env()
+
+# 按阶段选择模型的默认配置（LLM_MODEL_TIERS），会话可在start_session时传入model_tiers覆盖
+model_tiers = ModelTiers.from_env("deepseek-chat")
+
+# 课程生成的检查点，进程中断后可通过/api/resume/<job_id>继续
+checkpoint_store = CheckpointStore.from_env()
+
+# 课程生成任务队列：按租户公平调度，交互式任务优先于批量任务，并执行各租户的token预算
+job_queue = JobQueue.from_env()
+
+# 提交任务时预估的单门课程token数（用于公平调度和预算检查，任务结束后按实际用量结算）
+COURSE_ESTIMATED_TOKENS = int(os.getenv("COURSE_ESTIMATED_TOKENS", "60000"))
+
+
+def submit_course_job(session_id, course_manager, tenant, priority, job_id=None):
+    """把课程生成提交到任务队列，在后台生成并导出，完成后更新会话
+
+    Args:
+        session_id: 会话ID，生成完成后该会话进入completed状态并可下载课程
+        course_manager: 课程生成管理器
+        tenant: 租户
+        priority: 优先级，interactive或bulk
+        job_id: 任务ID（可选，使用检查点时与检查点任务ID相同）
+
+    Returns:
+        任务
+
+    Raises:
+        TokenBudgetExceeded: 租户的token预算不足
+        ValueError: 未知的优先级，或相同ID的任务仍在执行
+    """
+    def report(job, progress):
+        job.stage = progress['stage']
+        job.progress = progress['fraction']
+        job.details = {'chapters_done': progress['chapters_done'], 'chapters_total': progress['chapters_total']}
+
+    def generate(job):
+        course_manager.on_progress = lambda progress: report(job, progress)
+        # 导出作为流水线的最后一个节点
+        course = course_manager.generate_course(
+            export=lambda course: OLXExporter(course, output_dir=f"output/{course.course}").export_to_tar_gz()
+        )
+        summary = course_manager.metrics_summary
+        job.tokens_used = summary['prompt_tokens'] + summary['completion_tokens']
+
+        session = sessions[session_id]
+        session['data']['course'] = course
+        session['data']['tar_path'] = course_manager.export_result
+        session['state'] = 'completed'
+        return {
+            'session_id': session_id,
+            'course_title': course.title,
+            'chapter_count': len(course.chapters),
+            'download_url': f'/api/download/{session_id}',
+            'llm_usage': {key: summary[key]
+                          for key in ('calls', 'coalesced', 'prompt_tokens', 'completion_tokens', 'wall_time',
+                                      'cost', 'prompt_tokens_saved')}
+        }
+
+    return job_queue.submit(generate, tenant=tenant, priority=priority, estimated_tokens=COURSE_ESTIMATED_TOKENS,
+                            job_id=job_id)
+
+
+def job_status(job):
+    """任务状态响应：阶段、章节进度和预计剩余时间，完成后包含课程信息和下载地址
+
+    Args:
+        job: 任务
+
+    Returns:
+        响应字典
+    """
+    status = job.to_dict()
+    status['status_url'] = f'/api/jobs/{job.job_id}'
+    if job.state == 'done':
+        status.update(job.result)
+    return status
+
+
+def session_user_profile(session):
+    """根据会话中的姓名、技能和评估结果创建用户画像
+
+    Args:
+        session: 已完成技能评估的会话
+
+    Returns:
+        用户画像
+    """
+    data = session['data']
+    assessment_result = data['assessment_result']
+    return session['interaction_manager'].create_user_profile(
+        data['name'],
+        assessment_result['level'],
+        data['skill_name'],
+        Skill(data['skill_name'], assessment_result['learning_path'])
+    )
+
+
+def create_generator(model, session_tiers):
+    """按模型创建AI生成器
+
+    Args:
+        model: 模型名称
+        session_tiers: 会话指定的模型分级
+
+    Returns:
+        (AI生成器, API密钥, API地址)
+    """
+    if model.startswith("glm"):
+        api_key = os.getenv("GLM_API_KEY")
+        base_url = "https://open.bigmodel.cn/api/paas/v4"  # GLM实际API地址
+    else:
+        api_key = os.getenv("DEEPSEEK_API_KEY")
+        base_url = "https://api.deepseek.com/v1"  # DeepSeek实际API地址
+    ai_generator = AIGenerator(
+        api_key=api_key,
+        model=model,
+        base_url=base_url,  # 传递给AIGenerator构造函数
+        cache=llm_cache,
+        cache_bypass=os.getenv("LLM_CACHE_BYPASS") == "1",
+        backend=create_backend_from_env(model, api_key, base_url),
+        metric_sinks=metric_sinks,
+        revision_mode=os.getenv("LLM_REVISION_MODE", "patch"),
+        question_bank=question_bank,
+        model_tiers=ModelTiers(model, session_tiers)
+    )
+    return ai_generator, api_key, base_url
+
+
 @app.route('/api/start_session', methods=['POST'])
 def start_session():
     """开始新的会话"""
     session_id = str(uuid.uuid4())
+    data = request.json or {}
+    priority = data.get('priority', 'interactive')
+    if priority not in ('interactive', 'bulk'):
+        return jsonify({'error': f'未知的任务优先级：{priority}（可选interactive、bulk）'}), 400
+    try:
+        # 校验会话指定的模型分级，如{"review": "glm-4-flash"}
+        session_tiers = model_tiers.with_overrides(data.get('model_tiers')).tiers
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     sessions[session_id] = {
         'state': 'welcome',
-        'data': {},
+        # tenant用于课程生成任务的公平调度和token预算，priority为interactive或bulk
+        'data': {'model_tiers': session_tiers, 'tenant': data.get('tenant') or 'default', 'priority': priority},
         'interaction_manager': UserInteractionManager(max_iterations=1)
     }
     return jsonify({
@@ -65,24 +216,12 @@ def interact():
 
     elif state == 'model_selection':
         model_choice = user_input.strip()
-        if model_choice == "2":
-            model = "glm-4-long"
-            api_key = os.getenv("GLM_API_KEY")
-            base_url = "https://open.bigmodel.cn/api/paas/v4"  # GLM实际API地址
-        else:
-            model = "deepseek-chat"
-            api_key = os.getenv("DEEPSEEK_API_KEY")
-            base_url = "https://api.deepseek.com/v1"  # DeepSeek实际API地址
+        model = "glm-4-long" if model_choice == "2" else "deepseek-chat"
+        ai_generator, api_key, base_url = create_generator(model, session['data']['model_tiers'])
 
         session['data']['model'] = model
         session['data']['api_key'] = api_key
         session['data']['base_url'] = base_url  # 存储BASE_URL
-
-        ai_generator = AIGenerator(
-            api_key=api_key,
-            model=model,
-            base_url=base_url  # 传递给AIGenerator构造函数
-        )
         session['interaction_manager'].aigenerator = ai_generator
 
         assessment_questions = interaction_manager.aigenerator.generate_assessment_questions(session['data']['skill_name'])
@@ -95,41 +234,55 @@ def interact():
         session['data']['assessment_questions'] = assessment_questions
         session['data']['current_question_index'] = 0
         session['data']['user_responses'] = []
+        confidence_threshold = float(os.getenv("ASSESSMENT_CONFIDENCE", "0.8"))
+        if os.getenv("ASSESSMENT_ADAPTIVE") == "1":
+            # 自适应评估：根据回答选择下一个问题，水平判断足够确定时提前结束
+            assessment = AdaptiveAssessment(ai_generator, session['data']['skill_name'], assessment_questions,
+                                            confidence_threshold=confidence_threshold)
+            first_question = assessment.current_question
+        else:
+            # 每记录一个回答就在后台更新评估，最后一个回答之后通常无需再等待完整分析
+            assessment = ProgressiveAssessment(ai_generator, session['data']['skill_name'],
+                                               confidence_threshold=confidence_threshold)
+            first_question = assessment_questions[0]  # 此时列表已确保非空
+        session['data']['assessment'] = assessment
 
         session['state'] = 'skill_assessment'
         return jsonify({
             'message': f'您选择了模型: {model}',
-            'next_prompt': f'请回答以下问题来评估您的技能水平:\n{assessment_questions[0]}'  # 此时列表已确保非空
+            'next_prompt': f'请回答以下问题来评估您的技能水平:\n{first_question}'
         })
 
     elif state == 'skill_assessment':
-        current_index = session['data']['current_question_index']
+        assessment = session['data']['assessment']
+        if isinstance(assessment, AdaptiveAssessment):
+            question = assessment.current_question
+            next_question = assessment.answer(user_input)
+        else:
+            current_index = session['data']['current_question_index']
+            question = session['data']['assessment_questions'][current_index]
+            assessment.add_response(question, user_input)
+            next_question = None
+            if current_index < len(session['data']['assessment_questions']) - 1:
+                session['data']['current_question_index'] = current_index + 1
+                next_question = session['data']['assessment_questions'][current_index + 1]
         session['data']['user_responses'].append({
-            'question': session['data']['assessment_questions'][current_index],
+            'question': question,
             'answer': user_input
         })
 
-        if current_index < len(session['data']['assessment_questions']) - 1:
-            next_index = current_index + 1
-            session['data']['current_question_index'] = next_index
+        if next_question is not None:
             return jsonify({
                 'message': '已记录您的回答',
-                'next_prompt': session['data']['assessment_questions'][next_index]
+                'next_prompt': next_question,
+                'level_estimate': assessment.current(),
+                'question_count': len(session['data']['user_responses'])
             })
         else:
-            assessment_result = interaction_manager.aigenerator.analyze_user_responses(
-                session['data']['skill_name'],
-                session['data']['user_responses']
-            )
+            assessment_result = assessment.finalize()
             session['data']['assessment_result'] = assessment_result
 
-            # user_profile = interaction_manager.create_user_profile(
-            #     session['data']['name'],
-            #     assessment_result['level'],
-            #     session['data']['skill_name'],
-            #     Skill(session['data']['skill_name'], assessment_result['learning_path'])
-            # )
-            # session['data']['user_profile'] = user_profile
+            session['data']['user_profile'] = session_user_profile(session)
 
             session['state'] = 'learning_goals'
             return jsonify({
@@ -137,7 +290,8 @@ def interact():
                             f'水平说明: {assessment_result["explanation"]}\n'
                             f'您的学习目标: {", ".join(assessment_result["objectives"])}\n'
                             f'推荐学习路径: {assessment_result["learning_path"]}',
-
+                'question_count': len(session['data']['user_responses']),
+                'confidence': assessment_result['confidence']
             })
 
     elif state == 'learning_goals':
@@ -157,42 +311,149 @@ def interact():
             })
 
     elif state == 'generating_course':
-        user_profile = session['data']['user_profile']
+        # 已提交的任务仍在排队或执行时返回其进度；失败时重新提交，已保存检查点的部分不再生成
+        job = job_queue.get(session['data'].get('job_id') or '')
+        if job is not None and job.state != 'failed':
+            return jsonify(dict(job_status(job), message='课程正在后台生成，请通过status_url查询进度'))
+
+        user_profile = session['data'].get('user_profile') or session_user_profile(session)
         skill = Skill(session['data']['skill_name'], session['data']['assessment_result']['learning_path'])
         ai_generator = session['interaction_manager'].aigenerator
+        # 保存检查点，生成中断时可通过/api/resume/<job_id>继续
+        job_id = session['data'].get('job_id')
+        if checkpoint_store is not None and (job_id is None or not checkpoint_store.exists(job_id)):
+            job_id = checkpoint_store.create_job(user_profile, skill, session['data']['model'],
+                                                 session['data']['model_tiers'])
         course_manager = CourseGenerationManager(
             max_iterations=1,
             user_profile=user_profile,
             skill=skill,
-            aigenerator=ai_generator
+            aigenerator=ai_generator,
+            max_workers=int(os.getenv("COURSE_MAX_WORKERS", "4")),
+            stream=os.getenv("LLM_STREAM") == "1",
+            speculative=os.getenv("COURSE_SPECULATIVE") == "1",
+            provider_limits=provider_limits_from_env(),
+            checkpoint=checkpoint_store if job_id is not None else None,
+            job_id=job_id
         )
-        course = course_manager.generate_course()
 
-        exporter = OLXExporter(course, output_dir=f"output/{course.course}")
-        tar_path = exporter.export_to_tar_gz()
+        # 在任务队列中按租户公平排队，后台生成，立即返回任务ID
+        try:
+            job = submit_course_job(session_id, course_manager, session['data']['tenant'],
+                                    session['data']['priority'], job_id)
+        except TokenBudgetExceeded as e:
+            return jsonify({'error': str(e)}), 429
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        session['data']['job_id'] = job.job_id
 
-        session['data']['course'] = course
-        session['data']['tar_path'] = tar_path
-        session['state'] = 'completed'
-
-        return jsonify({
-            'message': '课程已生成完成！',
-            'course_title': course.title,
-            'chapter_count': len(course.chapters),
-            'download_url': f'/api/download/{session_id}'
-        })
+        return jsonify(dict(job_status(job), message='课程生成任务已提交，正在后台生成...',
+                            processing=True)), 202
 
     else:
         return jsonify({'error': '未知会话状态'}), 400
 
+@app.route('/api/resume/<job_id>', methods=['POST'])
+def resume_course(job_id):
+    """从检查点继续中断的课程生成任务，跳过已生成的大纲和章节；在后台生成，立即返回任务ID和新会话ID"""
+    try:
+        if checkpoint_store is None or not checkpoint_store.exists(job_id):
+            return jsonify({'error': '检查点任务不存在'}), 404
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    job = job_queue.get(job_id)
+    if job is not None and job.state in ('queued', 'running'):
+        return jsonify(dict(job_status(job), message='任务仍在生成中')), 409
+
+    data = request.json or {}
+    meta = checkpoint_store.load_meta(job_id)
+    user_profile = checkpoint_store.restore_profile(job_id)
+    ai_generator, _, _ = create_generator(meta['model'], meta.get('model_tiers'))
+    course_manager = CourseGenerationManager(
+        max_iterations=1,
+        user_profile=user_profile,
+        skill=user_profile.learning_goals,
+        aigenerator=ai_generator,
+        max_workers=int(os.getenv("COURSE_MAX_WORKERS", "4")),
+        provider_limits=provider_limits_from_env(),
+        checkpoint=checkpoint_store,
+        job_id=job_id
+    )
+
+    session_id = str(uuid.uuid4())
+    sessions[session_id] = {
+        'state': 'generating_course',
+        'data': {'name': user_profile.name, 'model': meta['model'], 'job_id': job_id},
+        'interaction_manager': UserInteractionManager(max_iterations=1, aigenerator=ai_generator)
+    }
+    try:
+        job = submit_course_job(session_id, course_manager, data.get('tenant') or 'default',
+                                data.get('priority', 'interactive'), job_id)
+    except TokenBudgetExceeded as e:
+        del sessions[session_id]
+        return jsonify({'error': str(e)}), 429
+    except ValueError as e:
+        del sessions[session_id]
+        return jsonify({'error': str(e)}), 400
+    return jsonify(dict(job_status(job), message='课程生成任务已提交，正在后台生成...')), 202
+
+@app.route('/api/jobs', methods=['GET'])
+def list_jobs():
+    """列出检查点中的课程生成任务（最近创建的在前），未完成且不在队列中的任务可以通过/api/resume继续"""
+    jobs = []
+    for meta in checkpoint_store.list_jobs() if checkpoint_store is not None else []:
+        job = job_queue.get(meta['job_id'])
+        state = job.state if job is not None else None
+        jobs.append(dict(meta, state=state,
+                         resumable=meta.get('status') != 'completed' and state not in ('queued', 'running')))
+    return jsonify({'jobs': jobs})
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """查询课程生成任务的状态、阶段、章节进度和预计剩余时间"""
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': '任务不存在或已过期'}), 404
+    return jsonify(job_status(job))
+
 @app.route('/api/download/<session_id>', methods=['GET'])
 def download_course(session_id):
-    """下载课程包"""
-    if session_id not in sessions or 'tar_path' not in sessions[session_id]['data']:
-        return jsonify({'error': '课程不存在或尚未生成'}), 400
+    """下载课程包（也可以传入任务ID）；课程尚未生成完成时返回任务进度"""
+    session = sessions.get(session_id)
+    job = job_queue.get((session['data'].get('job_id') or '') if session is not None else session_id)
+    if session is None and job is not None and job.state == 'done':
+        session = sessions.get(job.result['session_id'])
+    if session is not None and 'tar_path' in session['data']:
+        return send_file(session['data']['tar_path'], as_attachment=True)
+
+    if job is not None and job.state in ('queued', 'running'):
+        return jsonify(dict(job_status(job), message='课程尚未生成完成')), 202
+    if job is not None and job.state == 'failed':
+        return jsonify(dict(job_status(job), message='课程生成失败')), 500
+    return jsonify({'error': '课程不存在或尚未生成'}), 400
+
+@app.route('/api/queue', methods=['GET'])
+def queue_stats():
+    """课程生成任务队列的深度、排队时间、吞吐量和各租户用量"""
+    return jsonify(job_queue.stats())
 
-    tar_path = sessions[session_id]['data']['tar_path']
-    return send_file(tar_path, as_attachment=True)
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """以Prometheus文本格式输出LLM调用指标、请求合并统计和任务队列统计"""
+    text = prometheus_sink.render() + render_queue_metrics(job_queue.stats())
+    single_flight = get_single_flight()
+    if single_flight is not None:
+        stats = single_flight.stats()
+        text += ("# HELP llm_single_flight_leaders_total 实际发送的请求数\n"
+                 "# TYPE llm_single_flight_leaders_total counter\n"
+                 f"llm_single_flight_leaders_total {stats['leaders']}\n"
+                 "# HELP llm_single_flight_coalesced_total 与进行中的相同请求合并的请求数\n"
+                 "# TYPE llm_single_flight_coalesced_total counter\n"
+                 f"llm_single_flight_coalesced_total {stats['coalesced']}\n"
+                 "# HELP llm_single_flight_in_flight 进行中的请求数\n"
+                 "# TYPE llm_single_flight_in_flight gauge\n"
+                 f"llm_single_flight_in_flight {stats['in_flight']}\n")
+    return Response(text, mimetype='text/plain; version=0.0.4')
 
 if __name__ == '__main__':
     app.run(debug=True, port=5000)
\ No newline at end of file
@@ -0,0 +1,98 @@
+"""
+OLX Course Generator 基准测试
+===============
+
+使用离线桩后端或录制的磁带回放，在无网络环境下端到端测量课程生成、
+OLX转换和导出各阶段的耗时。
+
+示例:
+    python bench.py --backend stub --runs 3
+    python bench.py --backend replay --cassette output/cassette.jsonl --latency 0.5 --jitter 0.2 --workers 4
+"""
+
+import argparse
+import cProfile
+import os
+import pstats
+import time
+
+from olx_ai_edx.models import UserProfile, Skill
+from olx_ai_edx.ai_gen import AIGenerator, CourseGenerationManager, StubBackend, ReplayBackend
+from olx_ai_edx.export import OLXExporter
+
+
+def run_once(args, run: int) -> dict:
+    """执行一次完整的课程生成与导出
+
+    Args:
+        args: 命令行参数
+        run: 运行序号
+
+    Returns:
+        各阶段耗时（秒）
+    """
+    if args.backend == "replay":
+        backend = ReplayBackend(args.cassette, latency=args.latency, jitter=args.jitter,
+                                error_rate=args.error_rate, seed=args.seed + run, fallback=StubBackend())
+    else:
+        backend = StubBackend()
+    ai_generator = AIGenerator(model=args.model, backend=backend)
+
+    skill = Skill(args.skill, f"{args.skill}基础知识")
+    user = UserProfile("bench", "beginner", skill)
+    manager = CourseGenerationManager(user, max_iterations=args.iterations, skill=skill,
+                                      aigenerator=ai_generator, max_workers=args.workers)
+
+    timings = {}
+    start = time.perf_counter()
+    course = manager.generate_course()
+    timings["generate_course"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    course.to_olx()
+    timings["to_olx"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    OLXExporter(course, output_dir=os.path.join(args.output, course.course)).export_to_tar_gz()
+    timings["export_to_tar_gz"] = time.perf_counter() - start
+    return timings
+
+
+def main():
+    """主函数，运行基准测试并输出各阶段耗时"""
+    parser = argparse.ArgumentParser(description="课程生成流程的离线基准测试")
+    parser.add_argument("--backend", choices=["stub", "replay"], default="stub", help="使用的离线后端")
+    parser.add_argument("--cassette", default="output/cassette.jsonl", help="回放使用的磁带文件")
+    parser.add_argument("--latency", type=float, default=None, help="每次请求注入的延迟（秒），默认使用录制时的耗时")
+    parser.add_argument("--jitter", type=float, default=0.0, help="随机抖动上限（秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="注入模拟错误的概率")
+    parser.add_argument("--seed", type=int, default=0, help="随机数种子")
+    parser.add_argument("--model", default="deepseek-chat", help="模型名称（影响磁带匹配）")
+    parser.add_argument("--skill", default="Python 编程", help="生成课程的技能")
+    parser.add_argument("--iterations", type=int, default=1, help="评审/更新的最大迭代次数")
+    parser.add_argument("--workers", type=int, default=1, help="并发生成章节的最大请求数")
+    parser.add_argument("--runs", type=int, default=1, help="运行次数")
+    parser.add_argument("--output", default="output/bench", help="导出目录")
+    parser.add_argument("--profile", action="store_true", help="使用cProfile输出耗时最多的函数")
+    args = parser.parse_args()
+
+    profiler = cProfile.Profile() if args.profile else None
+    results = []
+    for run in range(args.runs):
+        if profiler:
+            profiler.enable()
+        results.append(run_once(args, run))
+        if profiler:
+            profiler.disable()
+
+    print("\n基准测试结果（秒）:")
+    for stage in results[0]:
+        values = [r[stage] for r in results]
+        print(f"  {stage}: 平均 {sum(values) / len(values):.4f}，最小 {min(values):.4f}，最大 {max(values):.4f}")
+
+    if profiler:
+        pstats.Stats(profiler).sort_stats("cumulative").print_stats(20)
+
+
+if __name__ == '__main__':
+    main()
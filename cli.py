@@ -6,9 +6,13 @@ OLX格式自动课程生成系统 - 基于AI的个性化学习内容生成
 """
 
 from olx_ai_edx.models import UserProfile, Skill
-from olx_ai_edx.ai_gen import AIGenerator, CourseGenerationManager
+from olx_ai_edx.ai_gen import AIGenerator, CourseGenerationManager, LLMResponseCache, create_backend_from_env, \
+    metric_sinks_from_env, OpenAIBackend, BatchCourseBuilder, LocalBatchTransport, OpenAIBatchTransport, QuestionBank, \
+    ModelTiers, provider_limits_from_env, CheckpointStore
 from olx_ai_edx.export import OLXExporter
 from olx_ai_edx.ai_gen import UserInteractionManager
+import argparse
+import json
 import os
 from dotenv import load_dotenv
 
@@ -16,9 +20,124 @@ from dotenv import load_dotenv
 load_dotenv(os.path.join(os.path.dirname(__file__), 'olx_ai_edx', 'ref', '.env'))
 
 
+def run_batch(spec_path: str, model: str, transport_kind: str, poll_interval: float):
+    """批处理模式：为规格文件中的每门课程生成大纲，以一个批处理任务生成所有章节，然后导出
+
+    规格文件为JSON数组，每项包含name、skill、level和learning_path（可选）。
+
+    Args:
+        spec_path: 课程规格文件路径
+        model: 使用的模型名称
+        transport_kind: 批处理传输层，api表示服务商的Batch API，local表示用LLM_BACKEND指定的后端在本地执行
+        poll_interval: 轮询任务状态的间隔（秒）
+    """
+    with open(spec_path, "r", encoding="utf-8") as f:
+        specs = json.load(f)
+
+    api_key = os.getenv("GLM_API_KEY") if model.startswith("glm") else os.getenv("DEEPSEEK_API_KEY")
+    llm_cache = LLMResponseCache.from_env()
+    backend = create_backend_from_env(model, api_key)
+    metric_sinks = metric_sinks_from_env()
+    model_tiers = ModelTiers.from_env(model)
+
+    managers = []
+    for spec in specs:
+        skill = Skill(spec["skill"], spec.get("learning_path", ""))
+        user = UserProfile(spec["name"], spec.get("level", "beginner"), skill)
+        ai_generator = AIGenerator(api_key=api_key, model=model, cache=llm_cache, backend=backend,
+                                   metric_sinks=metric_sinks, revision_mode=os.getenv("LLM_REVISION_MODE", "patch"),
+                                   model_tiers=model_tiers)
+        managers.append(CourseGenerationManager(user, max_iterations=1, skill=skill, aigenerator=ai_generator,
+                                                max_workers=int(os.getenv("COURSE_MAX_WORKERS", "4")),
+                                                provider_limits=provider_limits_from_env()))
+
+    if transport_kind == "local":
+        transport = LocalBatchTransport(backend)
+    else:
+        # 批处理任务只包含章节请求，使用章节级别模型所属服务商的接口
+        transport = OpenAIBatchTransport(OpenAIBackend.for_model(model_tiers.model_for("generate_chapter_content")).client)
+    courses = BatchCourseBuilder(managers, transport, poll_interval=poll_interval).run()
+
+    for course in courses:
+        tar_path = OLXExporter(course, output_dir=f"output/{course.course}").export_to_tar_gz()
+        print(f"课程已导出到：{tar_path}")
+
+
+def prewarm_questions(count: int, skills: list, model: str):
+    """预热评估题库：为指定技能或请求最多的技能预先生成评估问题
+
+    Args:
+        count: 未指定技能时预热的热门技能数
+        skills: 指定的技能名称列表（为空时按请求次数选取）
+        model: 使用的模型名称
+    """
+    question_bank = QuestionBank.from_env()
+    if question_bank is None:
+        print("QUESTION_BANK_PATH为空，题库未启用")
+        return
+    api_key = os.getenv("GLM_API_KEY") if model.startswith("glm") else os.getenv("DEEPSEEK_API_KEY")
+    ai_generator = AIGenerator(api_key=api_key, model=model, backend=create_backend_from_env(model, api_key),
+                               metric_sinks=metric_sinks_from_env(), model_tiers=ModelTiers.from_env(model))
+    results = question_bank.prewarm(skills or question_bank.top_skills(count),
+                                    ai_generator.request_assessment_questions)
+    print(f"题库预热完成：{sum(1 for n in results.values() if n)}/{len(results)}个技能")
+
+
+def resume_course(job_id: str):
+    """从检查点继续中断的课程生成任务，跳过已生成的大纲和章节，然后导出
+
+    Args:
+        job_id: 检查点任务ID
+    """
+    checkpoint = CheckpointStore.from_env()
+    if checkpoint is None or not checkpoint.exists(job_id):
+        print(f"未找到检查点任务：{job_id}")
+        return
+    meta = checkpoint.load_meta(job_id)
+    model = meta["model"]
+    user = checkpoint.restore_profile(job_id)
+    api_key = os.getenv("GLM_API_KEY") if model.startswith("glm") else os.getenv("DEEPSEEK_API_KEY")
+    ai_generator = AIGenerator(api_key=api_key, model=model, cache=LLMResponseCache.from_env(),
+                               backend=create_backend_from_env(model, api_key),
+                               metric_sinks=metric_sinks_from_env(),
+                               revision_mode=os.getenv("LLM_REVISION_MODE", "patch"),
+                               model_tiers=ModelTiers(model, meta.get("model_tiers")))
+    course_manager = CourseGenerationManager(max_iterations=1, user_profile=user, skill=user.learning_goals,
+                                             aigenerator=ai_generator,
+                                             max_workers=int(os.getenv("COURSE_MAX_WORKERS", "4")),
+                                             provider_limits=provider_limits_from_env(),
+                                             checkpoint=checkpoint, job_id=job_id)
+    print(f"继续课程生成任务 {job_id}（{user.name}，{user.learning_goals.name}）")
+    course_manager.generate_course(
+        export=lambda course: OLXExporter(course, output_dir=f"output/{course.course}").export_to_tar_gz()
+    )
+    print(f"课程已导出到：{course_manager.export_result}")
+
+
 def main():
     """主函数，演示课程生成系统"""
 
+    parser = argparse.ArgumentParser(description="OLX格式自动课程生成系统")
+    parser.add_argument("--batch", metavar="SPEC_FILE", help="批处理模式：按JSON规格文件批量生成课程")
+    parser.add_argument("--model", default="deepseek-chat", help="批处理和题库预热使用的模型（默认deepseek-chat）")
+    parser.add_argument("--batch-transport", choices=["api", "local"], default="api",
+                        help="批处理传输层：api为服务商的Batch API，local为本地执行（默认api）")
+    parser.add_argument("--batch-poll", type=float, default=30.0, help="批处理任务状态的轮询间隔（秒）")
+    parser.add_argument("--prewarm-questions", type=int, metavar="N",
+                        help="预热评估题库：为请求最多的N个技能预先生成评估问题")
+    parser.add_argument("--skills", nargs="+", help="与--prewarm-questions一起使用，指定要预热的技能")
+    parser.add_argument("--resume", metavar="JOB_ID", help="从检查点继续中断的课程生成任务")
+    args = parser.parse_args()
+    if args.resume:
+        resume_course(args.resume)
+        return
+    if args.prewarm_questions is not None:
+        prewarm_questions(args.prewarm_questions, args.skills, args.model)
+        return
+    if args.batch:
+        run_batch(args.batch, args.model, args.batch_transport, args.batch_poll)
+        return
+
     # 允许用户选择模型
     print("欢迎使用自动课程生成系统！")
     print("\n请选择要使用的模型:")
@@ -34,7 +153,15 @@ def main():
     else:
         model = "deepseek-chat"  # 默认模型
         api_key = os.getenv("DEEPSEEK_API_KEY")
-    ai_generator = AIGenerator(api_key=api_key, model=model)
+    # 相同请求的响应缓存在本地，设置LLM_CACHE_BYPASS=1可强制重新请求
+    llm_cache = LLMResponseCache.from_env()
+    ai_generator = AIGenerator(api_key=api_key, model=model, cache=llm_cache,
+                               cache_bypass=os.getenv("LLM_CACHE_BYPASS") == "1",
+                               backend=create_backend_from_env(model, api_key),
+                               metric_sinks=metric_sinks_from_env(),
+                               revision_mode=os.getenv("LLM_REVISION_MODE", "patch"),
+                               question_bank=QuestionBank.from_env(),
+                               model_tiers=ModelTiers.from_env(model))
     interaction_manager = UserInteractionManager(max_iterations=1, aigenerator=ai_generator)
 
     # 步骤1：获取用户信息
@@ -60,15 +187,28 @@ def main():
     user = interaction_manager.create_user_profile(nickname, assessment["level"], skill_name=skill_name, learning_goals=skill)
 
     # 步骤2：生成课程
-    course_manager = CourseGenerationManager(max_iterations=1, user_profile=user, skill=skill, aigenerator=ai_generator)
-    course = course_manager.generate_course()
-
-    # 步骤3：导出为OLX
-    exporter = OLXExporter(course, output_dir=f"output/{course.course}")
-    tar_path = exporter.export_to_tar_gz()
+    max_workers = int(os.getenv("COURSE_MAX_WORKERS", "4"))
+    # 保存检查点，中断后可用 --resume <任务ID> 继续
+    checkpoint = CheckpointStore.from_env()
+    job_id = checkpoint.create_job(user, skill, model, ai_generator.model_tiers.tiers) if checkpoint is not None else None
+    if job_id:
+        print(f"课程生成任务ID：{job_id}（中断后可运行 python cli.py --resume {job_id} 继续）")
+    course_manager = CourseGenerationManager(max_iterations=1, user_profile=user, skill=skill, aigenerator=ai_generator,
+                                             max_workers=max_workers, stream=os.getenv("LLM_STREAM") == "1",
+                                             speculative=os.getenv("COURSE_SPECULATIVE") == "1",
+                                             provider_limits=provider_limits_from_env(),
+                                             checkpoint=checkpoint, job_id=job_id)
+
+    # 步骤3：导出为OLX（流水线的最后一个节点）
+    course_manager.generate_course(
+        export=lambda course: OLXExporter(course, output_dir=f"output/{course.course}").export_to_tar_gz()
+    )
+    tar_path = course_manager.export_result
 
     print(f"\n恭喜！您的课程已生成并导出到：{tar_path}")
     print("您可以将此文件导入到 Open edX 平台进行学习。")
+    if llm_cache is not None:
+        print(f"LLM响应缓存统计：{llm_cache.stats()}")
 
 
 if __name__ == '__main__':
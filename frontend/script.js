@@ -55,6 +55,7 @@ async function sendMessage() {
         if (data.course_title) showCourseInfo(data); // 直接显示课程信息
         if (data.download_url) downloadUrl = data.download_url;
         if (data.error) addMessage('consultant', data.error); // 显示详细错误
+        if (data.status_url && data.state !== 'done') await pollJob(data.status_url); // 课程在后台生成
 
     } catch (err) {
         console.error('发送失败:', err);
@@ -87,6 +88,40 @@ async function generateCourse() {
     }
 }
 
+async function pollJob(statusUrl) {
+    showLoading('课程生成中...');
+    try {
+        while (true) {
+            await new Promise(resolve => setTimeout(resolve, 3000));
+            const res = await fetch(`http://127.0.0.1:5000${statusUrl}`);
+            const job = await res.json();
+            const loading = document.querySelector('#loadingIndicator span');
+            if (loading) {
+                const chapters = job.details && job.details.chapters_total
+                    ? `，章节 ${job.details.chapters_done}/${job.details.chapters_total}` : '';
+                const eta = job.eta_seconds != null ? `，预计还需 ${Math.ceil(job.eta_seconds)} 秒` : '';
+                loading.textContent = `课程生成中（${job.stage || '排队中'}${chapters}${eta}）...`;
+            }
+            if (job.state === 'done') {
+                removeLoading();
+                addMessage('consultant', '课程已生成完成！');
+                showCourseInfo(job);
+                downloadUrl = job.download_url;
+                return;
+            }
+            if (job.state === 'failed' || job.error) {
+                removeLoading();
+                addMessage('consultant', `课程生成失败：${job.error || '未知错误'}，发送任意消息可从中断处继续。`);
+                return;
+            }
+        }
+    } catch (err) {
+        console.error('查询进度失败:', err);
+        removeLoading();
+        addMessage('consultant', '查询课程生成进度失败，请稍后重试。');
+    }
+}
+
 function addMessage(type, content) {
     const msg = document.createElement('div');
     msg.className = `message ${type}`;
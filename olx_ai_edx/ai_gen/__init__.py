@@ -3,9 +3,78 @@
 from .ai_gen_content import AIGenerator
 from .course_manager import CourseGenerationManager
 from .user_interaction import UserInteractionManager
+from .llm_cache import LLMResponseCache
+from .backends import LLMBackend, OpenAIBackend, StubBackend, RecordingBackend, ReplayBackend, \
+    create_backend_from_env
+from .router import HedgedRouter, LatencyTracker, get_hedged_router
+from .metrics import MetricsRecorder, MetricsSink, InMemoryAggregator, JSONLSink, PrometheusTextSink, \
+    metric_sinks_from_env, format_summary
+from .schema import SchemaValidator, OUTLINE_SCHEMA, CHAPTER_SCHEMA
+from .prompts import PromptLayout, COURSE_LAYOUT, ASSESSMENT_LAYOUT
+from .prompt_compiler import PromptCompiler, count_tokens, format_savings
+from .json_patch import apply_patch, PatchError
+from .convergence import ConvergenceDetector, compare_versions
+from .question_bank import QuestionBank, normalize_skill_name
+from .model_tiers import ModelTiers, tier_for_stage
+from .pipeline import Pipeline, PipelineNode, provider_limits_from_env
+from .checkpoint import CheckpointStore
+from .singleflight import SingleFlight, get_single_flight
+from .job_queue import JobQueue, GenerationJob, TokenBudgetExceeded, render_queue_metrics
+from .assessment import ProgressiveAssessment, AdaptiveAssessment
+from .batch import BatchTransport, OpenAIBatchTransport, LocalBatchTransport, BatchCourseBuilder
 
 __all__ = [
     'AIGenerator',
     'CourseGenerationManager',
-    'UserInteractionManager'
+    'UserInteractionManager',
+    'LLMResponseCache',
+    'LLMBackend',
+    'OpenAIBackend',
+    'StubBackend',
+    'RecordingBackend',
+    'ReplayBackend',
+    'create_backend_from_env',
+    'HedgedRouter',
+    'LatencyTracker',
+    'get_hedged_router',
+    'MetricsRecorder',
+    'MetricsSink',
+    'InMemoryAggregator',
+    'JSONLSink',
+    'PrometheusTextSink',
+    'metric_sinks_from_env',
+    'format_summary',
+    'SchemaValidator',
+    'OUTLINE_SCHEMA',
+    'CHAPTER_SCHEMA',
+    'BatchTransport',
+    'OpenAIBatchTransport',
+    'LocalBatchTransport',
+    'BatchCourseBuilder',
+    'PromptLayout',
+    'COURSE_LAYOUT',
+    'ASSESSMENT_LAYOUT',
+    'PromptCompiler',
+    'count_tokens',
+    'format_savings',
+    'apply_patch',
+    'PatchError',
+    'ConvergenceDetector',
+    'compare_versions',
+    'QuestionBank',
+    'normalize_skill_name',
+    'ProgressiveAssessment',
+    'AdaptiveAssessment',
+    'ModelTiers',
+    'tier_for_stage',
+    'Pipeline',
+    'PipelineNode',
+    'provider_limits_from_env',
+    'CheckpointStore',
+    'SingleFlight',
+    'get_single_flight',
+    'JobQueue',
+    'GenerationJob',
+    'TokenBudgetExceeded',
+    'render_queue_metrics'
 ]
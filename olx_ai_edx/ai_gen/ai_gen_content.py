@@ -1,65 +1,472 @@
 """AI生成器模块 - 模拟AI模型生成课程内容"""
 
-from typing import Dict, Any, List, Union
-from openai import OpenAI
+from typing import Callable, Dict, Any, List, Optional, Union
 import os
+import time
 from dotenv import load_dotenv
 
 from ..models import UserProfile
 from ..models import Skill
+from .backends import LLMBackend, OpenAIBackend
+from .conversation import ConversationContext, estimate_messages_tokens
+from .json_stream import IncrementalJSONParser
+from .llm_cache import LLMResponseCache, make_request_key
+from .llm_response import ChatResponse, usage_to_dict
+from .metrics import CallRecord, MetricsRecorder, MetricsSink
+from .model_tiers import ModelTiers
+from .prompts import ASSESSMENT_LAYOUT, COURSE_LAYOUT, compact_json
+from .prompt_compiler import PromptCompiler
+from .question_bank import QuestionBank
+from .singleflight import SingleFlight, get_single_flight
+from .providers import provider_for_model
+from .rate_limiter import ProviderRateLimiter, RetryPolicy, error_status_code, get_rate_limiter, is_retryable, \
+    retry_after_seconds
+from .json_patch import PatchError, apply_patch
+from .schema import CHAPTER_VALIDATOR, COURSE_VALIDATOR, OUTLINE_VALIDATOR, SchemaValidator, errors_to_text, \
+    extract_json, get_at, repair_target, set_at
 
 import json
 
 # 加载环境变量../ref/.env
 load_dotenv(os.path.join(os.path.dirname(__file__), '..', 'ref', '.env'))
 
+# single_flight参数的默认值，表示使用进程级共享的请求合并器（传入None表示不合并）
+_SHARED_SINGLE_FLIGHT: Any = object()
+
+
 class AIGenerator:
     """模拟AI模型通过多轮对话生成课程内容"""
 
-    def __init__(self, api_key: str = None, model: str = "deepseek-chat"):
+    # 要求模型只输出JSON对象的response_format
+    JSON_RESPONSE_FORMAT = {"type": "json_object"}
+
+    def __init__(self, api_key: str = None, model: str = "deepseek-chat", context_token_budget: int = 6000,
+                 cache: Optional[LLMResponseCache] = None, cache_bypass: bool = False,
+                 backend: Optional[LLMBackend] = None, rate_limiter: Optional[ProviderRateLimiter] = None,
+                 retry_policy: Optional[RetryPolicy] = None, base_url: Optional[str] = None,
+                 metric_sinks: Optional[List[MetricsSink]] = None, json_mode: bool = True, max_repairs: int = 3,
+                 revision_mode: str = "patch", question_bank: Optional[QuestionBank] = None,
+                 prompt_budgets: Optional[Dict[str, int]] = None, model_tiers: Optional[ModelTiers] = None,
+                 single_flight: Optional[SingleFlight] = _SHARED_SINGLE_FLIGHT):
         """初始化AI生成器
 
         Args:
             api_key: OpenAI API Key
             model: 选择使用的AI模型
+            context_token_budget: 单次请求的输入token预算，超出时省略较早的对话
+            cache: LLM响应缓存（可选，None表示不使用缓存）
+            cache_bypass: 为True时跳过缓存读取，强制请求API（结果仍会写入缓存）
+            backend: LLM后端（可选，默认根据模型所属服务商创建OpenAI兼容接口后端）
+            rate_limiter: 限流器（可选，默认使用该服务商的进程级共享限流器）
+            retry_policy: 瞬时错误的重试策略（可选）
+            base_url: API地址（可选，默认使用模型所属服务商的地址）
+            metric_sinks: 额外的调用指标接收器（可选，如JSONL文件或Prometheus；内存汇总始终启用）
+            json_mode: 结构化请求是否使用response_format要求模型只输出JSON
+            max_repairs: 结构化回复未通过校验时，每个回复最多发送的修复请求数
+            revision_mode: 根据评审更新大纲、章节和课程的方式：patch表示让模型只返回JSON Patch编辑操作
+                并在本地应用（补丁无效时改为完整输出），full表示让模型输出完整对象
+            question_bank: 评估题库（可选，提供时评估问题优先从题库读取）
+            prompt_budgets: 各阶段嵌入提示的数据的token预算（可选，默认使用prompt_compiler.STAGE_BUDGETS）
+            model_tiers: 按阶段选择模型的分级配置（可选，未指定的级别使用model）
+            single_flight: 请求合并器（可选，默认使用进程级共享的合并器，LLM_SINGLE_FLIGHT=0时不合并；
+                传入None时不合并，传入单独的实例可与其他生成器隔离）
         """
-        self.model = model
-        if api_key is None:
-            api_key = os.getenv("DEEPSEEK_API_KEY")
-        
-        if model is None:
-            BASE_URL = "https://api.deepseek.com"
-        elif model.lower() == "glm-4-long":
-            BASE_URL = "https://open.bigmodel.cn/api/paas/v4/"
-
-        self.client = OpenAI(api_key=api_key, base_url=BASE_URL)
+        self.model = model or "deepseek-chat"
+        # 评审、评估等阶段可以使用更便宜的模型，未指定的级别使用self.model
+        self.model_tiers = (model_tiers or ModelTiers(self.model)).with_overrides(default_model=self.model)
+        # 默认后端复用进程内按(base_url, api_key)共享的客户端连接池
+        self.backend = backend or OpenAIBackend.for_model(self.model, api_key, base_url)
+        # 接口后端按服务商区分，分级模型属于其他服务商时另建后端；录制后端和路由器在内部按服务商转发，桩、回放等后端处理所有模型
+        self._backends: Optional[Dict[str, LLMBackend]] = \
+            {provider_for_model(self.model): self.backend} if isinstance(self.backend, OpenAIBackend) else None
+        # 使用真实API时保留客户端引用
+        self.client = getattr(self.backend, "client", None)
         # 初始化对话历史
         self.messages = []
+        # 章节级对话分支的共享前缀和token预算
+        self.context = ConversationContext(token_budget=context_token_budget)
+        self.cache = cache
+        self.cache_bypass = cache_bypass
+        # 多个会话同时发出的相同请求只发送一次
+        self.single_flight = get_single_flight() if single_flight is _SHARED_SINGLE_FLIGHT else single_flight
+        # 同一服务商的所有生成器共享配额
+        self.rate_limiter = rate_limiter or get_rate_limiter(provider_for_model(self.model))
+        self._custom_rate_limiter = rate_limiter is not None
+        self.retry_policy = retry_policy or RetryPolicy()
+        # 预留配额时对单次回复token数的估计
+        self.expected_completion_tokens = 1024
+        # 每次调用的token、耗时和费用指标
+        self.metrics = MetricsRecorder(metric_sinks)
+        self.json_mode = json_mode
+        self.max_repairs = max_repairs
+        self.revision_mode = revision_mode
+        self.question_bank = question_bank
+        # 按阶段精简提示中的数据并统计节省的token
+        self.prompts = PromptCompiler(stage_budgets=prompt_budgets)
+
+    def fork_conversation(self) -> List[Dict[str, Any]]:
+        """从共享前缀（用户画像和最终大纲）派生一个新的章节对话分支
+
+        Returns:
+            新的对话历史列表
+        """
+        return self.context.fork()
+
+    def model_for(self, stage: Optional[str]) -> str:
+        """获取阶段使用的模型
+
+        Args:
+            stage: 流水线阶段名称（可选）
+
+        Returns:
+            模型名称
+        """
+        return self.model_tiers.model_for(stage)
+
+    def _backend_for(self, model: str) -> LLMBackend:
+        """获取请求该模型使用的后端
 
-    def _call_llm_api(self, messages: List[Dict[str, str]]) -> Dict[str, Any]:
-        """调用大语言模型API
+        Args:
+            model: 模型名称
+
+        Returns:
+            后端实例
+        """
+        if self._backends is None:
+            return self.backend
+        provider = provider_for_model(model)
+        if provider not in self._backends:
+            self._backends[provider] = OpenAIBackend.for_model(model)
+        return self._backends[provider]
+
+    def _rate_limiter_for(self, model: str) -> ProviderRateLimiter:
+        """获取该模型所属服务商的限流器
+
+        Args:
+            model: 模型名称
+
+        Returns:
+            限流器
+        """
+        if self._custom_rate_limiter or provider_for_model(model) == provider_for_model(self.model):
+            return self.rate_limiter
+        return get_rate_limiter(provider_for_model(model))
+
+    def _call_llm_api(self, messages: List[Dict[str, str]], stage: str = "unknown", use_cache: bool = True,
+                      stream: bool = False, on_object: Optional[Callable[[str, Dict[str, Any]], None]] = None,
+                      structured: bool = False) -> Dict[str, Any]:
+        """调用大语言模型API，并记录本次调用的token、耗时和费用
         
         Args:
             messages: 消息历史列表
+            stage: 调用所属的流水线阶段名称，用于指标汇总
+            use_cache: 是否允许从缓存读取本次请求的结果
+            stream: 是否以流式方式接收回复
+            on_object: 流式接收时的回调，每当回复JSON中的chapters/sequentials/verticals
+                数组有对象完整到达时，以(键名, 对象)调用
+            structured: 是否为要求JSON输出的结构化请求（启用json_mode时附带response_format）
             
         Returns:
             API响应对象
         """
-        if "glm" in self.model.lower():
-            # GLM模型的API调用
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=messages
-            )
+        params = {"response_format": self.JSON_RESPONSE_FORMAT} if structured and self.json_mode else {}
+        model = self.model_for(stage)
+        start = time.perf_counter()
+        try:
+            response = self._request(messages, use_cache, stream, on_object, params, model)
+        except Exception as e:
+            self.metrics.record(CallRecord(stage, model, wall_time=time.perf_counter() - start,
+                                           error=f"{type(e).__name__}: {e}"))
+            raise
+
+        cache_hit = getattr(response, "cached", False)
+        coalesced = getattr(response, "coalesced", False)
+        # 缓存命中和合并的请求没有产生新的token用量
+        usage = usage_to_dict(None if cache_hit or coalesced else getattr(response, "usage", None))
+        self.metrics.record(CallRecord(
+            stage,
+            getattr(response, "model", None) or model,
+            prompt_tokens=usage["prompt_tokens"],
+            completion_tokens=usage["completion_tokens"],
+            wall_time=time.perf_counter() - start,
+            ttft=getattr(response, "ttft", None),
+            cache_hit=cache_hit,
+            cached_tokens=usage["cached_tokens"],
+            coalesced=coalesced
+        ))
+        return response
+
+    def _request(self, messages: List[Dict[str, str]], use_cache: bool = True, stream: bool = False,
+                 on_object: Optional[Callable[[str, Dict[str, Any]], None]] = None,
+                 params: Optional[Dict[str, Any]] = None, model: Optional[str] = None) -> Any:
+        """裁剪消息、查询缓存并发送请求
+
+        Args:
+            messages: 消息历史列表
+            use_cache: 是否允许从缓存读取本次请求的结果
+            stream: 是否以流式方式接收回复
+            on_object: 流式接收时对象完整到达后的回调（可选）
+            params: 其他请求参数（可选，如response_format）
+            model: 使用的模型（可选，默认self.model）
+
+        Returns:
+            API响应对象
+        """
+        # 裁剪超出token预算的早期对话，保持每次请求的输入规模稳定
+        messages = self.context.fit(messages)
+        params = params or {}
+        model = model or self.model
+
+        # 相同模型和消息的请求直接返回缓存结果
+        cache_key = None
+        if self.cache is not None:
+            cache_key = make_request_key(model, messages, **params)
+            if use_cache and not self.cache_bypass:
+                cached = self.cache.get(cache_key)
+                if cached is not None:
+                    if stream and on_object is not None:
+                        for key, obj in IncrementalJSONParser().feed(cached["content"]):
+                            on_object(key, obj)
+                    return ChatResponse(cached["content"], cached["model"], cached["usage"], cached=True)
+
+        if self.single_flight is None:
+            response = self._send_with_retry(messages, stream, on_object, params, model)
         else:
-            # DeepSeek或其他模型的默认API调用
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=messages
-            )
+            # 相同的请求正在进行时等待其结果，而不是再发送一次
+            flight_key = cache_key or make_request_key(model, messages, **params)
+            response, coalesced = self.single_flight.do(
+                flight_key, lambda: self._send_with_retry(messages, stream, on_object, params, model))
+            if coalesced:
+                content = response.choices[0].message.content
+                if stream and on_object is not None:
+                    for key, obj in IncrementalJSONParser().feed(content):
+                        on_object(key, obj)
+                shared = ChatResponse(content, getattr(response, "model", None) or model,
+                                      usage_to_dict(getattr(response, "usage", None)))
+                shared.coalesced = True
+                # 缓存已由领头请求写入
+                return shared
+
+        if cache_key is not None:
+            self.cache.set(cache_key, model, response.choices[0].message.content,
+                           usage_to_dict(getattr(response, "usage", None)))
             
         return response
 
+    def _send_with_retry(self, messages: List[Dict[str, str]], stream: bool = False,
+                         on_object: Optional[Callable[[str, Dict[str, Any]], None]] = None,
+                         params: Optional[Dict[str, Any]] = None, model: Optional[str] = None) -> Any:
+        """在服务商配额内发送请求，遇到限流或瞬时错误时按指数退避重试
+
+        Args:
+            messages: 实际发送的消息列表
+            stream: 是否以流式方式接收回复
+            on_object: 流式接收时对象完整到达后的回调（可选）
+            params: 其他请求参数（可选）
+            model: 使用的模型（可选，默认self.model）
+
+        Returns:
+            API响应对象
+        """
+        params = params or {}
+        model = model or self.model
+        rate_limiter = self._rate_limiter_for(model)
+        estimated = estimate_messages_tokens(messages) + self.expected_completion_tokens
+        emitted = []
+
+        def forward(key: str, obj: Dict[str, Any]) -> None:
+            emitted.append(key)
+            if on_object is not None:
+                on_object(key, obj)
+
+        attempt = 0
+        while True:
+            rate_limiter.acquire(estimated)
+            try:
+                if stream:
+                    response = self._stream_llm_api(messages, forward, params, model)
+                else:
+                    response = self._backend_for(model).complete(model, messages, **params)
+                break
+            except Exception as e:
+                # 流式回复已输出部分对象时不再重试，避免回调收到重复内容
+                if emitted or attempt >= self.retry_policy.max_retries or not is_retryable(e):
+                    raise
+                delay = self.retry_policy.delay(attempt, retry_after_seconds(e))
+                attempt += 1
+                print(f"模型请求失败（{e}），{delay:.1f}秒后进行第{attempt}次重试")
+                if error_status_code(e) == 429:
+                    # 服务端限流时暂停该服务商的所有请求，由下一次acquire等待
+                    rate_limiter.pause(delay)
+                else:
+                    time.sleep(delay)
+
+        usage = usage_to_dict(getattr(response, "usage", None))
+        rate_limiter.record_usage(estimated, usage["prompt_tokens"] + usage["completion_tokens"])
+        return response
+
+    def _stream_llm_api(self, messages: List[Dict[str, str]],
+                        on_object: Optional[Callable[[str, Dict[str, Any]], None]] = None,
+                        params: Optional[Dict[str, Any]] = None, model: Optional[str] = None) -> ChatResponse:
+        """以流式方式调用大语言模型API，并在JSON对象完整到达时立即回调
+
+        Args:
+            messages: 消息历史列表
+            on_object: 对象完整到达时的回调（可选）
+            params: 其他请求参数（可选）
+            model: 使用的模型（可选，默认self.model）
+
+        Returns:
+            包含完整回复文本的响应对象
+        """
+        parser = IncrementalJSONParser()
+        parts = []
+        usage = None
+        ttft = None
+        start = time.perf_counter()
+        model = model or self.model
+        for chunk in self._backend_for(model).stream(model, messages, **(params or {})):
+            if getattr(chunk, "usage", None) is not None:
+                usage = usage_to_dict(chunk.usage)
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if not delta:
+                continue
+            if ttft is None:
+                ttft = time.perf_counter() - start
+            parts.append(delta)
+            for key, obj in parser.feed(delta):
+                if on_object is not None:
+                    on_object(key, obj)
+        response = ChatResponse("".join(parts), model, usage)
+        response.ttft = ttft
+        return response
+
+    def _parse_structured(self, content: str, validator: SchemaValidator, stage: str) -> Optional[Dict[str, Any]]:
+        """解析并校验结构化回复，未通过校验时只把出错的片段和错误信息发给模型修复
+
+        Args:
+            content: 回复文本
+            validator: 模式校验器
+            stage: 原请求所属的流水线阶段名称
+
+        Returns:
+            通过校验的数据，修复次数用尽仍未通过时返回None
+        """
+        try:
+            _, data = extract_json(content)
+            errors = validator.validate(data)
+        except ValueError as e:
+            data, errors = None, [((), str(e))]
+
+        repairs = 0
+        while errors and repairs < self.max_repairs:
+            repairs += 1
+            # 无法解析时只能修复整段文本，否则只修复第一个错误所在的数组元素
+            path = repair_target(errors) if data is not None else ()
+            fragment = compact_json(get_at(data, path)) if data is not None else content
+            fragment_errors = [error for error in errors if error[0][:len(path)] == path]
+            print(f"{stage}的回复未通过校验，第{repairs}次修复：{errors_to_text(errors, limit=1)}")
+            try:
+                _, repaired = extract_json(self._repair_fragment(fragment, errors_to_text(fragment_errors, path),
+                                                                 validator.subschema(path), stage))
+            except ValueError:
+                continue
+            data = set_at(data, path, repaired) if data is not None else repaired
+            errors = validator.validate(data)
+
+        if errors:
+            print(f"{stage}的回复经过{repairs}次修复仍未通过校验：{errors_to_text(errors)}")
+            return None
+        return data
+
+    def _repair_fragment(self, fragment: str, error_text: str, schema: Dict[str, Any], stage: str) -> str:
+        """发送独立的修复请求，只包含出错片段、校验错误和片段的模式，不附带对话历史
+
+        Args:
+            fragment: 出错的JSON片段
+            error_text: 校验错误（路径相对于片段）
+            schema: 片段应满足的模式
+            stage: 原请求所属的流水线阶段名称
+
+        Returns:
+            修复后的回复文本
+        """
+        messages = [
+            {"role": "system", "content": "你是JSON修复工具。只输出修复后的JSON对象，不要添加任何解释。"},
+            {"role": "user",
+             "content": f"以下JSON片段未通过校验，请在尽量保留原有内容的前提下修复。\n\n"
+                        f"校验错误：\n{error_text}\n\n"
+                        f"应满足的模式：{compact_json(schema)}\n\n"
+                        f"待修复片段：{fragment}"}
+        ]
+        response = self._call_llm_api(messages, stage=f"repair_{stage}", structured=True)
+        return response.choices[0].message.content
+
+    def _revise(self, messages: List[Dict[str, Any]], stage: str, subject: str, label: str, current: Dict[str, Any],
+                review: str, validator: SchemaValidator, stream: bool = False,
+                on_object: Optional[Callable[[str, Dict[str, Any]], None]] = None) -> Optional[Dict[str, Any]]:
+        """根据评审修订对象
+
+        patch模式下模型只返回针对当前对象的JSON Patch，在本地应用并校验；
+        补丁无法应用或结果未通过校验时，在同一对话中追问完整对象。
+
+        Args:
+            messages: 对话历史
+            stage: 流水线阶段名称
+            subject: 被修订对象的名称（如“课程大纲”）
+            label: 当前对象在提示中的字段名（如“当前大纲”）
+            current: 当前对象
+            review: 评审反馈
+            validator: 修订结果的模式校验器
+            stream: 是否以流式方式接收完整输出
+            on_object: 流式接收完整输出时对象完整到达后的回调（可选）
+
+        Returns:
+            修订后的对象，失败时返回None
+        """
+        if self.revision_mode == "patch":
+            messages.append(self.prompts.request(
+                COURSE_LAYOUT, stage,
+                f"根据评审反馈修改{subject}。不要输出完整内容，只输出一个JSON对象{{\"patch\": [...]}}，"
+                f"其中patch是针对{label}的JSON Patch（RFC 6902）操作列表，每个操作包含op（add/remove/replace/move/copy）、"
+                f"path（如/chapters/0/description）和value（add/replace需要）。只修改需要改进的部分。",
+                ("评审反馈", review),
+                (label, current)
+            ))
+            response = self._call_llm_api(messages, stage=f"{stage}_patch", structured=True)
+            content = response.choices[0].message.content
+            messages.append({"role": "assistant", "content": content})
+
+            try:
+                _, data = extract_json(content)
+                if not isinstance(data, dict) or "patch" not in data:
+                    raise PatchError("回复中没有patch字段")
+                revised = apply_patch(current, data["patch"])
+                errors = validator.validate(revised)
+                if errors:
+                    raise PatchError(f"应用补丁后未通过校验：{errors_to_text(errors, limit=3)}")
+                print(f"{stage}：已应用{len(data['patch'])}个编辑操作")
+                return revised
+            except (ValueError, PatchError) as e:
+                print(f"{stage}的补丁无效（{e}），改为请求完整输出")
+                messages.append(COURSE_LAYOUT.request(
+                    f"补丁无法应用，请改为输出根据评审反馈修改后的完整{subject}，以JSON格式输出。",
+                    ("错误", str(e))
+                ))
+        else:
+            messages.append(self.prompts.request(
+                COURSE_LAYOUT, stage,
+                f"根据评审反馈更新{subject}。请保持JSON格式输出。",
+                ("评审反馈", review),
+                (label, current)
+            ))
+
+        response = self._call_llm_api(messages, stage=stage, stream=stream, on_object=on_object, structured=True)
+        messages.append({"role": "assistant", "content": response.choices[0].message.content})
+        return self._parse_structured(response.choices[0].message.content, validator, stage)
+
     def generate_initial_outline(self, user_profile: UserProfile, skill: Skill) -> Dict[str, Any]:
         """根据用户配置文件和技能生成初始课程大纲
 
@@ -73,36 +480,33 @@ class AIGenerator:
         Returns:
             课程大纲字典
         """
-        # 创建提示，开始新的对话
-        self.messages=[{
-            "role": "user", 
-            "content": f"你是一个专业课程设计师。请为用户{user_profile.name}（技能水平：{user_profile.skill_level}）设计一个关于{skill.name}的课程大纲。\n\n"
-                       f"用户的学习目标是：{', '.join(user_profile.learning_goals.description)}\n\n"
-                       f"请以JSON格式输出，包含course_title和chapters数组，每个chapter包含title和description。"
-        }]
+        # 创建提示，开始新的对话（固定的系统提示和指令在前，用户信息在后）
+        self.messages = [
+            COURSE_LAYOUT.system_message(),
+            self.prompts.request(
+                COURSE_LAYOUT, "generate_initial_outline",
+                "请根据以下用户信息设计课程大纲。"
+                "请以JSON格式输出，包含course_title和chapters数组，每个chapter包含title和description。",
+                ("学员", user_profile.name),
+                ("技能水平", user_profile.skill_level),
+                ("学习目标", user_profile.learning_goals.description),
+                ("课程主题", skill.name)
+            )
+        ]
         
         # 调用DeepSeek API
-        response = self._call_llm_api(self.messages)
+        response = self._call_llm_api(self.messages, stage="generate_initial_outline", structured=True)
         
         # 保存回复到对话历史
-        self.messages.append(response.choices[0].message)
+        self.messages.append({"role": "assistant", "content": response.choices[0].message.content})
         
-        # 尝试解析JSON响应
-        try:
-            # 从回复文本中提取JSON部分
-            content = response.choices[0].message.content
-            # 查找可能的JSON开始和结束位置
-            start = content.find('{')
-            end = content.rfind('}') + 1
-            if start >= 0 and end > start:
-                json_str = content[start:end]
-                return json.loads(json_str)
-            else:
-                # 如果未找到JSON，使用默认结构
-                return self._create_default_outline(skill.name, user_profile.name)
-        except json.JSONDecodeError:
-            # 解析失败时使用默认结构
+        # 解析并校验JSON响应，不合格时先尝试修复
+        outline = self._parse_structured(response.choices[0].message.content, OUTLINE_VALIDATOR,
+                                         "generate_initial_outline")
+        if outline is None:
+            # 修复失败时使用默认结构
             return self._create_default_outline(skill.name, user_profile.name)
+        return outline
 
     def _create_default_outline(self, skill_name, user_name):
         """创建默认大纲结构（当API响应解析失败时使用）"""
@@ -132,101 +536,127 @@ class AIGenerator:
             评审反馈
         """
         # 将大纲添加到对话历史
-        self.messages.append({
-            "role": "user",
-            "content": f"请评审以下课程大纲，并提供改进建议：\n\n{outline}"
-        })
+        self.messages.append(self.prompts.request(COURSE_LAYOUT, "review_outline", "请评审以下课程大纲，并提供改进建议。",
+                                                  ("课程大纲", outline)))
 
         # 调用DeepSeek API
-        response = self._call_llm_api(self.messages)
+        response = self._call_llm_api(self.messages, stage="review_outline")
         
         # 保存回复到对话历史
-        self.messages.append(response.choices[0].message)
+        self.messages.append({"role": "assistant", "content": response.choices[0].message.content})
 
         # return "大纲总体不错，但可以考虑增加更多实践内容，特别是在前面的章节中。"
         return response.choices[0].message.content
     
-    def update_outline(self, outline: Dict[str, Any], review: str) -> Dict[str, Any]:
+    def update_outline(self, outline: Dict[str, Any], review: str, stream: bool = False,
+                       on_object: Optional[Callable[[str, Dict[str, Any]], None]] = None) -> Dict[str, Any]:
         """根据评审更新大纲
 
         Args:
             outline: 当前大纲字典
             review: 评审反馈
+            stream: 是否以流式方式接收完整大纲（patch模式下只在补丁无效、改为完整输出时使用）
+            on_object: 流式接收时每个章节条目完整到达后的回调（可选）
 
         Returns:
             更新后的大纲字典
         """
-        # 请求更新大纲
-        self.messages.append({
-            "role": "user",
-            "content": f"根据以下评审反馈，更新课程大纲。请保持JSON格式输出。\n\n评审反馈：{review}\n\n当前大纲：{outline}"
-        })
-        
-        # 调用DeepSeek API
-        response = self._call_llm_api(self.messages)
-        
-        # 保存回复到对话历史
-        self.messages.append(response.choices[0].message)
-        
-        # 尝试解析JSON响应
-        try:
-            # 从回复文本中提取JSON部分
-            content = response.choices[0].message.content
-            # 查找可能的JSON开始和结束位置
-            start = content.find('{')
-            end = content.rfind('}') + 1
-            if start >= 0 and end > start:
-                json_str = content[start:end]
-                return json.loads(json_str)
-            else:
-                # 解析失败则返回原大纲
-                return outline
-        except json.JSONDecodeError:
-            # 解析失败则返回原大纲
-            return outline
-
-    def generate_chapter_content(self, chapter_title: str, chapter_description: str, user_profile: UserProfile) -> Dict[
-        str, Any]:
+        # 请求更新大纲，失败则返回原大纲
+        updated = self._revise(self.messages, "update_outline", "课程大纲", "当前大纲", outline, review,
+                               OUTLINE_VALIDATOR, stream=stream, on_object=on_object)
+        return updated if updated is not None else outline
+
+    def generate_chapter_content(self, chapter_title: str, chapter_description: str, user_profile: UserProfile,
+                                 messages: Optional[List[Dict[str, Any]]] = None, stream: bool = False,
+                                 on_object: Optional[Callable[[str, Dict[str, Any]], None]] = None) -> Dict[str, Any]:
         """生成特定章节的内容
 
         Args:
             chapter_title: 章节标题
             chapter_description: 章节描述
             user_profile: 用户配置文件
+            messages: 对话历史（可选，默认使用共享的self.messages；通常传入fork_conversation()返回的章节分支）
+            stream: 是否以流式方式接收回复
+            on_object: 流式接收时每个sequential/vertical完整到达后的回调（可选）
 
         Returns:
             章节内容字典
         """
-        # 请求生成章节内容
-        self.messages.append({
-            "role": "user",
-            "content": f"请为以下章节生成详细内容：\n\n标题：{chapter_title}\n描述：{chapter_description}\n\n"
-                       f"内容应适合{user_profile.skill_level}水平的学习者。请以JSON格式输出，包含chapter_title和sequentials数组，"
-                       f"每个sequential包含title和verticals数组，每个vertical包含html和problem字段。"
-        })
+        messages = self.build_chapter_messages(chapter_title, chapter_description, user_profile, messages)
         
         # 调用DeepSeek API
-        response = self._call_llm_api(self.messages)
+        response = self._call_llm_api(messages, stage="generate_chapter_content", stream=stream, on_object=on_object,
+                                      structured=True)
         
+        return self.accept_chapter_reply(response.choices[0].message.content, chapter_title, chapter_description,
+                                         user_profile, messages)
+
+    def build_chapter_messages(self, chapter_title: str, chapter_description: str, user_profile: UserProfile,
+                               messages: Optional[List[Dict[str, Any]]] = None) -> List[Dict[str, Any]]:
+        """把生成章节内容的请求追加到对话历史
+
+        Args:
+            chapter_title: 章节标题
+            chapter_description: 章节描述
+            user_profile: 用户配置文件
+            messages: 对话历史（可选，默认使用共享的self.messages）
+
+        Returns:
+            追加请求后的对话历史
+        """
+        if messages is None:
+            messages = self.messages
+
+        # 请求生成章节内容（固定指令在前，章节信息在后）
+        messages.append(self.prompts.request(
+            COURSE_LAYOUT, "generate_chapter_content",
+            "请为以下章节生成详细内容，内容应适合该技能水平的学习者。请以JSON格式输出，包含chapter_title和sequentials数组，"
+            "每个sequential包含title和verticals数组，每个vertical包含html和problem字段。",
+            ("技能水平", user_profile.skill_level),
+            ("标题", chapter_title),
+            ("描述", chapter_description)
+        ))
+        return messages
+
+    def accept_chapter_reply(self, content: str, chapter_title: str, chapter_description: str,
+                             user_profile: UserProfile, messages: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """保存章节回复到对话历史，并解析校验为章节内容
+
+        Args:
+            content: 模型回复文本
+            chapter_title: 章节标题
+            chapter_description: 章节描述
+            user_profile: 用户配置文件
+            messages: 该章节的对话历史
+
+        Returns:
+            章节内容字典
+        """
         # 保存回复到对话历史
-        self.messages.append(response.choices[0].message)
+        messages.append({"role": "assistant", "content": content})
         
-        # 尝试解析JSON响应
-        try:
-            # 从回复文本中提取JSON部分
-            content = response.choices[0].message.content
-            # 查找可能的JSON开始和结束位置
-            start = content.find('{')
-            end = content.rfind('}') + 1
-            if start >= 0 and end > start:
-                json_str = content[start:end]
-                return json.loads(json_str)
-            else:
-                # 解析失败则返回默认章节内容
-                return self._create_default_chapter_content(chapter_title, chapter_description, user_profile)
-        except json.JSONDecodeError:
-            # 解析失败则返回默认章节内容
+        # 解析并校验JSON响应，修复失败则返回默认章节内容
+        chapter_content = self._parse_structured(content, CHAPTER_VALIDATOR, "generate_chapter_content")
+        if chapter_content is None:
             return self._create_default_chapter_content(chapter_title, chapter_description, user_profile)
+        return chapter_content
+
+    def request_body(self, messages: List[Dict[str, Any]], structured: bool = False,
+                     stage: Optional[str] = None) -> Dict[str, Any]:
+        """构造与_call_llm_api实际发送内容一致的请求体（用于批处理任务文件）
+
+        Args:
+            messages: 消息历史列表
+            structured: 是否为要求JSON输出的结构化请求
+            stage: 流水线阶段名称（可选，决定使用的模型）
+
+        Returns:
+            包含model、messages和其他请求参数的请求体
+        """
+        body = {"model": self.model_for(stage), "messages": self.context.fit(messages)}
+        if structured and self.json_mode:
+            body["response_format"] = self.JSON_RESPONSE_FORMAT
+        return body
 
     def _create_default_chapter_content(self, chapter_title, chapter_description, user_profile):
         """创建默认章节内容（当API响应解析失败时使用）"""
@@ -254,56 +684,47 @@ class AIGenerator:
             ]
         }
     
-    def review_chapter_content(self, chapter_content: Dict[str, Any]) -> str:
+    def review_chapter_content(self, chapter_content: Dict[str, Any],
+                               messages: Optional[List[Dict[str, Any]]] = None) -> str:
         """评审章节内容，提供反馈
 
         Args:
             chapter_content: 章节内容字典
+            messages: 对话历史（可选，默认使用共享的self.messages）
 
         Returns:
             评审反馈
         """
-        self.messages.append({
-            "role": "user",
-            "content": f"请评审以下章节内容，并提供改进建议：\n\n{chapter_content}"
-        })
+        if messages is None:
+            messages = self.messages
+
+        messages.append(self.prompts.request(COURSE_LAYOUT, "review_chapter_content", "请评审以下章节内容，并提供改进建议。",
+                                             ("章节内容", chapter_content)))
         
-        response = self._call_llm_api(self.messages)
+        response = self._call_llm_api(messages, stage="review_chapter_content")
         
-        self.messages.append(response.choices[0].message)
+        messages.append({"role": "assistant", "content": response.choices[0].message.content})
         return response.choices[0].message.content
 
-    def update_chapter_content(self, chapter_content: Dict[str, Any], review: str) -> Dict[str, Any]:
+    def update_chapter_content(self, chapter_content: Dict[str, Any], review: str,
+                               messages: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
         """根据评审更新章节内容
 
         Args:
             chapter_content: 当前章节内容字典
             review: 评审反馈
+            messages: 对话历史（可选，默认使用共享的self.messages）
 
         Returns:
             更新后的章节内容字典
         """
-        self.messages.append({
-            "role": "user",
-            "content": f"根据以下评审反馈，更新章节内容。请保持JSON格式输出。\n\n评审反馈：{review}\n\n当前内容：{chapter_content}"
-        })
-        
-        response = self._call_llm_api(self.messages)
-        
-        self.messages.append(response.choices[0].message)
-        
-        # JSON解析逻辑
-        try:
-            content = response.choices[0].message.content
-            start = content.find('{')
-            end = content.rfind('}') + 1
-            if start >= 0 and end > start:
-                json_str = content[start:end]
-                return json.loads(json_str)
-            else:
-                return chapter_content
-        except json.JSONDecodeError:
-            return chapter_content
+        if messages is None:
+            messages = self.messages
+
+        # 修订失败则保留当前内容
+        updated = self._revise(messages, "update_chapter_content", "章节内容", "当前内容", chapter_content, review,
+                               CHAPTER_VALIDATOR)
+        return updated if updated is not None else chapter_content
 
     def review_full_course(self, course_dict: Dict[str, Any]) -> str:
         """评审整个课程，检查一致性和完整性
@@ -314,14 +735,12 @@ class AIGenerator:
         Returns:
             评审反馈
         """
-        self.messages.append({
-            "role": "user",
-            "content": f"请评审以下完整课程，检查一致性和完整性：\n\n{course_dict}"
-        })
+        self.messages.append(self.prompts.request(COURSE_LAYOUT, "review_full_course", "请评审以下完整课程，检查一致性和完整性。",
+                                                  ("完整课程", course_dict)))
         
-        response = self._call_llm_api(self.messages)
+        response = self._call_llm_api(self.messages, stage="review_full_course")
 
-        self.messages.append(response.choices[0].message)
+        self.messages.append({"role": "assistant", "content": response.choices[0].message.content})
         return response.choices[0].message.content
 
     def update_full_course(self, course_dict: Dict[str, Any], review: str) -> Dict[str, Any]:
@@ -334,28 +753,10 @@ class AIGenerator:
         Returns:
             更新后的课程字典
         """
-        # 类似update_chapter_content的实现
-        self.messages.append({
-            "role": "user",
-            "content": f"根据以下评审反馈，更新完整课程。请保持JSON格式输出。\n\n评审反馈：{review}\n\n当前课程：{course_dict}"
-        })
-        
-        response = self._call_llm_api(self.messages)
-        
-        self.messages.append(response.choices[0].message)
-        
-        # JSON解析逻辑
-        try:
-            content = response.choices[0].message.content
-            start = content.find('{')
-            end = content.rfind('}') + 1
-            if start >= 0 and end > start:
-                json_str = content[start:end]
-                return json.loads(json_str)
-            else:
-                return course_dict
-        except json.JSONDecodeError:
-            return course_dict
+        # 类似update_chapter_content的实现，修订失败则保留当前课程
+        updated = self._revise(self.messages, "update_full_course", "完整课程", "当前课程", course_dict, review,
+                               COURSE_VALIDATOR)
+        return updated if updated is not None else course_dict
 
     def generate_assessment_questions(self, skill_name: str) -> List[str]:
         """
@@ -363,26 +764,66 @@ class AIGenerator:
         
         Args:
             skill_name: 要评估的技能名称
-            model: 使用的LLM模型名称
             
         Returns:
             包含5个评估问题的列表
         """
-        prompt = f"""
-        你是一位教育评估专家。请为评估用户在"{skill_name}"领域的水平生成5个有效问题。
-        这些问题应该能帮助判断用户是初级、中级还是高级水平，以及确定适合的学习目标。
-        问题应该是开放式的，能够通过用户的回答了解他们的经验、知识深度和学习意图。
-        只返回问题列表，每个问题一行，不要添加其他内容。
-        """
-        self.messages.append({
-            "role": "user",
-            "content": prompt
-        })
+        # 题库命中时无需等待模型生成
+        if self.question_bank is not None:
+            return self.question_bank.get_or_generate(skill_name, self.request_assessment_questions)
+
+        ASSESSMENT_LAYOUT.ensure_system(self.messages)
+        self.messages.append(self._assessment_questions_prompt(skill_name))
         
-        response = self._call_llm_api(self.messages)
-        self.messages.append(response.choices[0].message.content)
+        response = self._call_llm_api(self.messages, stage="generate_assessment_questions")
+        self.messages.append({"role": "assistant", "content": response.choices[0].message.content})
+
+        return self._parse_questions(response.choices[0].message.content, skill_name)
+
+    def request_assessment_questions(self, skill_name: str) -> List[str]:
+        """在独立的对话中生成评估问题，不修改self.messages（供题库生成、刷新和预热使用）
+
+        Args:
+            skill_name: 要评估的技能名称
 
-        questions = [q.strip() for q in response.choices[0].message.content.strip().split('\n') if q.strip()]
+        Returns:
+            包含5个评估问题的列表
+        """
+        messages = [ASSESSMENT_LAYOUT.system_message(), self._assessment_questions_prompt(skill_name)]
+        # 题库需要新生成的题目，不读取响应缓存
+        response = self._call_llm_api(messages, stage="generate_assessment_questions", use_cache=False)
+        return self._parse_questions(response.choices[0].message.content, skill_name)
+
+    @staticmethod
+    def _assessment_questions_prompt(skill_name: str) -> Dict[str, str]:
+        """创建生成评估问题的请求
+
+        Args:
+            skill_name: 要评估的技能名称
+
+        Returns:
+            用户消息
+        """
+        return ASSESSMENT_LAYOUT.request(
+            "请为评估用户在以下技能领域的水平生成5个有效问题。"
+            "这些问题应该能帮助判断用户是初级、中级还是高级水平，以及确定适合的学习目标。"
+            "问题应该是开放式的，能够通过用户的回答了解他们的经验、知识深度和学习意图。"
+            "只返回问题列表，每个问题一行，不要添加其他内容。",
+            ("技能", skill_name)
+        )
+
+    @staticmethod
+    def _parse_questions(content: str, skill_name: str) -> List[str]:
+        """从回复中解析问题列表
+
+        Args:
+            content: 回复文本
+            skill_name: 技能名称
+
+        Returns:
+            包含5个问题的列表
+        """
+        questions = [q.strip() for q in content.strip().split('\n') if q.strip()]
         
         # 确保至少有5个问题
         while len(questions) < 5:
@@ -404,25 +845,18 @@ class AIGenerator:
         """
         # 构造完整对话内容供LLM分析
         conversation = "\n".join([f"问题: {r['question']}\n回答: {r['answer']}" for r in user_responses])
-        prompt = f"""
-        你是一位教育评估专家。基于以下用户在"{skill_name}"领域的问答内容，请评估用户的水平和学习需求。
-
-        {conversation}
-
-        请提供以下格式的评估结果:
-        - 评估的水平: [初级/中级/高级]
-        - 水平说明: [简要解释为什么用户属于这个水平]
-        - 学习目标: [列出5个针对该用户水平和兴趣的具体学习目标]
-        - 建议学习路径: [简要描述适合该用户的学习路径]
-
-        请以JSON格式返回结果，键名为level(beginner/intermediate/advanced), explanation, objectives(数组), learning_path。
-        """
-        self.messages.append({
-            "role": "user",
-            "content": prompt
-        })
-        response = self._call_llm_api(self.messages)
-        self.messages.append(response.choices[0].message)
+        ASSESSMENT_LAYOUT.ensure_system(self.messages)
+        self.messages.append(self.prompts.request(
+            ASSESSMENT_LAYOUT, "analyze_user_responses",
+            "请基于以下问答内容，评估用户的水平和学习需求，给出评估的水平（初级/中级/高级）、"
+            "水平说明（简要解释为什么用户属于这个水平）、5个针对该用户水平和兴趣的具体学习目标，"
+            "以及适合该用户的建议学习路径。\n"
+            "请以JSON格式返回结果，键名为level(beginner/intermediate/advanced), explanation, objectives(数组), learning_path。",
+            ("技能", skill_name),
+            ("问答内容", "\n" + conversation)
+        ))
+        response = self._call_llm_api(self.messages, stage="analyze_user_responses", structured=True)
+        self.messages.append({"role": "assistant", "content": response.choices[0].message.content})
         
         # 尝试解析JSON响应
         try:
@@ -436,7 +870,73 @@ class AIGenerator:
             # 如果响应不是有效JSON，尝试手动解析
             result = self.parse_assessment_response(response, skill_name)
         
-        # 确保结果包含所有必要字段并规范化
+        return self._normalize_assessment(result, skill_name)
+
+    def estimate_assessment(self, skill_name: str, new_responses: List[Dict[str, str]],
+                            previous: Optional[Dict[str, Any]] = None, answered: Optional[int] = None,
+                            candidates: Optional[List[str]] = None) -> Dict[str, Any]:
+        """根据新的问答增量更新评估结果，不修改self.messages（可在后台线程中调用）
+
+        请求中只包含上一次的评估结果和新增的问答，输入长度不随已回答问题数增长。
+
+        Args:
+            skill_name: 技能名称
+            new_responses: 上次评估之后新增的问答，每项包含'question'和'answer'键
+            previous: 上一次的评估结果（可选，None表示首次评估）
+            answered: 已回答的问题总数（可选，默认等于新增问答数）
+            candidates: 候选问题（可选，提供时同时让模型选出或编写最能区分水平的下一个问题）
+
+        Returns:
+            评估结果字典，除level、explanation、objectives和learning_path外还包含confidence（0~1），
+            提供candidates时还包含next_question
+        """
+        conversation = "\n".join([f"问题: {r['question']}\n回答: {r['answer']}" for r in new_responses])
+        fields = [("技能", skill_name), ("已回答问题数", answered or len(new_responses))]
+        if previous is not None:
+            fields.append(("当前评估", previous))
+        instruction = (
+            "用户仍在回答评估问题。请结合当前评估（如有）和新的问答，更新对用户水平和学习需求的判断，"
+            "并给出对水平判断的置信度（0到1之间的小数，信息越充分、回答越一致越高）。\n"
+            "请以JSON格式返回结果，键名为level(beginner/intermediate/advanced), confidence, explanation, "
+            "objectives(5个学习目标的数组), learning_path。"
+        )
+        if candidates is not None:
+            instruction += ("\n另外给出next_question：从候选问题中选出最能消除当前不确定性的一个，"
+                            "候选问题都不合适时编写一个新的开放式问题。")
+            fields.append(("候选问题", candidates))
+        fields.append(("新的问答", "\n" + conversation))
+        messages = [ASSESSMENT_LAYOUT.system_message(),
+                    self.prompts.request(ASSESSMENT_LAYOUT, "estimate_assessment", instruction, *fields)]
+        response = self._call_llm_api(messages, stage="estimate_assessment", structured=True)
+        try:
+            _, result = extract_json(response.choices[0].message.content)
+        except ValueError:
+            result = None
+        if not isinstance(result, dict):
+            result = {}
+        next_question = result.get("next_question")
+
+        try:
+            confidence = float(result.get("confidence", 0.0))
+        except (TypeError, ValueError):
+            confidence = 0.0
+        result = self._normalize_assessment(result, skill_name)
+        result["confidence"] = min(1.0, max(0.0, confidence))
+        if candidates is not None:
+            result["next_question"] = next_question.strip() if isinstance(next_question, str) else None
+        return result
+
+    @staticmethod
+    def _normalize_assessment(result: Dict[str, Any], skill_name: str) -> Dict[str, Any]:
+        """确保评估结果包含所有必要字段并规范化水平
+
+        Args:
+            result: 模型返回的评估结果（原地修改）
+            skill_name: 技能名称
+
+        Returns:
+            评估结果
+        """
         if 'level' not in result:
             result['level'] = 'beginner'
         elif result['level'] not in ['beginner', 'intermediate', 'advanced']:
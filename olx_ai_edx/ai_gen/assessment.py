@@ -0,0 +1,221 @@
+"""技能评估模块 - 在用户回答评估问题的同时在后台逐步分析，缩短最后一个回答之后的等待
+
+每记录一个回答就在后台提交一次增量评估（只发送上一次的评估结果和新增的问答），
+维护一个随回答更新的水平估计。回答完最后一个问题时，如果后台评估已覆盖全部回答且置信度足够，
+直接使用该结果而不再请求模型；否则只为未覆盖的回答补一次增量评估，或在置信度不足时做一次完整分析。
+
+自适应评估在此基础上根据已有回答选出或编写下一个问题，置信度达到阈值即结束，不再固定问满5个问题。
+"""
+
+import copy
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from .ai_gen_content import AIGenerator
+
+
+class ProgressiveAssessment:
+    """边回答边分析的技能评估"""
+
+    def __init__(self, aigenerator: AIGenerator, skill_name: str, confidence_threshold: float = 0.8):
+        """初始化评估
+
+        Args:
+            aigenerator: AI生成器
+            skill_name: 技能名称
+            confidence_threshold: 后台评估的置信度达到该值时，最终结果直接使用后台评估
+        """
+        self.aigenerator = aigenerator
+        self.skill_name = skill_name
+        self.confidence_threshold = confidence_threshold
+        self.responses: List[Dict[str, str]] = []
+        self.estimate: Optional[Dict[str, Any]] = None
+        # 当前估计覆盖的回答数
+        self.covered = 0
+        # 最终结果的来源：skipped（直接使用后台评估）、incremental（补一次增量评估）或full（完整分析）
+        self.final_call: Optional[str] = None
+        self._lock = threading.Lock()
+        # 单线程执行，保证每次增量评估都基于上一次的结果
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._pending: Optional[Future] = None
+
+    def add_response(self, question: str, answer: str) -> None:
+        """记录一个回答，并在后台更新评估
+
+        Args:
+            question: 问题
+            answer: 用户的回答
+        """
+        with self._lock:
+            self.responses.append({"question": question, "answer": answer})
+        self._pending = self._executor.submit(self._update)
+
+    def _update(self, candidates: Optional[List[str]] = None) -> None:
+        """用尚未覆盖的回答增量更新评估（在后台线程中执行，失败时保留上一次的估计）
+
+        Args:
+            candidates: 候选问题（可选，提供时评估结果中同时包含下一个问题）
+        """
+        with self._lock:
+            previous = self.estimate
+            start = self.covered
+            total = len(self.responses)
+            new_responses = self.responses[start:total]
+        if not new_responses:
+            return
+        try:
+            estimate = self.aigenerator.estimate_assessment(self.skill_name, new_responses, previous, total,
+                                                            candidates=candidates)
+        except Exception as e:
+            print(f"后台评估失败，将在回答结束后重新分析: {e}")
+            return
+        with self._lock:
+            self.estimate = estimate
+            self.covered = total
+
+    def current(self) -> Optional[Dict[str, Any]]:
+        """获取当前的水平估计（不等待后台评估）
+
+        Returns:
+            包含level、confidence和已覆盖回答数answered的字典，尚无估计时返回None
+        """
+        with self._lock:
+            if self.estimate is None:
+                return None
+            return {
+                "level": self.estimate["level"],
+                "confidence": self.estimate["confidence"],
+                "answered": self.covered
+            }
+
+    def finalize(self, timeout: Optional[float] = None) -> Dict[str, Any]:
+        """等待后台评估完成并得出最终评估结果
+
+        Args:
+            timeout: 等待后台评估的最长秒数（None表示一直等待）
+
+        Returns:
+            评估结果字典，包含level、explanation、objectives、learning_path和confidence
+        """
+        if self._pending is not None:
+            try:
+                self._pending.result(timeout=timeout)
+            except Exception:
+                pass
+        self._executor.shutdown(wait=False)
+
+        with self._lock:
+            estimate = copy.deepcopy(self.estimate)
+            covered = self.covered
+            responses = list(self.responses)
+
+        if estimate is not None and covered == len(responses) and estimate["confidence"] >= self.confidence_threshold:
+            self.final_call = "skipped"
+            result = estimate
+        elif estimate is not None and covered < len(responses):
+            # 后台评估未覆盖最后的回答，只补充这几个回答
+            self.final_call = "incremental"
+            result = self.aigenerator.estimate_assessment(self.skill_name, responses[covered:], estimate,
+                                                          len(responses))
+        else:
+            # 没有可用的后台评估或置信度不足，对全部问答做一次完整分析
+            self.final_call = "full"
+            result = self.aigenerator.analyze_user_responses(self.skill_name, responses)
+            result.setdefault("confidence", estimate["confidence"] if estimate is not None else 0.0)
+
+        print(f"技能评估完成（最终分析方式：{self.final_call}，置信度{result['confidence']:.2f}）")
+        return result
+
+
+class AdaptiveAssessment(ProgressiveAssessment):
+    """自适应技能评估：每个回答之后选出或编写下一个问题，水平判断足够确定时提前结束"""
+
+    def __init__(self, aigenerator: AIGenerator, skill_name: str, questions: List[str],
+                 confidence_threshold: float = 0.8, min_questions: int = 2, max_questions: int = 5):
+        """初始化评估
+
+        Args:
+            aigenerator: AI生成器
+            skill_name: 技能名称
+            questions: 候选问题（第一个问题直接使用，其余供模型挑选）
+            confidence_threshold: 置信度达到该值时结束评估
+            min_questions: 至少提问的问题数
+            max_questions: 最多提问的问题数
+        """
+        super().__init__(aigenerator, skill_name, confidence_threshold)
+        self.min_questions = min_questions
+        self.max_questions = max_questions
+        self.candidates = list(questions)
+        first = self.candidates.pop(0) if self.candidates else f"请描述您在{skill_name}方面的经验和学习目标？"
+        self.asked: List[str] = [first]
+
+    @property
+    def current_question(self) -> str:
+        """等待回答的问题"""
+        return self.asked[-1]
+
+    @property
+    def question_count(self) -> int:
+        """已回答的问题数"""
+        return len(self.responses)
+
+    @property
+    def confidence(self) -> float:
+        """当前水平估计的置信度"""
+        return self.estimate["confidence"] if self.estimate is not None else 0.0
+
+    @property
+    def confident(self) -> bool:
+        """当前估计是否覆盖全部回答且达到置信度阈值"""
+        return (self.estimate is not None and self.covered == len(self.responses)
+                and self.confidence >= self.confidence_threshold)
+
+    @property
+    def done(self) -> bool:
+        """评估是否可以结束"""
+        if self.question_count >= self.max_questions:
+            return True
+        return self.question_count >= self.min_questions and self.confident
+
+    def answer(self, answer: str) -> Optional[str]:
+        """记录当前问题的回答，更新评估并确定下一个问题
+
+        每个回答只请求一次模型，同时得到新的水平估计和下一个问题。
+
+        Args:
+            answer: 用户的回答
+
+        Returns:
+            下一个问题，评估可以结束时返回None
+        """
+        with self._lock:
+            self.responses.append({"question": self.current_question, "answer": answer})
+        done = self.question_count >= self.max_questions
+        # 达到最多问题数时无需再选下一个问题
+        self._update(None if done else self.candidates)
+        if self.done:
+            return None
+
+        next_question = self.estimate.get("next_question") if self.estimate is not None else None
+        if not next_question or next_question in self.asked:
+            next_question = self.candidates[0] if self.candidates else \
+                f"请描述您在{self.skill_name}方面的一个学习目标或挑战？"
+        if next_question in self.candidates:
+            self.candidates.remove(next_question)
+        self.asked.append(next_question)
+        return next_question
+
+    def finalize(self, timeout: Optional[float] = None) -> Dict[str, Any]:
+        """得出最终评估结果
+
+        Args:
+            timeout: 未使用，评估在answer中同步完成
+
+        Returns:
+            评估结果字典，包含level、explanation、objectives、learning_path、confidence和question_count
+        """
+        result = super().finalize(timeout)
+        result.pop("next_question", None)
+        result["question_count"] = self.question_count
+        return result
@@ -0,0 +1,449 @@
+"""LLM后端模块 - 真实API、录制/回放和离线桩后端
+
+AIGenerator通过后端发送请求。录制后端把真实的请求与回复写入磁带文件（JSONL），
+回放后端按请求哈希从磁带中读取回复，并可注入延迟、抖动和错误，
+从而在无网络环境下对课程生成、OLX转换和导出流程进行确定性的性能测试。
+"""
+
+import ast
+import json
+import os
+import random
+import re
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional
+
+from openai import OpenAI
+
+from .client_pool import get_client
+from .conversation import message_content
+from .llm_cache import make_request_key
+from .llm_response import ChatResponse, stream_chunks, usage_to_dict
+from .providers import PROVIDERS, provider_api_key, provider_for_model
+
+
+class SimulatedLLMError(Exception):
+    """回放后端注入的模拟错误"""
+
+    def __init__(self, message: str, status_code: int = 503):
+        """初始化模拟错误
+
+        Args:
+            message: 错误信息
+            status_code: 模拟的HTTP状态码
+        """
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class LLMBackend:
+    """LLM后端基类"""
+
+    def complete(self, model: str, messages: List[Dict[str, Any]], **params: Any) -> Any:
+        """发送聊天补全请求
+
+        Args:
+            model: 模型名称
+            messages: 消息列表
+            **params: 其他请求参数
+
+        Returns:
+            响应对象，可通过response.choices[0].message.content读取回复
+
+        Raises:
+            NotImplementedError: 子类必须实现此方法
+        """
+        raise NotImplementedError("子类必须实现complete方法")
+
+    def stream(self, model: str, messages: List[Dict[str, Any]], **params: Any) -> Iterator[Any]:
+        """以流式方式发送聊天补全请求
+
+        默认实现先完整请求再拆分为数据块。
+
+        Args:
+            model: 模型名称
+            messages: 消息列表
+            **params: 其他请求参数
+
+        Returns:
+            数据块迭代器，可通过chunk.choices[0].delta.content读取增量文本
+        """
+        response = self.complete(model, messages, **params)
+        return stream_chunks(response.choices[0].message.content, usage_to_dict(getattr(response, "usage", None)))
+
+
+class OpenAIBackend(LLMBackend):
+    """通过OpenAI兼容接口访问DeepSeek/GLM的后端"""
+
+    def __init__(self, client: OpenAI):
+        """初始化后端
+
+        Args:
+            client: OpenAI客户端
+        """
+        self.client = client
+
+    @classmethod
+    def for_model(cls, model: str, api_key: Optional[str] = None, base_url: Optional[str] = None) -> 'OpenAIBackend':
+        """根据模型所属服务商创建后端，复用进程内共享的客户端连接池
+
+        Args:
+            model: 模型名称
+            api_key: API密钥（可选，默认从服务商对应的环境变量读取）
+            base_url: API地址（可选，默认使用服务商的地址）
+
+        Returns:
+            后端实例
+        """
+        provider = provider_for_model(model)
+        if api_key is None:
+            api_key = provider_api_key(provider)
+        return cls(get_client(base_url or PROVIDERS[provider]["base_url"], api_key))
+
+    def complete(self, model: str, messages: List[Dict[str, Any]], **params: Any) -> Any:
+        return self.client.chat.completions.create(model=model, messages=messages, **params)
+
+    def stream(self, model: str, messages: List[Dict[str, Any]], **params: Any) -> Iterator[Any]:
+        # 要求服务端在末尾数据块中返回token用量，否则流式调用的指标和限流修正都缺少用量
+        params.setdefault("stream_options", {"include_usage": True})
+        return self.client.chat.completions.create(model=model, messages=messages, stream=True, **params)
+
+
+class StubBackend(LLMBackend):
+    """离线桩后端，根据请求类型返回固定的示例内容（与ai-olx.py中的演示生成器一致）"""
+
+    def complete(self, model: str, messages: List[Dict[str, Any]], **params: Any) -> ChatResponse:
+        prompt = message_content(messages[-1]) if messages else ""
+        return ChatResponse(self._reply(prompt), model)
+
+    def _reply(self, prompt: str) -> str:
+        """根据提示内容生成示例回复
+
+        Args:
+            prompt: 最后一条用户消息
+
+        Returns:
+            回复文本
+        """
+        if "未通过校验" in prompt:
+            # 桩后端无法真正修复，原样返回可解析的片段
+            fragment = self._literal_after(prompt, "待修复片段：")
+            return json.dumps(fragment, ensure_ascii=False) if fragment is not None else "{}"
+        if "JSON Patch" in prompt:
+            return json.dumps({"patch": self._patch_for(prompt)}, ensure_ascii=False)
+        if "生成" in prompt and "个有效问题" in prompt:
+            return "\n".join([
+                "您之前是否接触过相关内容？请简要描述。",
+                "您在这一领域完成过哪些练习或项目？",
+                "您最熟悉的核心概念是什么？",
+                "遇到问题时您通常如何解决？",
+                "您希望通过学习达到什么目标？"
+            ])
+        if "用户仍在回答评估问题" in prompt:
+            # 回答的问题越多置信度越高
+            match = re.search(r"已回答问题数：(\d+)", prompt)
+            answered = int(match.group(1)) if match else 1
+            match = re.search(r"候选问题：(.*)", prompt)
+            candidates = json.loads(match.group(1)) if match else []
+            return json.dumps({
+                "level": "beginner",
+                "confidence": round(min(0.95, 0.4 + 0.15 * answered), 2),
+                "next_question": candidates[0] if candidates else "您希望通过学习达到什么目标？",
+                "explanation": "用户具备少量基础知识。",
+                "objectives": ["掌握基础概念", "完成入门练习", "理解核心原理", "解决简单问题", "建立学习习惯"],
+                "learning_path": "从基础概念开始，通过实践项目逐步提高。"
+            }, ensure_ascii=False)
+        if "评估用户的水平" in prompt:
+            return json.dumps({
+                "level": "beginner",
+                "explanation": "用户具备少量基础知识。",
+                "objectives": ["掌握基础概念", "完成入门练习", "理解核心原理", "解决简单问题", "建立学习习惯"],
+                "learning_path": "从基础概念开始，通过实践项目逐步提高。"
+            }, ensure_ascii=False)
+        if "更新课程大纲" in prompt:
+            outline = self._literal_after(prompt, "当前大纲：")
+            if outline is not None:
+                for chapter in outline.get("chapters", []):
+                    chapter["description"] = chapter.get("description", "") + "，包含实践练习"
+                return json.dumps(outline, ensure_ascii=False)
+        if "更新章节内容" in prompt:
+            chapter = self._literal_after(prompt, "当前内容：")
+            if chapter is not None:
+                for sequential in chapter.get("sequentials", []):
+                    for vertical in sequential.get("verticals", []):
+                        if "html" in vertical:
+                            vertical["html"] += "<pre><code>print('Hello, World!')</code></pre>"
+                return json.dumps(chapter, ensure_ascii=False)
+        if "更新完整课程" in prompt:
+            course = self._literal_after(prompt, "当前课程：")
+            if course is not None:
+                return json.dumps(course, ensure_ascii=False)
+        if "评审" in prompt:
+            return "内容总体不错，但可以考虑增加更多实践内容和代码示例。"
+        if "课程大纲" in prompt:
+            match = re.search(r"课程主题：(.*)", prompt)
+            skill_name = match.group(1).strip() if match else "课程"
+            return json.dumps({
+                "course_title": f"{skill_name}课程",
+                "chapters": [
+                    {"title": f"Chapter 1: {skill_name}简介", "description": f"了解{skill_name}的历史和用途"},
+                    {"title": "Chapter 2: 基本语法", "description": "学习基础语法和结构"},
+                    {"title": "Chapter 3: 数据类型", "description": "熟悉常用数据类型"},
+                    {"title": "Chapter 4: 控制结构", "description": "学习条件和循环"},
+                    {"title": "Chapter 5: 函数", "description": "掌握函数定义和使用"}
+                ]
+            }, ensure_ascii=False)
+        if "章节生成详细内容" in prompt:
+            match = re.search(r"标题：(.*)", prompt)
+            title = match.group(1).strip() if match else "章节"
+            return json.dumps({
+                "chapter_title": title,
+                "sequentials": [
+                    {
+                        "title": f"Unit 1: {title}理论基础",
+                        "verticals": [{
+                            "html": f"<p>这是{title}的基础理论内容。</p>",
+                            "problem": f"<problem><p>关于{title}的测验问题</p><choiceresponse>"
+                                       f"<choice correct='true'>正确选项</choice>"
+                                       f"<choice correct='false'>错误选项</choice></choiceresponse></problem>"
+                        }]
+                    },
+                    {
+                        "title": f"Unit 2: {title}实践应用",
+                        "verticals": [{
+                            "html": f"<p>这是{title}的实践应用内容。</p><p>包含代码示例和实践任务。</p>",
+                            "problem": f"<problem><p>完成以下代码来实现{title}的功能：</p>"
+                                       f"<coderesponse><textbox mode='python'/></coderesponse></problem>"
+                        }]
+                    }
+                ]
+            }, ensure_ascii=False)
+        return "好的。"
+
+    def _patch_for(self, prompt: str) -> List[Dict[str, Any]]:
+        """生成与完整输出模式效果相同的示例编辑操作
+
+        Args:
+            prompt: 要求返回JSON Patch的提示
+
+        Returns:
+            JSON Patch操作列表
+        """
+        patch = []
+        outline = self._literal_after(prompt, "当前大纲：")
+        if outline is not None:
+            for i, chapter in enumerate(outline.get("chapters", [])):
+                patch.append({"op": "replace", "path": f"/chapters/{i}/description",
+                              "value": chapter.get("description", "") + "，包含实践练习"})
+        chapter = self._literal_after(prompt, "当前内容：")
+        if chapter is not None:
+            for i, sequential in enumerate(chapter.get("sequentials", [])):
+                for j, vertical in enumerate(sequential.get("verticals", [])):
+                    if "html" in vertical:
+                        patch.append({"op": "replace", "path": f"/sequentials/{i}/verticals/{j}/html",
+                                      "value": vertical["html"] + "<pre><code>print('Hello, World!')</code></pre>"})
+        return patch
+
+    @staticmethod
+    def _literal_after(prompt: str, marker: str) -> Optional[Dict[str, Any]]:
+        """解析提示中标记之后的字典（JSON或Python字面量）
+
+        Args:
+            prompt: 提示文本
+            marker: 字典之前的标记
+
+        Returns:
+            解析出的字典，失败时返回None
+        """
+        index = prompt.find(marker)
+        if index < 0:
+            return None
+        text = prompt[index + len(marker):].strip()
+        for parse in (json.loads, ast.literal_eval):
+            try:
+                value = parse(text)
+                if isinstance(value, dict):
+                    return value
+            except (ValueError, SyntaxError):
+                continue
+        return None
+
+
+class RecordingBackend(LLMBackend):
+    """录制后端，将真实后端的每次请求与回复追加写入磁带文件"""
+
+    def __init__(self, inner: LLMBackend, cassette_path: str, provider: Optional[str] = None):
+        """初始化录制后端
+
+        Args:
+            inner: 实际发送请求的后端
+            cassette_path: 磁带文件路径（JSONL）
+            provider: inner所属的服务商（可选）。提供时，其他服务商的模型（如分级配置中的GLM模型）
+                改为通过该服务商的接口后端请求，并录制到同一磁带；未提供时所有请求都交给inner
+        """
+        self.inner = inner
+        self.cassette_path = cassette_path
+        self._inners: Dict[str, LLMBackend] = {provider: inner} if provider else {}
+        self._lock = threading.Lock()
+        directory = os.path.dirname(cassette_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _inner_for(self, model: str) -> LLMBackend:
+        """获取请求该模型使用的内部后端
+
+        Args:
+            model: 模型名称
+
+        Returns:
+            内部后端
+        """
+        if not self._inners:
+            return self.inner
+        provider = provider_for_model(model)
+        with self._lock:
+            if provider not in self._inners:
+                self._inners[provider] = OpenAIBackend.for_model(model)
+            return self._inners[provider]
+
+    def complete(self, model: str, messages: List[Dict[str, Any]], **params: Any) -> Any:
+        start = time.perf_counter()
+        response = self._inner_for(model).complete(model, messages, **params)
+        self._record(model, messages, params, response.choices[0].message.content,
+                     usage_to_dict(getattr(response, "usage", None)), time.perf_counter() - start)
+        return response
+
+    def stream(self, model: str, messages: List[Dict[str, Any]], **params: Any) -> Iterator[Any]:
+        start = time.perf_counter()
+        parts = []
+        usage = None
+        for chunk in self._inner_for(model).stream(model, messages, **params):
+            if getattr(chunk, "usage", None) is not None:
+                usage = usage_to_dict(chunk.usage)
+            if chunk.choices and chunk.choices[0].delta.content:
+                parts.append(chunk.choices[0].delta.content)
+            yield chunk
+        self._record(model, messages, params, "".join(parts), usage, time.perf_counter() - start)
+
+    def _record(self, model: str, messages: List[Dict[str, Any]], params: Dict[str, Any], content: str,
+                usage: Optional[Dict[str, int]], latency: float) -> None:
+        """追加一条录制记录
+
+        Args:
+            model: 模型名称
+            messages: 消息列表
+            params: 其他请求参数
+            content: 回复文本
+            usage: token用量字典
+            latency: 请求耗时（秒）
+        """
+        record = {
+            "key": make_request_key(model, messages, **params),
+            "model": model,
+            "messages": [{"role": m.get("role"), "content": message_content(m)} for m in messages],
+            "content": content,
+            "usage": usage or {},
+            "latency": round(latency, 4)
+        }
+        with self._lock:
+            with open(self.cassette_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+class ReplayBackend(LLMBackend):
+    """回放后端，按请求哈希从磁带文件返回录制的回复，并可注入延迟、抖动和错误"""
+
+    def __init__(self, cassette_path: Optional[str] = None, latency: Optional[float] = 0.0, jitter: float = 0.0,
+                 error_rate: float = 0.0, seed: Optional[int] = None, fallback: Optional[LLMBackend] = None):
+        """初始化回放后端
+
+        Args:
+            cassette_path: 磁带文件路径（可选，为None时全部请求交给fallback）
+            latency: 每次请求注入的固定延迟（秒），None表示使用录制时的实际耗时
+            jitter: 在固定延迟基础上叠加的随机延迟上限（秒）
+            error_rate: 注入模拟错误的概率（0~1）
+            seed: 随机数种子，设置后延迟和错误序列可复现
+            fallback: 磁带中没有对应记录时使用的后端（可选，如StubBackend）
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.fallback = fallback
+        self.records: Dict[str, Dict[str, Any]] = {}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        if cassette_path and os.path.exists(cassette_path):
+            with open(cassette_path, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        record = json.loads(line)
+                        self.records[record["key"]] = record
+
+    def complete(self, model: str, messages: List[Dict[str, Any]], **params: Any) -> Any:
+        record = self.records.get(make_request_key(model, messages, **params))
+        self._inject(record)
+        if record is None:
+            if self.fallback is None:
+                raise LookupError("磁带中没有与该请求匹配的记录")
+            return self.fallback.complete(model, messages, **params)
+        return ChatResponse(record["content"], record["model"], record.get("usage"))
+
+    def _inject(self, record: Optional[Dict[str, Any]]) -> None:
+        """注入延迟和模拟错误
+
+        Args:
+            record: 匹配到的录制记录（可为None）
+
+        Raises:
+            SimulatedLLMError: 按error_rate随机注入的错误
+        """
+        with self._lock:
+            jitter = self._random.uniform(0, self.jitter) if self.jitter else 0.0
+            failed = self._random.random() < self.error_rate
+        base = self.latency
+        if base is None:
+            base = record.get("latency", 0.0) if record else 0.0
+        if base + jitter > 0:
+            time.sleep(base + jitter)
+        if failed:
+            raise SimulatedLLMError("回放后端注入的模拟错误")
+
+
+def create_backend_from_env(model: str, api_key: Optional[str] = None, base_url: Optional[str] = None) -> LLMBackend:
+    """根据环境变量创建后端
+
+    LLM_BACKEND可选api（默认）、stub、record、replay、hedged（在DeepSeek与GLM之间按延迟路由并对冲，进程内共享同一个路由器）；LLM_CASSETTE指定磁带文件；
+    回放时LLM_REPLAY_LATENCY、LLM_REPLAY_JITTER、LLM_REPLAY_ERROR_RATE和LLM_REPLAY_SEED
+    控制注入的延迟、抖动、错误率和随机种子，未命中磁带的请求由桩后端应答。
+
+    Args:
+        model: 模型名称
+        api_key: API密钥（可选）
+        base_url: API地址（可选）
+
+    Returns:
+        后端实例
+    """
+    kind = os.getenv("LLM_BACKEND", "api").lower()
+    cassette = os.getenv("LLM_CASSETTE", "output/cassette.jsonl")
+    if kind == "stub":
+        return StubBackend()
+    if kind == "hedged":
+        # 路由器依赖本模块的后端类，在此处导入以避免循环导入
+        from .router import get_hedged_router
+        return get_hedged_router(model, api_key, base_url)
+    if kind == "record":
+        return RecordingBackend(OpenAIBackend.for_model(model, api_key, base_url), cassette, provider_for_model(model))
+    if kind == "replay":
+        latency = os.getenv("LLM_REPLAY_LATENCY", "")
+        seed = os.getenv("LLM_REPLAY_SEED", "")
+        return ReplayBackend(
+            cassette,
+            latency=float(latency) if latency else None,
+            jitter=float(os.getenv("LLM_REPLAY_JITTER", "0")),
+            error_rate=float(os.getenv("LLM_REPLAY_ERROR_RATE", "0")),
+            seed=int(seed) if seed else None,
+            fallback=StubBackend()
+        )
+    return OpenAIBackend.for_model(model, api_key, base_url)
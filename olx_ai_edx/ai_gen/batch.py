@@ -0,0 +1,425 @@
+"""批处理模块 - 将多门课程的章节生成请求汇总为批处理任务，离线提交并重建课程
+
+适用于夜间批量构建课程目录等对延迟不敏感的场景：各门课程的大纲仍以交互方式生成，
+所有章节请求写入OpenAI格式的批处理JSONL文件，通过可替换的传输层提交并轮询，
+完成后按custom_id把结果放回各门课程。传输层可以是OpenAI兼容的Batch API，
+也可以是用任意LLM后端在本地执行的替代实现（用于离线测试）。
+"""
+
+import json
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from ..models import Course
+from .backends import LLMBackend
+from .course_manager import CourseGenerationManager
+from .llm_response import usage_to_dict
+from .metrics import CallRecord
+
+# 批处理请求的目标接口
+BATCH_ENDPOINT = "/v1/chat/completions"
+
+
+def batch_line(custom_id: str, body: Dict[str, Any]) -> Dict[str, Any]:
+    """构造批处理任务文件中的一行
+
+    Args:
+        custom_id: 请求标识，结果文件中原样返回
+        body: 请求体（model、messages及其他参数）
+
+    Returns:
+        批处理请求字典
+    """
+    return {"custom_id": custom_id, "method": "POST", "url": BATCH_ENDPOINT, "body": body}
+
+
+def read_jsonl(path: str) -> List[Dict[str, Any]]:
+    """读取JSONL文件
+
+    Args:
+        path: 文件路径
+
+    Returns:
+        每行解析后的字典列表
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def write_jsonl(path: str, rows: List[Dict[str, Any]]) -> None:
+    """写入JSONL文件
+
+    Args:
+        path: 文件路径
+        rows: 字典列表
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        for row in rows:
+            f.write(json.dumps(row, ensure_ascii=False) + "\n")
+
+
+class BatchTransport:
+    """批处理传输层基类：提交任务文件、查询状态并下载结果"""
+
+    def submit(self, input_path: str) -> str:
+        """提交批处理任务文件
+
+        Args:
+            input_path: 任务JSONL文件路径
+
+        Returns:
+            批处理任务ID
+
+        Raises:
+            NotImplementedError: 子类必须实现此方法
+        """
+        raise NotImplementedError("子类必须实现submit方法")
+
+    def status(self, batch_id: str) -> Dict[str, Any]:
+        """查询批处理任务状态
+
+        Args:
+            batch_id: 批处理任务ID
+
+        Returns:
+            包含status（validating/in_progress/completed/failed/expired/cancelled）和
+            request_counts的字典
+
+        Raises:
+            NotImplementedError: 子类必须实现此方法
+        """
+        raise NotImplementedError("子类必须实现status方法")
+
+    def download(self, batch_id: str, output_path: str) -> str:
+        """下载已完成任务的结果文件
+
+        Args:
+            batch_id: 批处理任务ID
+            output_path: 结果JSONL文件的保存路径
+
+        Returns:
+            结果文件路径
+
+        Raises:
+            NotImplementedError: 子类必须实现此方法
+        """
+        raise NotImplementedError("子类必须实现download方法")
+
+
+class OpenAIBatchTransport(BatchTransport):
+    """通过OpenAI兼容的Files/Batches接口提交批处理任务"""
+
+    def __init__(self, client: Any, completion_window: str = "24h"):
+        """初始化传输层
+
+        Args:
+            client: OpenAI客户端
+            completion_window: 任务完成时限
+        """
+        self.client = client
+        self.completion_window = completion_window
+
+    def submit(self, input_path: str) -> str:
+        with open(input_path, "rb") as f:
+            input_file = self.client.files.create(file=f, purpose="batch")
+        batch = self.client.batches.create(
+            input_file_id=input_file.id,
+            endpoint=BATCH_ENDPOINT,
+            completion_window=self.completion_window
+        )
+        return batch.id
+
+    def status(self, batch_id: str) -> Dict[str, Any]:
+        batch = self.client.batches.retrieve(batch_id)
+        counts = getattr(batch, "request_counts", None)
+        return {
+            "status": batch.status,
+            "request_counts": {
+                "total": getattr(counts, "total", 0),
+                "completed": getattr(counts, "completed", 0),
+                "failed": getattr(counts, "failed", 0)
+            },
+            "output_file_id": getattr(batch, "output_file_id", None),
+            "error_file_id": getattr(batch, "error_file_id", None)
+        }
+
+    def download(self, batch_id: str, output_path: str) -> str:
+        info = self.status(batch_id)
+        rows = []
+        # 失败的请求在单独的错误文件中，合并后统一按custom_id处理
+        for file_id in (info["output_file_id"], info["error_file_id"]):
+            if file_id:
+                text = self.client.files.content(file_id).text
+                rows.extend(json.loads(line) for line in text.splitlines() if line.strip())
+        write_jsonl(output_path, rows)
+        return output_path
+
+
+class LocalBatchTransport(BatchTransport):
+    """在本地后台线程中用LLM后端执行批处理任务，输出与Batch API相同格式的结果文件"""
+
+    def __init__(self, backend: LLMBackend, work_dir: str = ".cache/batch", max_workers: int = 8):
+        """初始化本地传输层
+
+        Args:
+            backend: 执行请求的LLM后端（如StubBackend或ReplayBackend）
+            work_dir: 保存结果文件的目录
+            max_workers: 并发执行的请求数
+        """
+        self.backend = backend
+        self.work_dir = work_dir
+        self.max_workers = max_workers
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, input_path: str) -> str:
+        batch_id = f"batch_local_{uuid.uuid4().hex[:12]}"
+        rows = read_jsonl(input_path)
+        with self._lock:
+            self._jobs[batch_id] = {
+                "status": "in_progress",
+                "request_counts": {"total": len(rows), "completed": 0, "failed": 0},
+                "output_path": os.path.join(self.work_dir, f"{batch_id}_output.jsonl")
+            }
+        threading.Thread(target=self._run, args=(batch_id, rows), daemon=True).start()
+        return batch_id
+
+    def _run(self, batch_id: str, rows: List[Dict[str, Any]]) -> None:
+        """执行任务中的所有请求并写入结果文件
+
+        单个请求的错误记录在结果行中；任务文件格式错误、写入失败等意外错误使任务以failed状态结束，
+        避免后台线程退出后状态一直停留在in_progress。
+
+        Args:
+            batch_id: 批处理任务ID
+            rows: 任务文件中的请求
+        """
+        job = self._jobs[batch_id]
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                results = list(executor.map(lambda row: self._execute(batch_id, row), rows))
+            write_jsonl(job["output_path"], results)
+        except Exception as e:
+            print(f"本地批处理任务{batch_id}失败：{e}")
+            with self._lock:
+                job["status"] = "failed"
+                job["error"] = f"{type(e).__name__}: {e}"
+            return
+        with self._lock:
+            job["status"] = "completed"
+
+    def _execute(self, batch_id: str, row: Dict[str, Any]) -> Dict[str, Any]:
+        """执行单个请求
+
+        Args:
+            batch_id: 批处理任务ID
+            row: 批处理请求
+
+        Returns:
+            Batch API格式的结果行
+        """
+        body = dict(row["body"])
+        model = body.pop("model")
+        messages = body.pop("messages")
+        counts = self._jobs[batch_id]["request_counts"]
+        try:
+            response = self.backend.complete(model, messages, **body)
+        except Exception as e:
+            with self._lock:
+                counts["failed"] += 1
+            return {"id": f"req_{uuid.uuid4().hex[:12]}", "custom_id": row["custom_id"], "response": None,
+                    "error": {"code": type(e).__name__, "message": str(e)}}
+        with self._lock:
+            counts["completed"] += 1
+        return {
+            "id": f"req_{uuid.uuid4().hex[:12]}",
+            "custom_id": row["custom_id"],
+            "response": {
+                "status_code": 200,
+                "body": {
+                    "object": "chat.completion",
+                    "model": getattr(response, "model", None) or model,
+                    "choices": [{
+                        "index": 0,
+                        "message": {"role": "assistant", "content": response.choices[0].message.content},
+                        "finish_reason": "stop"
+                    }],
+                    "usage": usage_to_dict(getattr(response, "usage", None))
+                }
+            },
+            "error": None
+        }
+
+    def status(self, batch_id: str) -> Dict[str, Any]:
+        with self._lock:
+            job = self._jobs[batch_id]
+            return {"status": job["status"], "request_counts": dict(job["request_counts"]), "error": job.get("error")}
+
+    def download(self, batch_id: str, output_path: str) -> str:
+        source = self._jobs[batch_id]["output_path"]
+        if os.path.abspath(source) != os.path.abspath(output_path):
+            write_jsonl(output_path, read_jsonl(source))
+        return output_path
+
+
+class BatchCourseBuilder:
+    """汇总多门课程的章节请求，以一个批处理任务生成所有章节内容，再重建各门课程"""
+
+    # 表示任务已结束的状态
+    FINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+    def __init__(self, managers: List[CourseGenerationManager], transport: BatchTransport,
+                 work_dir: str = ".cache/batch", poll_interval: float = 30.0, timeout: Optional[float] = None):
+        """初始化批处理构建器
+
+        Args:
+            managers: 各门课程的生成管理器
+            transport: 批处理传输层
+            work_dir: 保存任务文件和结果文件的目录
+            poll_interval: 轮询任务状态的间隔（秒）
+            timeout: 等待任务完成的最长时间（秒，None表示一直等待）
+        """
+        self.managers = managers
+        self.transport = transport
+        self.work_dir = work_dir
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        # custom_id -> (课程序号, 章节序号)
+        self._requests: Dict[str, Tuple[int, int]] = {}
+        self._outlines: List[Dict[str, Any]] = []
+        self._messages: Dict[str, List[Dict[str, Any]]] = {}
+        self._marks: List[int] = []
+
+    def prepare(self) -> str:
+        """生成每门课程的大纲，并把所有章节请求写入批处理任务文件
+
+        Returns:
+            任务JSONL文件路径
+        """
+        rows = []
+        for course_index, manager in enumerate(self.managers):
+            self._marks.append(manager.aigenerator.metrics.mark())
+            outline = manager.generate_outline()
+            self._outlines.append(outline)
+            for chapter_index, chapter in enumerate(outline["chapters"]):
+                custom_id = f"course-{course_index}-chapter-{chapter_index}"
+                messages = manager.aigenerator.build_chapter_messages(
+                    chapter["title"], chapter["description"], manager.user_profile,
+                    manager.aigenerator.fork_conversation()
+                )
+                self._requests[custom_id] = (course_index, chapter_index)
+                self._messages[custom_id] = messages
+                body = manager.aigenerator.request_body(messages, structured=True, stage="generate_chapter_content")
+                rows.append(batch_line(custom_id, body))
+
+        input_path = os.path.join(self.work_dir, f"batch_{int(time.time())}_input.jsonl")
+        write_jsonl(input_path, rows)
+        print(f"批处理任务文件已生成：{input_path}，共{len(rows)}个章节请求，来自{len(self.managers)}门课程")
+        return input_path
+
+    def wait(self, batch_id: str) -> Dict[str, Any]:
+        """轮询直到任务结束
+
+        Args:
+            batch_id: 批处理任务ID
+
+        Returns:
+            最终状态
+
+        Raises:
+            TimeoutError: 超过等待时限
+        """
+        start = time.monotonic()
+        while True:
+            info = self.transport.status(batch_id)
+            counts = info.get("request_counts", {})
+            print(f"批处理任务{batch_id}：{info['status']}，已完成{counts.get('completed', 0)}/{counts.get('total', 0)}，"
+                  f"失败{counts.get('failed', 0)}")
+            if info["status"] in self.FINAL_STATUSES:
+                return info
+            if self.timeout is not None and time.monotonic() - start > self.timeout:
+                raise TimeoutError(f"批处理任务{batch_id}在{self.timeout}秒内未完成")
+            time.sleep(self.poll_interval)
+
+    def rebuild(self, output_path: str) -> List[Course]:
+        """按custom_id把结果放回各门课程并创建课程对象
+
+        失败或缺失的请求改为交互方式重新生成该章节；各章节的评审迭代通过管理器的complete_chapters并发执行。
+
+        Args:
+            output_path: 结果JSONL文件路径
+
+        Returns:
+            课程对象列表，顺序与managers一致
+        """
+        results = {row["custom_id"]: row for row in read_jsonl(output_path)} if os.path.exists(output_path) else {}
+        drafts: List[Dict[int, Optional[Dict[str, Any]]]] = [{} for _ in self.managers]
+
+        for custom_id, (course_index, chapter_index) in self._requests.items():
+            manager = self.managers[course_index]
+            generator = manager.aigenerator
+            outline_chapter = self._outlines[course_index]["chapters"][chapter_index]
+            messages = self._messages[custom_id]
+            content = None
+            row = results.get(custom_id)
+            response = (row or {}).get("response") or {}
+            if response.get("status_code") == 200:
+                body = response["body"]
+                content = body["choices"][0]["message"]["content"]
+                usage = usage_to_dict(body.get("usage"))
+                generator.metrics.record(CallRecord(
+                    "batch_generate_chapter_content", body.get("model") or generator.model,
+                    prompt_tokens=usage["prompt_tokens"], completion_tokens=usage["completion_tokens"],
+                    cached_tokens=usage["cached_tokens"]
+                ))
+
+            if content is None:
+                print(f"批处理请求{custom_id}失败，改为交互方式生成")
+                # 移除已追加的请求，由generate_chapter_content重新追加
+                messages.pop()
+                drafts[course_index][chapter_index] = None
+            else:
+                drafts[course_index][chapter_index] = generator.accept_chapter_reply(
+                    content, outline_chapter["title"], outline_chapter["description"], manager.user_profile, messages
+                )
+
+        # 各门课程的章节评审（以及失败章节的生成）以流水线并发执行
+        chapters: List[List[Dict[str, Any]]] = []
+        for course_index, manager in enumerate(self.managers):
+            count = len(self._outlines[course_index]["chapters"])
+            conversations = [self._messages[f"course-{course_index}-chapter-{i}"] for i in range(count)]
+            chapters.append(manager.complete_chapters(
+                self._outlines[course_index]["chapters"], [drafts[course_index][i] for i in range(count)],
+                conversations
+            ))
+
+        courses = []
+        for course_index, manager in enumerate(self.managers):
+            outline = self._outlines[course_index]
+            outline["chapters"] = chapters[course_index]
+            courses.append(manager.build_course(outline, self._marks[course_index]))
+        return courses
+
+    def run(self) -> List[Course]:
+        """生成大纲、提交批处理任务、等待完成并重建所有课程
+
+        Returns:
+            课程对象列表
+        """
+        input_path = self.prepare()
+        batch_id = self.transport.submit(input_path)
+        print(f"批处理任务已提交：{batch_id}")
+        info = self.wait(batch_id)
+        output_path = input_path.replace("_input.jsonl", "_output.jsonl")
+        if info["status"] == "completed":
+            self.transport.download(batch_id, output_path)
+        else:
+            print(f"批处理任务{batch_id}未成功完成（{info['status']}），所有章节改为交互方式生成")
+        return self.rebuild(output_path)
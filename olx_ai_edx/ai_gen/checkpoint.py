@@ -0,0 +1,226 @@
+"""检查点模块 - 持久化课程生成任务的大纲和已完成的章节，进程中断后可以从断点继续
+
+每个任务一个目录：meta.json保存学员、技能和模型等任务信息，outline.json保存大纲，
+chapter_<序号>.json保存章节的最新内容及其完成的评审迭代轮数（生成初稿和每次更新后都会保存）。每个文件先写入临时文件再原子替换，
+中断时不会留下写了一半的文件。
+
+检查点只保存章节内容，不保存章节的对话分支：从检查点继续的未完成章节从共享前缀派生新的对话分支，
+之前各轮评审和更新的对话历史不会恢复，后续评审只基于保存的最新内容。
+"""
+
+import json
+import os
+import tempfile
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+from ..models import Skill, UserProfile
+
+
+def atomic_write_json(path: str, data: Any) -> None:
+    """原子地写入JSON文件（先写同目录下的临时文件，再替换目标文件）
+
+    Args:
+        path: 目标文件路径
+        data: 数据
+    """
+    directory = os.path.dirname(path) or "."
+    fd, tmp_path = tempfile.mkstemp(prefix=".tmp_", suffix=".json", dir=directory)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _read_json(path: str) -> Optional[Any]:
+    """读取JSON文件，不存在时返回None"""
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+class CheckpointStore:
+    """按任务保存课程生成进度的检查点目录"""
+
+    def __init__(self, root: str = ".cache/checkpoints"):
+        """初始化检查点存储
+
+        Args:
+            root: 检查点根目录
+        """
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    @classmethod
+    def from_env(cls) -> Optional['CheckpointStore']:
+        """根据环境变量COURSE_CHECKPOINT_DIR创建检查点存储（设为空则不保存检查点）
+
+        Returns:
+            检查点存储，未启用时返回None
+        """
+        root = os.getenv("COURSE_CHECKPOINT_DIR", ".cache/checkpoints")
+        return cls(root) if root else None
+
+    def _path(self, job_id: str, name: str) -> str:
+        """任务目录中文件的路径
+
+        Raises:
+            ValueError: 任务ID包含路径分隔符等非法字符
+        """
+        if not job_id or not all(ch.isalnum() or ch in "-_" for ch in job_id):
+            raise ValueError(f"非法的任务ID：{job_id}")
+        return os.path.join(self.root, job_id, name)
+
+    def create_job(self, user_profile: UserProfile, skill: Skill, model: str,
+                   model_tiers: Optional[Dict[str, str]] = None, job_id: Optional[str] = None) -> str:
+        """创建任务并保存任务信息
+
+        Args:
+            user_profile: 用户配置文件
+            skill: 技能对象
+            model: 使用的模型
+            model_tiers: 各级别单独指定的模型（可选）
+            job_id: 任务ID（可选，默认随机生成）
+
+        Returns:
+            任务ID
+        """
+        job_id = job_id or uuid.uuid4().hex[:12]
+        os.makedirs(os.path.dirname(self._path(job_id, "meta.json")), exist_ok=True)
+        atomic_write_json(self._path(job_id, "meta.json"), {
+            "job_id": job_id,
+            "created_at": time.time(),
+            "status": "running",
+            "model": model,
+            "model_tiers": dict(model_tiers or {}),
+            "user": {"name": user_profile.name, "skill_level": user_profile.skill_level},
+            "skill": {"name": skill.name, "description": skill.description}
+        })
+        return job_id
+
+    def exists(self, job_id: str) -> bool:
+        """任务是否存在
+
+        Args:
+            job_id: 任务ID
+
+        Returns:
+            存在时返回True
+        """
+        return os.path.exists(self._path(job_id, "meta.json"))
+
+    def load_meta(self, job_id: str) -> Dict[str, Any]:
+        """读取任务信息
+
+        Args:
+            job_id: 任务ID
+
+        Returns:
+            任务信息字典
+
+        Raises:
+            KeyError: 任务不存在
+        """
+        meta = _read_json(self._path(job_id, "meta.json"))
+        if meta is None:
+            raise KeyError(f"检查点任务不存在：{job_id}")
+        return meta
+
+    def restore_profile(self, job_id: str) -> UserProfile:
+        """根据任务信息重建用户配置文件（学习目标为任务的技能）
+
+        Args:
+            job_id: 任务ID
+
+        Returns:
+            用户配置文件
+        """
+        meta = self.load_meta(job_id)
+        skill = Skill(meta["skill"]["name"], meta["skill"]["description"])
+        return UserProfile(meta["user"]["name"], meta["user"]["skill_level"], skill)
+
+    def update_meta(self, job_id: str, **fields: Any) -> None:
+        """更新任务信息中的字段（如status、result）
+
+        Args:
+            job_id: 任务ID
+            **fields: 要更新的字段
+        """
+        meta = self.load_meta(job_id)
+        meta.update(fields, updated_at=time.time())
+        atomic_write_json(self._path(job_id, "meta.json"), meta)
+
+    def save_outline(self, job_id: str, outline: Dict[str, Any], final: bool) -> None:
+        """保存大纲
+
+        Args:
+            job_id: 任务ID
+            outline: 大纲
+            final: 是否已完成评审迭代（最终大纲）
+        """
+        atomic_write_json(self._path(job_id, "outline.json"), {"outline": outline, "final": final})
+
+    def load_outline(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """读取大纲
+
+        Args:
+            job_id: 任务ID
+
+        Returns:
+            包含outline和final的字典，尚未保存时返回None
+        """
+        return _read_json(self._path(job_id, "outline.json"))
+
+    def save_chapter(self, job_id: str, index: int, chapter_content: Dict[str, Any], iteration: int = 0,
+                     done: bool = True) -> None:
+        """保存章节的最新内容
+
+        Args:
+            job_id: 任务ID
+            index: 章节序号（从0开始）
+            chapter_content: 章节内容
+            iteration: 已完成的评审/更新轮数（0表示初稿）
+            done: 章节是否已完成（评审迭代已结束）
+        """
+        atomic_write_json(self._path(job_id, f"chapter_{index}.json"),
+                          {"content": chapter_content, "iteration": iteration, "done": done})
+
+    def load_chapters(self, job_id: str) -> Dict[int, Dict[str, Any]]:
+        """读取已保存的章节
+
+        Args:
+            job_id: 任务ID
+
+        Returns:
+            章节序号到{"content": 章节内容, "iteration": 已完成的评审轮数, "done": 是否已完成}的映射
+        """
+        directory = os.path.dirname(self._path(job_id, "meta.json"))
+        chapters = {}
+        for name in os.listdir(directory):
+            if name.startswith("chapter_") and name.endswith(".json"):
+                record = _read_json(os.path.join(directory, name))
+                if "content" not in record:
+                    # 旧版检查点只保存已完成章节的内容
+                    record = {"content": record, "iteration": 0, "done": True}
+                chapters[int(name[len("chapter_"):-len(".json")])] = record
+        return chapters
+
+    def list_jobs(self) -> List[Dict[str, Any]]:
+        """列出所有任务的信息，最近创建的在前
+
+        Returns:
+            任务信息列表
+        """
+        jobs = []
+        for job_id in os.listdir(self.root):
+            if os.path.exists(os.path.join(self.root, job_id, "meta.json")):
+                jobs.append(self.load_meta(job_id))
+        return sorted(jobs, key=lambda meta: -meta.get("created_at", 0))
@@ -0,0 +1,63 @@
+"""HTTP客户端池模块 - 按(base_url, api_key)共享带连接池的OpenAI客户端
+
+每个OpenAI客户端都有自己的连接池。进程内的所有AIGenerator（例如app.py中的每个会话）
+通过此注册表复用同一个客户端，从而复用已建立的TLS连接，避免每个会话重复握手。
+"""
+
+import os
+import threading
+from typing import Dict, Optional, Tuple
+
+import httpx
+from openai import OpenAI
+
+_clients: Dict[Tuple[str, str], OpenAI] = {}
+_clients_lock = threading.Lock()
+
+
+def pool_limits_from_env() -> httpx.Limits:
+    """根据环境变量创建连接池限制
+
+    LLM_POOL_MAX_CONNECTIONS、LLM_POOL_MAX_KEEPALIVE和LLM_POOL_KEEPALIVE_EXPIRY
+    分别设置最大连接数、最大保活连接数和保活连接的空闲过期秒数。
+
+    Returns:
+        连接池限制
+    """
+    return httpx.Limits(
+        max_connections=int(os.getenv("LLM_POOL_MAX_CONNECTIONS", "100")),
+        max_keepalive_connections=int(os.getenv("LLM_POOL_MAX_KEEPALIVE", "20")),
+        keepalive_expiry=float(os.getenv("LLM_POOL_KEEPALIVE_EXPIRY", "60"))
+    )
+
+
+def get_client(base_url: str, api_key: Optional[str], limits: Optional[httpx.Limits] = None) -> OpenAI:
+    """获取共享的OpenAI客户端，不存在时创建
+
+    Args:
+        base_url: API地址
+        api_key: API密钥
+        limits: 连接池限制（可选，仅在首次创建时生效，默认从环境变量读取）
+
+    Returns:
+        OpenAI客户端
+    """
+    key = (base_url.rstrip("/"), api_key or "")
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            http_client = httpx.Client(
+                limits=limits or pool_limits_from_env(),
+                timeout=httpx.Timeout(600.0, connect=5.0)
+            )
+            client = OpenAI(api_key=api_key, base_url=base_url, http_client=http_client)
+            _clients[key] = client
+        return client
+
+
+def close_clients() -> None:
+    """关闭并移除所有共享客户端（进程退出前调用）"""
+    with _clients_lock:
+        for client in _clients.values():
+            client.close()
+        _clients.clear()
@@ -0,0 +1,117 @@
+"""收敛检测模块 - 比较相邻两个版本的大纲/章节，变化足够小时提前结束评审迭代"""
+
+import difflib
+import threading
+from typing import Any, Dict, List, Tuple
+
+Path = Tuple[Any, ...]
+
+
+def flatten(value: Any, prefix: Path = ()) -> Dict[Path, Any]:
+    """将嵌套的字典和列表展开为“路径 → 叶子值”的映射
+
+    Args:
+        value: 嵌套数据
+        prefix: 当前路径
+
+    Returns:
+        叶子字段映射（空字典和空列表本身作为叶子）
+    """
+    if isinstance(value, dict) and value:
+        leaves: Dict[Path, Any] = {}
+        for key, item in value.items():
+            leaves.update(flatten(item, prefix + (key,)))
+        return leaves
+    if isinstance(value, list) and value:
+        leaves = {}
+        for index, item in enumerate(value):
+            leaves.update(flatten(item, prefix + (index,)))
+        return leaves
+    return {prefix: value}
+
+
+def leaf_distance(old: Any, new: Any) -> float:
+    """计算两个叶子值之间的归一化距离（0表示相同，1表示完全不同）
+
+    Args:
+        old: 旧值
+        new: 新值
+
+    Returns:
+        距离
+    """
+    if old == new:
+        return 0.0
+    if isinstance(old, str) and isinstance(new, str):
+        return 1.0 - difflib.SequenceMatcher(None, old, new).ratio()
+    return 1.0
+
+
+def compare_versions(old: Any, new: Any) -> Dict[str, Any]:
+    """在结构上比较两个版本
+
+    Args:
+        old: 旧版本
+        new: 新版本
+
+    Returns:
+        包含changed_fields（变化的叶子字段数）、total_fields（两版字段并集大小）、
+        changed_ratio（变化字段比例）和edit_distance（按字段平均的归一化编辑距离，
+        新增或删除的字段计为1）的字典
+    """
+    old_leaves = flatten(old)
+    new_leaves = flatten(new)
+    paths = set(old_leaves) | set(new_leaves)
+    missing = object()
+    distances = [leaf_distance(old_leaves.get(path, missing), new_leaves.get(path, missing)) for path in paths]
+    changed = sum(1 for distance in distances if distance > 0)
+    total = max(1, len(paths))
+    return {
+        "changed_fields": changed,
+        "total_fields": len(paths),
+        "changed_ratio": changed / total,
+        "edit_distance": sum(distances) / total
+    }
+
+
+class ConvergenceDetector:
+    """判断评审/更新迭代是否已经收敛（变化字段比例和编辑距离都不超过阈值），并记录每次提前停止"""
+
+    def __init__(self, max_changed_ratio: float = 0.05, max_edit_distance: float = 0.01):
+        """初始化收敛检测器
+
+        Args:
+            max_changed_ratio: 变化字段比例的上限
+            max_edit_distance: 按字段平均的编辑距离的上限
+        """
+        self.max_changed_ratio = max_changed_ratio
+        self.max_edit_distance = max_edit_distance
+        self.stops: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    def converged(self, label: str, old: Any, new: Any, iteration: int, remaining: int) -> bool:
+        """比较更新前后的版本，变化低于阈值且仍有剩余迭代时记录一次提前停止
+
+        Args:
+            label: 被迭代对象的名称（如“大纲”“章节 3”）
+            old: 更新前的版本
+            new: 更新后的版本
+            iteration: 刚完成的迭代序号（从1开始）
+            remaining: 剩余的迭代次数
+
+        Returns:
+            已收敛且应停止迭代时返回True
+        """
+        if remaining <= 0:
+            return False
+        diff = compare_versions(old, new)
+        # 两项都不超过阈值才视为收敛：大对象中个别字段被完全重写时，变化字段比例很小但编辑距离仍然超过阈值
+        if diff["changed_ratio"] > self.max_changed_ratio or diff["edit_distance"] > self.max_edit_distance:
+            return False
+
+        stop = dict(diff, label=label, iteration=iteration, skipped=remaining)
+        with self._lock:
+            self.stops.append(stop)
+        print(f"{label}在第{iteration}轮更新后已收敛（{diff['changed_fields']}/{diff['total_fields']}个字段变化，"
+              f"编辑距离{diff['edit_distance']:.3f}），跳过剩余{remaining}轮评审")
+        return True
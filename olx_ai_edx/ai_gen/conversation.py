@@ -0,0 +1,135 @@
+"""对话上下文管理模块 - 为每个章节从共享前缀派生独立的对话分支"""
+
+from typing import Any, Dict, List, Optional
+
+from ..models import UserProfile
+from .prompts import COURSE_LAYOUT, compact_json
+
+
+def message_content(message: Any) -> str:
+    """获取消息文本（兼容字典消息和SDK返回的消息对象）
+
+    Args:
+        message: 消息字典或消息对象
+
+    Returns:
+        消息文本
+    """
+    if isinstance(message, dict):
+        return message.get("content") or ""
+    return getattr(message, "content", None) or ""
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算文本的token数
+
+    中日韩字符大约每个字符一个token，其余字符大约每4个字符一个token。
+
+    Args:
+        text: 文本
+
+    Returns:
+        估算的token数
+    """
+    cjk = sum(1 for ch in text if '\u2e80' <= ch <= '\u9fff' or '\uf900' <= ch <= '\uffef')
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def estimate_messages_tokens(messages: List[Any]) -> int:
+    """估算消息列表的token数（每条消息额外计入少量格式开销）
+
+    Args:
+        messages: 消息列表
+
+    Returns:
+        估算的token数
+    """
+    return sum(estimate_tokens(message_content(m)) + 4 for m in messages)
+
+
+class ConversationContext:
+    """管理共享对话前缀，并保证每次请求的输入规模不超过token预算"""
+
+    def __init__(self, token_budget: int = 6000, summary_chars: int = 40, summary_items: int = 3):
+        """初始化对话上下文
+
+        Args:
+            token_budget: 单次请求允许的最大输入token数（估算值）
+            summary_chars: 被省略的每条请求在摘要中保留的字符数
+            summary_items: 摘要中最多列出的被省略请求条数（取最近的几条）
+        """
+        self.token_budget = token_budget
+        self.summary_chars = summary_chars
+        self.summary_items = summary_items
+        self.prefix: List[Dict[str, Any]] = []
+
+    def set_course_prefix(self, user_profile: UserProfile, outline: Dict[str, Any]) -> None:
+        """用用户画像和最终大纲设置各章节共享的精简前缀
+
+        Args:
+            user_profile: 用户配置文件
+            outline: 最终课程大纲
+        """
+        compact_outline = {
+            "course_title": outline.get("course_title", ""),
+            "chapters": [
+                {"title": c.get("title", ""), "description": c.get("description", "")}
+                for c in outline.get("chapters", [])
+            ]
+        }
+        goals = user_profile.learning_goals.description if user_profile.learning_goals else ""
+        # 固定系统提示在前，本门课程共享的上下文在后，各章节请求因此共享同一前缀
+        self.prefix = [COURSE_LAYOUT.system_message(
+            f"当前课程的学员：{user_profile.name}\n技能水平：{user_profile.skill_level}\n学习目标：{goals}\n"
+            f"课程大纲：{compact_json(compact_outline)}"
+        )]
+
+    def fork(self) -> List[Dict[str, Any]]:
+        """从共享前缀派生一个新的对话分支
+
+        Returns:
+            以共享前缀开头的新消息列表
+        """
+        return [dict(m) for m in self.prefix]
+
+    def fit(self, messages: List[Any], budget: Optional[int] = None) -> List[Any]:
+        """裁剪待发送的消息，使其不超过token预算
+
+        保留共享前缀（或首条消息）和最新的请求，从最早的中间轮次开始省略，
+        并将被省略请求的摘要追加到保留的前缀末尾。原列表不会被修改。
+
+        Args:
+            messages: 完整对话历史
+            budget: token预算（可选，默认使用self.token_budget）
+
+        Returns:
+            实际发送的消息列表
+        """
+        budget = budget or self.token_budget
+        if estimate_messages_tokens(messages) <= budget:
+            return messages
+
+        if self.prefix and messages[:len(self.prefix)] == self.prefix:
+            pinned = len(self.prefix)
+        else:
+            pinned = 1
+        head = [dict(m) if isinstance(m, dict) else {"role": m.role, "content": message_content(m)}
+                for m in messages[:pinned]]
+        body = list(messages[pinned:])
+
+        dropped = []
+        while len(body) > 1 and estimate_messages_tokens(head + body) > budget:
+            dropped.append(body.pop(0))
+            # 保持user/assistant交替，不以assistant消息开头
+            while len(body) > 1 and isinstance(body[0], dict) and body[0].get("role") == "assistant":
+                dropped.append(body.pop(0))
+
+        if dropped:
+            requests = [message_content(m)[:self.summary_chars].replace("\n", " ")
+                        for m in dropped if isinstance(m, dict) and m.get("role") == "user"][-self.summary_items:]
+            summary = f"\n\n（已省略{len(dropped)}条较早的对话"
+            if requests:
+                summary += "，其中最近的请求包括：" + "；".join(requests)
+            head[-1]["content"] = message_content(head[-1]) + summary + "）"
+
+        return head + body
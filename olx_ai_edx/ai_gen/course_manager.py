@@ -1,97 +1,772 @@
 """课程生成管理器 - 协调用户配置文件和AI生成过程"""
 
-from typing import Optional
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
 from ..models import UserProfile
 from ..models import Skill
 from ..models import Course
 from .ai_gen_content import AIGenerator
+from .checkpoint import CheckpointStore
+from .convergence import ConvergenceDetector
+from .metrics import format_summary
+from .pipeline import Pipeline
+from .prompt_compiler import format_savings
+from .providers import provider_for_model
 import os
 from dotenv import load_dotenv
 
 load_dotenv(os.path.join(os.path.dirname(__file__), '..', 'ref', '.env'))
 
+# 各阶段开始时的整体进度；章节生成阶段按已完成章节数在chapters和course_review之间线性增长
+STAGE_PROGRESS = {
+    "outline": 0.0,
+    "outline_review": 0.05,
+    "chapters": 0.15,
+    "course_review": 0.9,
+    "build": 0.95,
+    "export": 0.97
+}
+
 class CourseGenerationManager:
     """管理课程生成过程，协调用户配置文件和AI生成"""
 
-    def __init__(self, user_profile: UserProfile, max_iterations: int = 1, skill: Skill = None, aigenerator: Optional[AIGenerator] = None):
+    def __init__(self, user_profile: UserProfile, max_iterations: int = 1, skill: Skill = None,
+                 aigenerator: Optional[AIGenerator] = None, max_workers: int = 1, stream: bool = False,
+                 on_partial: Optional[Callable[[Optional[int], str, Dict[str, Any]], None]] = None,
+                 speculative: bool = False, convergence: Optional[ConvergenceDetector] = None,
+                 provider_limits: Optional[Dict[str, int]] = None,
+                 checkpoint: Optional[CheckpointStore] = None, job_id: Optional[str] = None,
+                 on_progress: Optional[Callable[[Dict[str, Any]], None]] = None):
         """初始化管理器
 
         Args:
             user_profile: 用户配置文件
+            max_iterations: 评审/更新的最大迭代次数
             skill: 技能对象
             aigenerator: AI生成器实例（可选）
+            max_workers: 并发生成章节时同时进行的最大请求数（1表示逐章串行生成）
+            stream: 是否以流式方式生成大纲更新和章节内容
+            on_partial: 流式生成时的回调，以(章节序号, 键名, 对象)调用；更新大纲时章节序号为None。
+                未提供时打印进度
+            speculative: 是否在评审/更新大纲的同时，按初始大纲推测生成章节初稿；大纲更新后只重新生成
+                标题或描述发生变化的章节，章节评审在大纲确定后进行
+            convergence: 收敛检测器（可选），相邻两版大纲或章节的变化低于阈值时提前结束评审迭代
+            provider_limits: 各模型服务商同时执行的最大请求数（可选，未列出的服务商只受max_workers限制）
+            checkpoint: 检查点存储（可选），保存大纲和已完成的章节，中断后以同一任务ID重新运行时跳过已完成的部分
+            job_id: 检查点任务ID（提供checkpoint时必需）
+            on_progress: 进度回调（可选），每进入一个阶段或完成一个章节时以进度字典调用，
+                包含stage、chapters_done、chapters_total和整体进度fraction
         """
         self.user_profile = user_profile
         self.skill = skill
         self.aigenerator = aigenerator
         self.max_iterations = max_iterations
+        self.max_workers = max(1, max_workers)
+        self.stream = stream
+        self.on_partial = on_partial or self._print_partial
+        self.speculative = speculative
+        self.convergence = convergence or ConvergenceDetector()
+        self.provider_limits = provider_limits or {}
+        self.checkpoint = checkpoint
+        self.job_id = job_id
+        if checkpoint is not None and not job_id:
+            raise ValueError("使用检查点时必须提供任务ID")
+        self.on_progress = on_progress
+        self.progress: Dict[str, Any] = {"stage": None, "chapters_done": 0, "chapters_total": 0, "fraction": 0.0}
+        self._progress_lock = threading.Lock()
+        # 最近一次generate_course的LLM调用汇总
+        self.metrics_summary: Optional[Dict[str, Any]] = None
+        # 最近一次generate_course的导出结果
+        self.export_result: Any = None
 
-    def generate_course(self) -> Course:
+    def generate_course(self, export: Optional[Callable[[Course], Any]] = None) -> Course:
         """协调多轮对话生成课程
 
+        Args:
+            export: 导出函数（可选），以生成的课程调用，返回值保存在export_result
+
         Returns:
             生成的课程对象
         """
         print(f"开始为{self.user_profile.name}生成{self.skill.name}课程...")
+        metrics_mark = self.aigenerator.metrics.mark()
+        with self._progress_lock:
+            self.progress.update(stage=None, chapters_done=0, chapters_total=0, fraction=0.0)
+        # 从检查点恢复时大纲已经生成，无需推测，改用流水线从断点继续
+        resuming = self.checkpoint is not None and self.checkpoint.load_outline(self.job_id) is not None
+        if self.speculative and self.max_iterations > 0 and not resuming:
+            self._report("outline")
+            outline = self._generate_speculatively()
+            self._report("course_review")
+            outline = self._refine_course(outline)
+            self._report("build")
+            course = self.build_course(outline, metrics_mark)
+            if self.checkpoint is not None:
+                self.checkpoint.update_meta(self.job_id, status="completed")
+            if export is not None:
+                self._report("export")
+            self.export_result = export(course) if export is not None else None
+            return course
+
+        pipeline = self.build_pipeline(metrics_mark, export)
+        pipeline.run()
+        self.export_result = pipeline.result("export") if export is not None else None
+        return pipeline.result("build")
+
+    def _report(self, stage: Optional[str] = None, chapters_total: Optional[int] = None,
+                chapter_done: bool = False) -> None:
+        """更新生成进度并通知进度回调
+
+        Args:
+            stage: 进入的阶段（可选）
+            chapters_total: 章节总数（可选）
+            chapter_done: 是否完成了一个章节
+        """
+        with self._progress_lock:
+            progress = self.progress
+            if stage is not None:
+                progress["stage"] = stage
+            if chapters_total is not None:
+                progress["chapters_total"] = chapters_total
+            if chapter_done:
+                progress["chapters_done"] += 1
+            fraction = STAGE_PROGRESS.get(progress["stage"], 0.0)
+            if progress["stage"] == "chapters" and progress["chapters_total"]:
+                fraction += (STAGE_PROGRESS["course_review"] - fraction) * \
+                    progress["chapters_done"] / progress["chapters_total"]
+            progress["fraction"] = fraction
+            snapshot = dict(progress)
+        if self.on_progress is not None:
+            self.on_progress(snapshot)
+
+    def _provider(self, stage: str) -> str:
+        """阶段所用模型的服务商，用于流水线的服务商并发限制
+
+        Args:
+            stage: 流水线阶段名称
+
+        Returns:
+            服务商名称
+        """
+        return provider_for_model(self.aigenerator.model_for(stage))
+
+    def build_pipeline(self, metrics_mark: int = 0, export: Optional[Callable[[Course], Any]] = None) -> Pipeline:
+        """构建课程生成流水线
+
+        节点依次为：初始大纲 → 大纲评审/更新（每轮两个节点）→ 规划章节（按最终大纲添加各章节的生成、
+        评审、更新节点，章节之间互不依赖）→ 汇总 → 整体评审/更新 → 创建课程 → 导出（可选）。
+        已收敛或评审认为已完成的后续迭代节点直接跳过。
+
+        使用检查点时，每次更新大纲、生成章节初稿和每次更新章节后都会保存；从检查点恢复时沿用保存的大纲
+        （已是最终大纲则跳过大纲评审），已完成的章节直接使用保存的内容，未完成的章节从保存的最后一步继续。
+
+        Args:
+            metrics_mark: 本门课程开始时的指标记录序号
+            export: 导出函数（可选）
+
+        Returns:
+            流水线
+        """
+        pipeline = Pipeline(self.max_workers, self.provider_limits)
+        state: Dict[str, Any] = {"outline": None, "outline_done": False, "course_done": False}
+        saved = self.checkpoint.load_outline(self.job_id) if self.checkpoint is not None else None
+
+        def initial_outline(_: Pipeline) -> None:
+            self._report("outline")
+            if saved is not None:
+                state["outline"], state["outline_done"] = saved["outline"], saved["final"]
+                print(f"从检查点恢复{'最终' if saved['final'] else ''}大纲，共{len(state['outline']['chapters'])}个章节")
+                return
+            print("第1阶段：生成课程大纲")
+            state["outline"] = self.aigenerator.generate_initial_outline(self.user_profile, self.skill)
+            print(f"大纲生成完成，共{len(state['outline']['chapters'])}个章节\n{state['outline']}")
+            self._save_outline(state["outline"], False)
+
+        pipeline.add("outline", initial_outline, provider=self._provider("generate_initial_outline"))
+        last = "outline"
+
+        # 阶段1.5：大纲迭代
+        for i in range(self.max_iterations):
+            def review_outline(_: Pipeline, i: int = i) -> Optional[str]:
+                if state["outline_done"]:
+                    return None
+                self._report("outline_review")
+                review = self.aigenerator.review_outline(state["outline"])
+                print(f"大纲评审 #{i + 1}: {review}")
+                return review
+
+            def update_outline(p: Pipeline, i: int = i) -> None:
+                review = p.result(f"outline_review_{i + 1}")
+                if review is None:
+                    return
+                state["outline"], state["outline_done"] = self._update_outline_step(state["outline"], review, i)
+                self._save_outline(state["outline"], False)
+
+            pipeline.add(f"outline_review_{i + 1}", review_outline, [last], self._provider("review_outline"))
+            pipeline.add(f"outline_update_{i + 1}", update_outline, [f"outline_review_{i + 1}"],
+                         self._provider("update_outline"))
+            last = f"outline_update_{i + 1}"
+
+        def plan_chapters(p: Pipeline) -> None:
+            outline = state["outline"]
+            self._save_outline(outline, True)
+            saved_chapters = self.checkpoint.load_chapters(self.job_id) if self.checkpoint is not None else {}
+            if saved_chapters:
+                finished = sum(1 for record in saved_chapters.values() if record["done"])
+                print(f"从检查点恢复{finished}个已完成的章节和{len(saved_chapters) - finished}个未完成的章节")
+            self._report("chapters", chapters_total=len(outline["chapters"]))
+            # 每个章节从“用户画像 + 最终大纲”的精简前缀派生独立的对话分支
+            self.aigenerator.context.set_course_prefix(self.user_profile, outline)
+            chapters = outline["chapters"]
+            print(f"\n第2阶段：生成{len(chapters)}个章节的内容（最多{self.max_workers}个并发请求）")
+            for index, chapter in enumerate(chapters):
+                record = saved_chapters.get(index)
+                if record is not None and record["done"]:
+                    self._report(chapter_done=True)
+                    p.add(f"chapter_{index + 1}_result", lambda _, content=record["content"]: content,
+                          ["plan_chapters"])
+                    p.depend("assemble", f"chapter_{index + 1}_result")
+                    continue
+                if record is not None:
+                    print(f"章节 {index + 1} 从检查点继续（已完成{min(record['iteration'], self.max_iterations - 1)}轮评审）")
+                p.depend("assemble", self._add_chapter_nodes(p, index, chapter, len(chapters), record))
+
+        def assemble(p: Pipeline) -> None:
+            self._report("course_review")
+            outline = state["outline"]
+            # 按大纲顺序用详细内容替换章节
+            outline["chapters"] = [p.result(f"chapter_{i + 1}_result") for i in range(len(outline["chapters"]))]
+
+        pipeline.add("plan_chapters", plan_chapters, [last])
+        pipeline.add("assemble", assemble, ["plan_chapters"])
+        last = "assemble"
+
+        # 阶段3：整体审校（最终评审迭代次数减一）
+        for i in range(self.max_iterations - 1):
+            def review_course(_: Pipeline, i: int = i) -> Optional[str]:
+                if state["course_done"]:
+                    return None
+                review = self._review_course_step(state["outline"], i)
+                state["course_done"] = review is None
+                return review
+
+            def update_course(p: Pipeline, i: int = i) -> None:
+                review = p.result(f"course_review_{i + 1}")
+                if review is None:
+                    return
+                state["outline"] = self._update_course_step(state["outline"], review)
+
+            pipeline.add(f"course_review_{i + 1}", review_course, [last], self._provider("review_full_course"))
+            pipeline.add(f"course_update_{i + 1}", update_course, [f"course_review_{i + 1}"],
+                         self._provider("update_full_course"))
+            last = f"course_update_{i + 1}"
+
+        def build(_: Pipeline) -> Course:
+            self._report("build")
+            course = self.build_course(state["outline"], metrics_mark)
+            if self.checkpoint is not None:
+                self.checkpoint.update_meta(self.job_id, status="completed")
+            return course
+
+        pipeline.add("build", build, [last])
+        if export is not None:
+            def export_course(p: Pipeline) -> Any:
+                self._report("export")
+                return export(p.result("build"))
+
+            pipeline.add("export", export_course, ["build"])
+        return pipeline
+
+    def _add_chapter_nodes(self, pipeline: Pipeline, index: int, chapter: Dict[str, Any], total: int,
+                           saved: Optional[Dict[str, Any]] = None, messages: Optional[List[Dict[str, Any]]] = None,
+                           after: Optional[str] = "plan_chapters") -> str:
+        """添加单个章节的生成、评审和更新节点
+
+        Args:
+            pipeline: 流水线
+            index: 章节序号（从0开始）
+            chapter: 大纲中的章节条目
+            total: 章节总数
+            saved: 已有的未完成章节（可选，如检查点或批处理的结果，包含content和iteration），
+                提供时跳过生成和已完成的评审轮次
+            messages: 该章节使用的对话历史（可选，默认从共享前缀派生新的对话分支）
+            after: 章节节点依赖的节点名称（None表示不依赖其他节点）
+
+        Returns:
+            该章节最后一个节点的名称，其结果为章节内容
+        """
+        prefix = f"chapter_{index + 1}"
+        if messages is None:
+            messages = self.aigenerator.fork_conversation()
+        state: Dict[str, Any] = {"messages": messages, "content": None, "done": False}
+        deps = [after] if after else []
+        iterations = self.max_iterations - 1
 
+        def save(iteration: int) -> None:
+            self._save_chapter(index, state["content"], iteration, state["done"])
+
+        if saved is not None:
+            state["content"] = saved["content"]
+            start = min(saved["iteration"], iterations)
+            pipeline.add(f"{prefix}_generate", lambda _: None, deps)
+            return self._add_chapter_iterations(pipeline, index, prefix, state, save, start)
+
+        def generate(_: Pipeline) -> None:
+            print(f"生成章节 {index + 1}/{total}: {chapter['title']}")
+            state["content"] = self.aigenerator.generate_chapter_content(
+                chapter["title"],
+                chapter["description"],
+                self.user_profile,
+                messages=state["messages"],
+                stream=self.stream,
+                on_object=lambda key, obj: self.on_partial(index, key, obj)
+            )
+            save(0)
+
+        pipeline.add(f"{prefix}_generate", generate, deps, self._provider("generate_chapter_content"))
+        return self._add_chapter_iterations(pipeline, index, prefix, state, save, 0)
+
+    def _add_chapter_iterations(self, pipeline: Pipeline, index: int, prefix: str, state: Dict[str, Any],
+                                save: Callable[[int], None], start: int) -> str:
+        """添加单个章节的评审、更新和结果节点
+
+        Args:
+            pipeline: 流水线
+            index: 章节序号（从0开始）
+            prefix: 章节节点名称的前缀
+            state: 章节状态（对话分支messages、当前内容content和是否完成done）
+            save: 保存章节检查点的函数，以已完成的评审轮数调用
+            start: 从第几轮评审开始（之前的轮次已在检查点中完成）
+
+        Returns:
+            该章节最后一个节点的名称，其结果为章节内容
+        """
+        last = f"{prefix}_generate"
+        # 章节内容迭代（章节迭代次数减一）
+        iterations = self.max_iterations - 1
+        for j in range(start, iterations):
+            def review(_: Pipeline, j: int = j) -> Optional[str]:
+                if state["done"]:
+                    return None
+                feedback = self.aigenerator.review_chapter_content(state["content"], messages=state["messages"])
+                print(f"章节 {index + 1} 评审 #{j + 1}: {feedback}")
+                if "良好" in feedback and "完成" in feedback:
+                    print(f"章节 {index + 1} 内容已完成")
+                    state["done"] = True
+                    save(j)
+                    return None
+                return feedback
+
+            def update(p: Pipeline, j: int = j) -> None:
+                feedback = p.result(f"{prefix}_review_{j + 1}")
+                if feedback is None:
+                    return
+                state["content"], state["done"] = self._update_chapter_step(
+                    index, state["content"], feedback, state["messages"], j, iterations)
+                save(j + 1)
+
+            pipeline.add(f"{prefix}_review_{j + 1}", review, [last], self._provider("review_chapter_content"))
+            pipeline.add(f"{prefix}_update_{j + 1}", update, [f"{prefix}_review_{j + 1}"],
+                         self._provider("update_chapter_content"))
+            last = f"{prefix}_update_{j + 1}"
+
+        def result(_: Pipeline) -> Dict[str, Any]:
+            state["done"] = True
+            save(iterations)
+            self._report(chapter_done=True)
+            return state["content"]
+
+        pipeline.add(f"{prefix}_result", result, [last])
+        return f"{prefix}_result"
+
+    def complete_chapters(self, chapters: List[Dict[str, Any]], drafts: List[Optional[Dict[str, Any]]],
+                          conversations: List[List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+        """完成一组章节的内容：已有初稿的章节只进行评审迭代，其余章节先生成再评审
+
+        章节之间互不依赖，以流水线并发执行，受max_workers和服务商并发限制约束（如批处理结果的重建）。
+
+        Args:
+            chapters: 大纲中的章节条目
+            drafts: 与chapters对应的初稿，没有初稿的章节为None
+            conversations: 与chapters对应的对话历史
+
+        Returns:
+            章节内容列表，顺序与chapters一致
+        """
+        pipeline = Pipeline(self.max_workers, self.provider_limits)
+        results = []
+        for index, chapter in enumerate(chapters):
+            saved = {"content": drafts[index], "iteration": 0} if drafts[index] is not None else None
+            results.append(self._add_chapter_nodes(pipeline, index, chapter, len(chapters), saved,
+                                                   conversations[index], after=None))
+        pipeline.run()
+        return [pipeline.result(name) for name in results]
+
+    def _save_outline(self, outline: Dict[str, Any], final: bool) -> None:
+        """使用检查点时保存大纲
+
+        Args:
+            outline: 大纲
+            final: 是否为最终大纲
+        """
+        if self.checkpoint is not None:
+            self.checkpoint.save_outline(self.job_id, outline, final)
+
+    def _save_chapter(self, index: int, chapter_content: Dict[str, Any], iteration: int, done: bool) -> None:
+        """使用检查点时保存章节的最新内容
+
+        Args:
+            index: 章节序号（从0开始）
+            chapter_content: 章节内容
+            iteration: 已完成的评审/更新轮数
+            done: 章节是否已完成
+        """
+        if self.checkpoint is not None:
+            self.checkpoint.save_chapter(self.job_id, index, chapter_content, iteration, done)
+
+    def generate_outline(self) -> Dict[str, Any]:
+        """生成并迭代完善课程大纲，然后以“用户画像 + 最终大纲”作为章节对话的共享前缀
+
+        Returns:
+            最终大纲字典
+        """
         # 阶段1：生成课程大纲
         print("第1阶段：生成课程大纲")
         outline = self.aigenerator.generate_initial_outline(self.user_profile, self.skill)
         print(f"大纲生成完成，共{len(outline['chapters'])}个章节\n{outline}")
 
+        outline = self._refine_outline(outline)
+
+        # 每个章节从“用户画像 + 最终大纲”的精简前缀派生独立的对话分支，
+        # 避免请求携带之前所有评审和章节内容
+        self.aigenerator.context.set_course_prefix(self.user_profile, outline)
+        return outline
+
+    def _refine_outline(self, outline: Dict[str, Any]) -> Dict[str, Any]:
+        """评审并更新大纲
+
+        Args:
+            outline: 初始大纲
+
+        Returns:
+            迭代后的大纲
+        """
         # 阶段1.5：大纲迭代
         for i in range(self.max_iterations):
             review = self.aigenerator.review_outline(outline)
             print(f"大纲评审 #{i + 1}: {review}")
-            outline = self.aigenerator.update_outline(outline, review)
-            print(f"大纲已更新，现在有{len(outline['chapters'])}个章节\n{outline}")
-
-        # 阶段2：生成章节内容
-        print("\n第2阶段：逐章生成内容")
-        for i, chapter in enumerate(outline["chapters"]):
-            print(f"生成章节 {i + 1}/{len(outline['chapters'])}: {chapter['title']}")
+            outline, converged = self._update_outline_step(outline, review, i)
+            self._save_outline(outline, False)
+            if converged:
+                break
+        return outline
 
-            # 生成章节内容
-            chapter_content = self.aigenerator.generate_chapter_content(
-                chapter["title"],
-                chapter["description"],
-                self.user_profile
-            )
+    def _update_outline_step(self, outline: Dict[str, Any], review: str, i: int) -> Tuple[Dict[str, Any], bool]:
+        """根据评审更新一次大纲，并判断是否已收敛
 
-            # 章节内容迭代
-            for j in range(self.max_iterations - 1):  # 章节迭代次数减一
-                review = self.aigenerator.review_chapter_content(chapter_content)
-                print(f"章节评审 #{j + 1}: {review}")
+        Args:
+            outline: 当前大纲
+            review: 评审反馈
+            i: 迭代序号（从0开始）
 
-                if "良好" in review and "完成" in review:
-                    print("章节内容已完成")
-                    break
+        Returns:
+            (更新后的大纲, 是否已收敛)
+        """
+        previous = outline
+        outline = self.aigenerator.update_outline(
+            outline, review, stream=self.stream,
+            on_object=lambda key, obj: self.on_partial(None, key, obj)
+        )
+        print(f"大纲已更新，现在有{len(outline['chapters'])}个章节\n{outline}")
+        return outline, self.convergence.converged("大纲", previous, outline, i + 1, self.max_iterations - i - 1)
 
-                chapter_content = self.aigenerator.update_chapter_content(chapter_content, review)
-                print(f"章节内容已更新，现在有{len(chapter_content['components'])}个组件\n{chapter_content}")
+    def _refine_course(self, outline: Dict[str, Any]) -> Dict[str, Any]:
+        """整体评审并更新课程（最终评审迭代次数减一）
 
-            # 用详细内容更新大纲中的章节
-            outline["chapters"][i] = chapter_content
+        Args:
+            outline: 章节已替换为详细内容的大纲
 
-        '''
+        Returns:
+            审校后的大纲
+        """
         # 阶段3：整体审校
-        print("\n第3阶段：整体审校")
-        for i in range(self.max_iterations - 1):  # 最终评审迭代次数减一
-            review = self.aigenerator.review_full_course(outline)
-            print(f"整体评审 #{i + 1}: {review}")
-
-            if "良好" in review and "完成" in review:
-                print("课程已完成")
+        for i in range(self.max_iterations - 1):
+            review = self._review_course_step(outline, i)
+            if review is None:
                 break
+            outline = self._update_course_step(outline, review)
+        return outline
+
+    def _review_course_step(self, outline: Dict[str, Any], i: int) -> Optional[str]:
+        """整体评审一次课程
+
+        Args:
+            outline: 章节已替换为详细内容的大纲
+            i: 迭代序号（从0开始）
+
+        Returns:
+            评审反馈，评审认为课程已完成时返回None
+        """
+        if i == 0:
+            print("\n第3阶段：整体审校")
+        review = self.aigenerator.review_full_course(outline)
+        print(f"整体评审 #{i + 1}: {review}")
+        if "良好" in review and "完成" in review:
+            print("课程已完成")
+            return None
+        return review
+
+    def _update_course_step(self, outline: Dict[str, Any], review: str) -> Dict[str, Any]:
+        """根据整体评审更新一次课程
+
+        Args:
+            outline: 章节已替换为详细内容的大纲
+            review: 评审反馈
+
+        Returns:
+            更新后的大纲
+        """
+        outline = self.aigenerator.update_full_course(outline, review)
+        print("课程已更新")
+        return outline
+
+    @staticmethod
+    def _chapter_key(chapter: Dict[str, Any]) -> Tuple[str, str]:
+        """章节条目的比较键，标题和描述都相同的条目视为未改变
+
+        Args:
+            chapter: 大纲中的章节条目
+
+        Returns:
+            (标题, 描述)
+        """
+        return str(chapter.get("title", "")).strip(), str(chapter.get("description", "")).strip()
+
+    def _generate_speculatively(self) -> Dict[str, Any]:
+        """在评审/更新大纲的同时按初始大纲推测生成章节初稿
+
+        推测任务只生成初稿。大纲迭代完成后，按标题和描述比较最终大纲与初始大纲：未改变的章节采用推测的初稿，
+        新增或改变的章节重新生成；最终大纲中已不存在的推测任务被取消（已开始的只完成初稿，结果被丢弃）。
+        章节的评审和更新都在大纲确定后进行，每完成一个章节报告一次进度。使用检查点时，大纲确定后保存最终大纲，
+        之后与流水线一样在生成初稿和每次更新章节后保存。
+
+        Returns:
+            章节已替换为详细内容的最终大纲
+        """
+        print("第1阶段：生成课程大纲")
+        outline = self.aigenerator.generate_initial_outline(self.user_profile, self.skill)
+        print(f"大纲生成完成，共{len(outline['chapters'])}个章节\n{outline}")
+        self._save_outline(outline, False)
+
+        initial_chapters = [dict(chapter) for chapter in outline["chapters"]]
+        # 推测生成与大纲评审同时进行，先按初始大纲报告章节数
+        self._report("outline_review", chapters_total=len(initial_chapters))
+        self.aigenerator.context.set_course_prefix(self.user_profile, outline)
+        executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        # 出错时通知进行中的章节任务在下一步之前停止
+        cancel = threading.Event()
+
+        def chapter_finished(future: Future) -> None:
+            if not future.cancelled() and future.exception() is None and not cancel.is_set():
+                self._report(chapter_done=True)
+
+        try:
+            print(f"\n第2阶段：评审大纲的同时推测生成{len(initial_chapters)}个章节的初稿")
+            speculative: Dict[Tuple[str, str], List[Tuple[Future, List[Dict[str, Any]]]]] = {}
+            for i, chapter in enumerate(initial_chapters):
+                messages = self.aigenerator.fork_conversation()
+                future = executor.submit(self._draft_chapter, i, chapter, len(initial_chapters), messages, cancel)
+                speculative.setdefault(self._chapter_key(chapter), []).append((future, messages))
+
+            outline = self._refine_outline(outline)
+            self._save_outline(outline, True)
+            self.aigenerator.context.set_course_prefix(self.user_profile, outline)
 
-            outline = self.aigenerator.update_full_course(outline, review)
-            print("课程已更新")
-        '''
+            # 按标题和描述匹配推测的初稿，只重新生成发生变化的章节
+            chapters = outline["chapters"]
+            self._report("chapters", chapters_total=len(chapters))
+            drafts: List[Optional[Tuple[Future, List[Dict[str, Any]]]]] = []
+            futures: List[Optional[Future]] = []
+            for i, chapter in enumerate(chapters):
+                matches = speculative.get(self._chapter_key(chapter))
+                if matches:
+                    drafts.append(matches.pop(0))
+                    futures.append(None)
+                else:
+                    drafts.append(None)
+                    futures.append(executor.submit(self._generate_chapter, i, chapter, len(chapters),
+                                                   self.aigenerator.fork_conversation(), None, cancel, True))
+                    futures[-1].add_done_callback(chapter_finished)
+            discarded = [future for matches in speculative.values() for future, _ in matches]
+            for future in discarded:
+                future.cancel()
+            regenerated = sum(1 for draft in drafts if draft is None)
+            print(f"大纲更新后保留{len(chapters) - regenerated}个推测生成的章节初稿，"
+                  f"重新生成{regenerated}个，丢弃{len(discarded)}个")
 
+            # 保留的初稿完成后再提交评审迭代（在主线程等待，避免工作线程互相等待）
+            for i, draft in enumerate(drafts):
+                if draft is not None:
+                    future, messages = draft
+                    chapter_content = future.result()
+                    self._save_chapter(i, chapter_content, 0, False)
+                    futures[i] = executor.submit(self._generate_chapter, i, chapters[i], len(chapters),
+                                                 messages, chapter_content, cancel, True)
+                    futures[i].add_done_callback(chapter_finished)
+
+            outline["chapters"] = [future.result() for future in futures]
+        except BaseException:
+            cancel.set()
+            raise
+        finally:
+            # 等待已开始的任务结束（被丢弃的推测任务最多完成一次初稿请求），不把请求留到下一门课程
+            executor.shutdown(wait=True, cancel_futures=True)
+        return outline
+
+    def _draft_chapter(self, index: int, chapter: Dict[str, Any], total: int, messages: List[Dict[str, Any]],
+                       cancel: threading.Event) -> Optional[Dict[str, Any]]:
+        """推测生成单个章节的初稿
+
+        Args:
+            index: 章节序号（从0开始）
+            chapter: 初始大纲中的章节条目
+            total: 章节总数
+            messages: 该章节使用的对话历史
+            cancel: 取消标志，已设置时不再生成
+
+        Returns:
+            章节初稿，已取消时返回None
+        """
+        if cancel.is_set():
+            return None
+        print(f"推测生成章节 {index + 1}/{total}: {chapter['title']}")
+        return self.aigenerator.generate_chapter_content(
+            chapter["title"],
+            chapter["description"],
+            self.user_profile,
+            messages=messages,
+            stream=self.stream,
+            on_object=lambda key, obj: self.on_partial(index, key, obj)
+        )
+
+    def build_course(self, outline: Dict[str, Any], metrics_mark: int = 0) -> Course:
+        """从包含章节内容的大纲创建课程对象，并输出本门课程的LLM调用汇总
+
+        Args:
+            outline: 章节已替换为详细内容的大纲
+            metrics_mark: 本门课程开始时的指标记录序号
+
+        Returns:
+            课程对象
+        """
         # 从最终大纲创建Course对象
         course = Course.from_dict(outline)
         print(f"课程生成完成：{course.title}，共{len(course.chapters)}章")
 
+        # 本门课程的LLM调用汇总
+        self.metrics_summary = self.aigenerator.metrics.summary(since=metrics_mark)
+        print(format_summary(self.metrics_summary))
+        # 提示编译节省的输入token（该生成器累计）
+        savings = self.aigenerator.prompts.summary()
+        self.metrics_summary["prompt_tokens_saved"] = savings["saved_tokens"]
+        print(format_savings(savings))
 
         return course
+
+    @staticmethod
+    def _print_partial(index: Optional[int], key: str, obj: Dict[str, Any]) -> None:
+        """打印流式生成过程中完整到达的对象
+
+        Args:
+            index: 章节序号（更新大纲时为None）
+            key: 对象所在数组的键名
+            obj: 完整到达的对象
+        """
+        if key == "chapters":
+            print(f"  大纲章节已生成: {obj.get('title', '')}")
+        elif key == "sequentials" and index is not None:
+            print(f"  章节 {index + 1} 单元已生成: {obj.get('title', '')}")
+
+    def _generate_chapter(self, index: int, chapter: Dict[str, Any], total: int,
+                          messages: Optional[List[Dict[str, Any]]] = None,
+                          chapter_content: Optional[Dict[str, Any]] = None,
+                          cancel: Optional[threading.Event] = None, save: bool = False) -> Dict[str, Any]:
+        """生成并迭代完善单个章节的内容
+
+        Args:
+            index: 章节序号（从0开始）
+            chapter: 大纲中的章节条目，包含title和description
+            total: 章节总数
+            messages: 该章节使用的对话历史（可选，默认使用AI生成器的共享对话历史）
+            chapter_content: 已生成的章节内容（可选，如批处理任务的结果，提供时只进行评审迭代）
+            cancel: 取消标志（可选），每一步之前检查，已设置时直接返回当前内容
+            save: 是否在生成初稿和每次更新后保存章节检查点（使用检查点时）
+
+        Returns:
+            章节内容字典
+        """
+        if cancel is not None and cancel.is_set():
+            return chapter_content
+        print(f"生成章节 {index + 1}/{total}: {chapter['title']}")
+
+        # 生成章节内容
+        if chapter_content is None:
+            chapter_content = self.aigenerator.generate_chapter_content(
+                chapter["title"],
+                chapter["description"],
+                self.user_profile,
+                messages=messages,
+                stream=self.stream,
+                on_object=lambda key, obj: self.on_partial(index, key, obj)
+            )
+            if save:
+                self._save_chapter(index, chapter_content, 0, False)
+
+        # 章节内容迭代
+        iterations = self.max_iterations - 1  # 章节迭代次数减一
+        for j in range(iterations):
+            if cancel is not None and cancel.is_set():
+                break
+            review = self.aigenerator.review_chapter_content(chapter_content, messages=messages)
+            print(f"章节 {index + 1} 评审 #{j + 1}: {review}")
+
+            if "良好" in review and "完成" in review:
+                print(f"章节 {index + 1} 内容已完成")
+                break
+
+            if cancel is not None and cancel.is_set():
+                break
+            chapter_content, converged = self._update_chapter_step(index, chapter_content, review, messages, j,
+                                                                   iterations)
+            if save:
+                self._save_chapter(index, chapter_content, j + 1, False)
+            if converged:
+                break
+
+        if save and not (cancel is not None and cancel.is_set()):
+            self._save_chapter(index, chapter_content, iterations, True)
+        return chapter_content
+
+    def _update_chapter_step(self, index: int, chapter_content: Dict[str, Any], review: str,
+                             messages: Optional[List[Dict[str, Any]]], j: int,
+                             iterations: int) -> Tuple[Dict[str, Any], bool]:
+        """根据评审更新一次章节内容，并判断是否已收敛
+
+        Args:
+            index: 章节序号（从0开始）
+            chapter_content: 当前章节内容
+            review: 评审反馈
+            messages: 该章节使用的对话历史
+            j: 迭代序号（从0开始）
+            iterations: 章节迭代总次数
+
+        Returns:
+            (更新后的章节内容, 是否已收敛)
+        """
+        previous = chapter_content
+        chapter_content = self.aigenerator.update_chapter_content(chapter_content, review, messages=messages)
+        print(f"章节 {index + 1} 内容已更新，现在有{len(chapter_content.get('sequentials', []))}个单元\n{chapter_content}")
+        return chapter_content, self.convergence.converged(f"章节 {index + 1}", previous, chapter_content, j + 1,
+                                                           iterations - j - 1)
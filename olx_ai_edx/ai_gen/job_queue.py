@@ -0,0 +1,419 @@
+"""生成任务队列模块 - 在多个租户之间公平地调度课程生成任务
+
+任务分为interactive（交互式，用户正在等待）和bulk（批量，延迟不敏感）两个优先级：
+有交互式任务等待时总是先执行交互式任务，批量任务只使用空闲的工作线程，并为交互式任务保留部分工作线程。
+同一优先级内按租户做差额轮询（Deficit Round Robin）：每轮为每个有任务的租户增加与权重成正比的额度，
+额度足够支付任务的预估token数时才执行该任务，提交大量或大型任务的租户不会挤占其他租户。
+每个租户可以设置时间窗口内的token预算，超出预算的提交会被拒绝。
+"""
+
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Optional
+
+PRIORITIES = ("interactive", "bulk")
+
+
+class TokenBudgetExceeded(Exception):
+    """租户在当前时间窗口内的token预算不足"""
+
+
+def parse_tenant_map(spec: str) -> Dict[str, int]:
+    """解析“租户=数值”以逗号分隔的配置（如teamA=200000,teamB=50000）
+
+    Args:
+        spec: 配置文本
+
+    Returns:
+        租户到数值的映射
+
+    Raises:
+        ValueError: 配置格式错误
+    """
+    mapping = {}
+    for item in spec.split(","):
+        if not item.strip():
+            continue
+        if "=" not in item:
+            raise ValueError(f"租户配置格式错误：{item}（应为租户=数值）")
+        tenant, value = item.split("=", 1)
+        mapping[tenant.strip()] = int(value)
+    return mapping
+
+
+class GenerationJob:
+    """队列中的一个生成任务"""
+
+    def __init__(self, fn: Callable[['GenerationJob'], Any], tenant: str, priority: str = "interactive",
+                 estimated_tokens: int = 1, job_id: Optional[str] = None):
+        """初始化任务
+
+        Args:
+            fn: 任务函数，以任务本身为参数调用（可更新stage、progress、details和tokens_used），返回值作为任务结果
+            tenant: 租户
+            priority: 优先级，interactive或bulk
+            estimated_tokens: 预估消耗的token数，用于公平调度和预算检查
+            job_id: 任务ID（可选，默认随机生成）
+        """
+        self.job_id = job_id or uuid.uuid4().hex[:12]
+        self.fn = fn
+        self.tenant = tenant
+        self.priority = priority
+        self.estimated_tokens = max(1, estimated_tokens)
+        # queued、running、done或failed
+        self.state = "queued"
+        # 任务当前所处的阶段和进度（0~1），由任务函数更新
+        self.stage: Optional[str] = None
+        self.progress = 0.0
+        # 任务函数报告的其他进度信息（如已完成的章节数）
+        self.details: Dict[str, Any] = {}
+        # 实际消耗的token数，由任务函数设置；未设置时按预估值计入预算
+        self.tokens_used: Optional[int] = None
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.submitted_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._done = threading.Event()
+
+    @property
+    def wait_time(self) -> float:
+        """排队等待的秒数（尚未开始时为已等待的时间）"""
+        return (self.started_at or time.time()) - self.submitted_at
+
+    @property
+    def elapsed(self) -> float:
+        """已执行的秒数（尚未开始时为0）"""
+        if self.started_at is None:
+            return 0.0
+        return (self.finished_at or time.time()) - self.started_at
+
+    @property
+    def eta(self) -> Optional[float]:
+        """按已执行时间和进度线性估算的剩余秒数（尚未开始或尚无进度时为None，结束后为0）"""
+        if self.state in ("done", "failed"):
+            return 0.0
+        if self.state != "running" or self.progress <= 0:
+            return None
+        return self.elapsed * (1 - self.progress) / self.progress
+
+    def wait(self, timeout: Optional[float] = None) -> Any:
+        """等待任务完成并返回结果
+
+        Args:
+            timeout: 最长等待秒数（None表示一直等待）
+
+        Returns:
+            任务结果
+
+        Raises:
+            TimeoutError: 超时仍未完成
+            Exception: 任务函数抛出的异常
+        """
+        if not self._done.wait(timeout):
+            raise TimeoutError(f"任务{self.job_id}未在{timeout}秒内完成")
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+    def to_dict(self) -> Dict[str, Any]:
+        """任务状态
+
+        Returns:
+            任务状态字典（不含结果）
+        """
+        return {
+            "job_id": self.job_id,
+            "tenant": self.tenant,
+            "priority": self.priority,
+            "state": self.state,
+            "stage": self.stage,
+            "progress": round(self.progress, 4),
+            "details": dict(self.details),
+            "wait_time": round(self.wait_time, 3),
+            "elapsed": round(self.elapsed, 3),
+            "eta_seconds": round(self.eta, 1) if self.eta is not None else None,
+            "error": f"{type(self.error).__name__}: {self.error}" if self.error is not None else None
+        }
+
+
+class JobQueue:
+    """按优先级和租户公平调度的生成任务队列"""
+
+    def __init__(self, max_workers: int = 2, quantum: int = 20000, tenant_weights: Optional[Dict[str, int]] = None,
+                 token_budgets: Optional[Dict[str, int]] = None, default_token_budget: Optional[int] = None,
+                 budget_window: float = 3600.0, throughput_window: float = 600.0, interactive_reserve: int = 1,
+                 retention: float = 24 * 3600.0):
+        """初始化任务队列
+
+        Args:
+            max_workers: 同时执行的最大任务数
+            quantum: 差额轮询每轮为权重为1的租户增加的token额度
+            tenant_weights: 租户权重（可选，默认1）
+            token_budgets: 各租户在一个时间窗口内的token预算（可选）
+            default_token_budget: 未单独设置预算的租户的预算（可选，None表示不限制）
+            budget_window: 预算的时间窗口（秒）
+            throughput_window: 统计吞吐量的时间窗口（秒）
+            interactive_reserve: 为交互式任务保留的工作线程数（批量任务最多使用其余线程，至少1个）
+            retention: 已结束的任务保留的秒数，超过后不再能通过get查询
+        """
+        self.max_workers = max(1, max_workers)
+        self.quantum = max(1, quantum)
+        self.tenant_weights = tenant_weights or {}
+        self.token_budgets = token_budgets or {}
+        self.default_token_budget = default_token_budget
+        self.budget_window = budget_window
+        self.throughput_window = throughput_window
+        self.bulk_limit = max(1, self.max_workers - interactive_reserve)
+        self.retention = retention
+        self.jobs: Dict[str, GenerationJob] = {}
+        # 每个优先级中各租户的待执行任务，以及按轮询顺序排列的活跃租户
+        self._queues: Dict[str, Dict[str, Deque[GenerationJob]]] = {p: {} for p in PRIORITIES}
+        self._active: Dict[str, Deque[str]] = {p: deque() for p in PRIORITIES}
+        self._deficits: Dict[str, Dict[str, int]] = {p: {} for p in PRIORITIES}
+        # 各租户在当前窗口内已使用（或已预留）的token数
+        self._usage: Dict[str, int] = {}
+        self._window_start = time.time()
+        self._running: Dict[str, int] = {p: 0 for p in PRIORITIES}
+        self._finished: Deque[GenerationJob] = deque()
+        self._cond = threading.Condition()
+        self._closed = False
+        self._workers = [threading.Thread(target=self._work, name=f"job-queue-{i}", daemon=True)
+                         for i in range(self.max_workers)]
+        for worker in self._workers:
+            worker.start()
+
+    @classmethod
+    def from_env(cls) -> 'JobQueue':
+        """根据环境变量创建任务队列
+
+        JOB_QUEUE_WORKERS设置并发任务数（默认2），JOB_TENANT_WEIGHTS设置租户权重，
+        JOB_TENANT_TOKEN_BUDGETS设置各租户每小时的token预算，JOB_TOKEN_BUDGET设置其他租户的预算（默认不限制）。
+
+        Returns:
+            任务队列
+        """
+        default_budget = os.getenv("JOB_TOKEN_BUDGET")
+        return cls(
+            max_workers=int(os.getenv("JOB_QUEUE_WORKERS", "2")),
+            tenant_weights=parse_tenant_map(os.getenv("JOB_TENANT_WEIGHTS", "")),
+            token_budgets=parse_tenant_map(os.getenv("JOB_TENANT_TOKEN_BUDGETS", "")),
+            default_token_budget=int(default_budget) if default_budget else None
+        )
+
+    def budget_for(self, tenant: str) -> Optional[int]:
+        """租户在一个时间窗口内的token预算
+
+        Args:
+            tenant: 租户
+
+        Returns:
+            token预算，None表示不限制
+        """
+        return self.token_budgets.get(tenant, self.default_token_budget)
+
+    def _roll_window(self) -> None:
+        """时间窗口结束时清零各租户的用量（调用方持有锁）"""
+        if time.time() - self._window_start >= self.budget_window:
+            self._usage.clear()
+            self._window_start = time.time()
+
+    def submit(self, fn: Callable[[GenerationJob], Any], tenant: str = "default", priority: str = "interactive",
+               estimated_tokens: int = 1, job_id: Optional[str] = None) -> GenerationJob:
+        """提交任务
+
+        Args:
+            fn: 任务函数，以任务本身为参数调用
+            tenant: 租户
+            priority: 优先级，interactive或bulk
+            estimated_tokens: 预估消耗的token数
+            job_id: 任务ID（可选）
+
+        Returns:
+            任务
+
+        Raises:
+            ValueError: 未知的优先级，或相同ID的任务仍在排队或执行
+            TokenBudgetExceeded: 租户在当前时间窗口内的剩余预算不足以执行该任务
+            RuntimeError: 队列已关闭
+        """
+        if priority not in PRIORITIES:
+            raise ValueError(f"未知的任务优先级：{priority}（可选{', '.join(PRIORITIES)}）")
+        job = GenerationJob(fn, tenant, priority, estimated_tokens, job_id)
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("任务队列已关闭")
+            self._prune()
+            previous = self.jobs.get(job.job_id)
+            # 已结束的任务可以用同一ID重新提交（如从检查点继续）
+            if previous is not None and previous.state in ("queued", "running"):
+                raise ValueError(f"任务ID重复：{job.job_id}")
+            self._roll_window()
+            budget = self.budget_for(tenant)
+            used = self._usage.get(tenant, 0)
+            if budget is not None and used + job.estimated_tokens > budget:
+                raise TokenBudgetExceeded(f"租户{tenant}的token预算不足：已使用{used}，"
+                                          f"任务预估{job.estimated_tokens}，预算{budget}")
+            # 提交时预留预估用量，任务结束后按实际用量调整
+            self._usage[tenant] = used + job.estimated_tokens
+            self.jobs[job.job_id] = job
+            queue = self._queues[priority].setdefault(tenant, deque())
+            if not queue:
+                self._active[priority].append(tenant)
+                self._deficits[priority].setdefault(tenant, 0)
+            queue.append(job)
+            self._cond.notify()
+        return job
+
+    def _prune(self) -> None:
+        """移除超过保留时间的已结束任务（调用方持有锁）"""
+        now = time.time()
+        expired = [job_id for job_id, job in self.jobs.items()
+                   if job.finished_at is not None and now - job.finished_at > self.retention]
+        for job_id in expired:
+            del self.jobs[job_id]
+
+    def get(self, job_id: str) -> Optional[GenerationJob]:
+        """按ID获取任务
+
+        Args:
+            job_id: 任务ID
+
+        Returns:
+            任务，不存在时返回None
+        """
+        with self._cond:
+            return self.jobs.get(job_id)
+
+    def _next_job(self) -> Optional[GenerationJob]:
+        """按优先级和差额轮询选出下一个任务（调用方持有锁）"""
+        for priority in PRIORITIES:
+            if priority == "bulk" and self._running["bulk"] >= self.bulk_limit:
+                continue
+            active = self._active[priority]
+            queues = self._queues[priority]
+            deficits = self._deficits[priority]
+            while active:
+                tenant = active[0]
+                job = queues[tenant][0]
+                if deficits[tenant] >= job.estimated_tokens:
+                    deficits[tenant] -= job.estimated_tokens
+                    queues[tenant].popleft()
+                    if not queues[tenant]:
+                        # 租户没有待执行任务时移出轮询，不保留额度
+                        active.popleft()
+                        del deficits[tenant]
+                    return job
+                # 额度不足：增加额度并轮到下一个租户
+                deficits[tenant] += self.quantum * self.tenant_weights.get(tenant, 1)
+                active.rotate(-1)
+        return None
+
+    def _work(self) -> None:
+        """工作线程：循环取出并执行任务"""
+        while True:
+            with self._cond:
+                job = self._next_job()
+                while job is None:
+                    if self._closed:
+                        return
+                    self._cond.wait()
+                    job = self._next_job()
+                job.state = "running"
+                job.started_at = time.time()
+                self._running[job.priority] += 1
+
+            try:
+                job.result = job.fn(job)
+                job.state = "done"
+                job.progress = 1.0
+            except BaseException as e:
+                job.error = e
+                job.state = "failed"
+                print(f"生成任务{job.job_id}失败: {e}")
+
+            with self._cond:
+                job.finished_at = time.time()
+                self._running[job.priority] -= 1
+                if job.tokens_used is not None:
+                    self._usage[job.tenant] = max(0, self._usage.get(job.tenant, 0)
+                                                  + job.tokens_used - job.estimated_tokens)
+                self._finished.append(job)
+                self._cond.notify_all()
+            job._done.set()
+
+    def stats(self) -> Dict[str, Any]:
+        """队列统计
+
+        Returns:
+            包含各优先级的队列深度depth、各优先级执行中的任务数running、完成的任务数completed、失败数failed、
+            吞吐量throughput_per_minute、平均和最大排队时间wait_time_avg/wait_time_max，以及各租户的
+            队列深度和token用量by_tenant的字典
+        """
+        now = time.time()
+        with self._cond:
+            while self._finished and now - self._finished[0].finished_at > self.throughput_window:
+                self._finished.popleft()
+            recent = list(self._finished)
+            queued = [job for queues in self._queues.values() for queue in queues.values() for job in queue]
+            depth = {priority: sum(len(queue) for queue in self._queues[priority].values()) for priority in PRIORITIES}
+            tenants = set(self._usage) | {job.tenant for job in queued}
+            by_tenant = {tenant: {"queued": sum(1 for job in queued if job.tenant == tenant),
+                                  "tokens_used": self._usage.get(tenant, 0),
+                                  "token_budget": self.budget_for(tenant)} for tenant in sorted(tenants)}
+            running = dict(self._running)
+
+        waits = [job.wait_time for job in recent] + [job.wait_time for job in queued]
+        return {
+            "depth": depth,
+            "running": running,
+            "completed": sum(1 for job in recent if job.state == "done"),
+            "failed": sum(1 for job in recent if job.state == "failed"),
+            "throughput_per_minute": len(recent) * 60.0 / self.throughput_window,
+            "wait_time_avg": sum(waits) / len(waits) if waits else 0.0,
+            "wait_time_max": max(waits, default=0.0),
+            "by_tenant": by_tenant
+        }
+
+    def shutdown(self, wait: bool = True) -> None:
+        """关闭队列：不再接受新任务，工作线程执行完已提交的任务后退出
+
+        Args:
+            wait: 是否等待工作线程退出
+        """
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if wait:
+            for worker in self._workers:
+                worker.join()
+
+
+def render_queue_metrics(stats: Dict[str, Any]) -> str:
+    """将队列统计以Prometheus文本格式输出
+
+    Args:
+        stats: JobQueue.stats()返回的统计
+
+    Returns:
+        Prometheus文本
+    """
+    lines = ["# HELP job_queue_depth 排队中的任务数", "# TYPE job_queue_depth gauge"]
+    lines += [f'job_queue_depth{{priority="{priority}"}} {depth}' for priority, depth in stats["depth"].items()]
+    lines += ["# HELP job_queue_tenant_depth 各租户排队中的任务数", "# TYPE job_queue_tenant_depth gauge"]
+    lines += [f'job_queue_tenant_depth{{tenant="{tenant}"}} {info["queued"]}'
+              for tenant, info in stats["by_tenant"].items()]
+    lines += ["# HELP job_queue_tenant_tokens 各租户在当前预算窗口内使用的token数",
+              "# TYPE job_queue_tenant_tokens gauge"]
+    lines += [f'job_queue_tenant_tokens{{tenant="{tenant}"}} {info["tokens_used"]}'
+              for tenant, info in stats["by_tenant"].items()]
+    lines += ["# HELP job_queue_running 执行中的任务数", "# TYPE job_queue_running gauge"]
+    lines += [f'job_queue_running{{priority="{priority}"}} {running}' for priority, running in stats["running"].items()]
+    for name, help_text in (("throughput_per_minute", "近期每分钟完成的任务数"),
+                            ("wait_time_avg", "近期任务的平均排队秒数"), ("wait_time_max", "近期任务的最长排队秒数")):
+        lines += [f"# HELP job_queue_{name} {help_text}", f"# TYPE job_queue_{name} gauge",
+                  f"job_queue_{name} {stats[name]:g}"]
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,163 @@
+"""JSON Patch模块 - 在本地应用模型返回的RFC 6902编辑操作
+
+修订大纲或章节时，模型只需返回针对当前对象的编辑操作，而不必输出完整对象，
+输出token数随修改量而不是对象大小增长。
+"""
+
+import copy
+from typing import Any, Dict, List
+
+
+class PatchError(ValueError):
+    """补丁格式错误或无法应用到当前对象"""
+
+
+def parse_pointer(pointer: Any) -> List[str]:
+    """解析JSON Pointer（RFC 6901）
+
+    Args:
+        pointer: 如/chapters/0/title，空字符串表示整个文档
+
+    Returns:
+        路径片段列表
+
+    Raises:
+        PatchError: 路径不是字符串或不以/开头
+    """
+    if not isinstance(pointer, str):
+        raise PatchError(f"路径必须是字符串：{pointer!r}")
+    if pointer == "":
+        return []
+    if not pointer.startswith("/"):
+        raise PatchError(f"路径必须以/开头：{pointer}")
+    return [part.replace("~1", "/").replace("~0", "~") for part in pointer[1:].split("/")]
+
+
+def _index(container: List[Any], token: str, allow_end: bool) -> int:
+    """将路径片段解析为数组下标
+
+    Args:
+        container: 数组
+        token: 路径片段
+        allow_end: 是否允许"-"或等于长度的下标（表示追加到末尾）
+
+    Returns:
+        下标
+
+    Raises:
+        PatchError: 下标无效或越界
+    """
+    if token == "-" and allow_end:
+        return len(container)
+    if not token.isdigit():
+        raise PatchError(f"无效的数组下标：{token}")
+    index = int(token)
+    if index > len(container) or (index == len(container) and not allow_end):
+        raise PatchError(f"数组下标越界：{token}")
+    return index
+
+
+def _resolve(doc: Any, parts: List[str]) -> Any:
+    """读取路径处的值
+
+    Args:
+        doc: 文档
+        parts: 路径片段列表
+
+    Returns:
+        路径处的值
+
+    Raises:
+        PatchError: 路径不存在
+    """
+    for token in parts:
+        if isinstance(doc, dict):
+            if token not in doc:
+                raise PatchError(f"字段不存在：{token}")
+            doc = doc[token]
+        elif isinstance(doc, list):
+            doc = doc[_index(doc, token, allow_end=False)]
+        else:
+            raise PatchError(f"无法在{type(doc).__name__}中查找{token}")
+    return doc
+
+
+def _add(doc: Any, parts: List[str], value: Any) -> Any:
+    """在路径处添加值（数组中为插入，对象中为设置）"""
+    if not parts:
+        return value
+    parent = _resolve(doc, parts[:-1])
+    token = parts[-1]
+    if isinstance(parent, dict):
+        parent[token] = value
+    elif isinstance(parent, list):
+        parent.insert(_index(parent, token, allow_end=True), value)
+    else:
+        raise PatchError(f"无法向{type(parent).__name__}添加{token}")
+    return doc
+
+
+def _remove(doc: Any, parts: List[str]) -> Any:
+    """删除路径处的值，返回被删除的值"""
+    if not parts:
+        raise PatchError("不能删除整个文档")
+    parent = _resolve(doc, parts[:-1])
+    token = parts[-1]
+    if isinstance(parent, dict):
+        if token not in parent:
+            raise PatchError(f"字段不存在：{token}")
+        return parent.pop(token)
+    if isinstance(parent, list):
+        return parent.pop(_index(parent, token, allow_end=False))
+    raise PatchError(f"无法从{type(parent).__name__}删除{token}")
+
+
+def apply_patch(doc: Any, operations: List[Dict[str, Any]]) -> Any:
+    """将JSON Patch应用到文档的副本上
+
+    支持add、remove、replace、move、copy和test操作；任一操作失败时整个补丁不生效。
+
+    Args:
+        doc: 原文档（不会被修改）
+        operations: 操作列表
+
+    Returns:
+        应用补丁后的新文档
+
+    Raises:
+        PatchError: 补丁格式错误或无法应用
+    """
+    if not isinstance(operations, list):
+        raise PatchError("补丁必须是操作列表")
+    doc = copy.deepcopy(doc)
+    for number, operation in enumerate(operations, 1):
+        if not isinstance(operation, dict) or "op" not in operation or "path" not in operation:
+            raise PatchError(f"第{number}个操作缺少op或path")
+        op = operation["op"]
+        try:
+            parts = parse_pointer(operation["path"])
+            if op in ("add", "replace", "test") and "value" not in operation:
+                raise PatchError(f"{op}操作缺少value")
+            if op == "add":
+                doc = _add(doc, parts, copy.deepcopy(operation["value"]))
+            elif op == "remove":
+                _remove(doc, parts)
+            elif op == "replace":
+                if parts:
+                    _resolve(doc, parts)
+                    _remove(doc, parts)
+                doc = _add(doc, parts, copy.deepcopy(operation["value"]))
+            elif op in ("move", "copy"):
+                if "from" not in operation:
+                    raise PatchError(f"{op}操作缺少from")
+                source = parse_pointer(operation["from"])
+                value = _remove(doc, source) if op == "move" else copy.deepcopy(_resolve(doc, source))
+                doc = _add(doc, parts, value)
+            elif op == "test":
+                if _resolve(doc, parts) != operation["value"]:
+                    raise PatchError(f"test操作失败：{operation['path']}")
+            else:
+                raise PatchError(f"不支持的操作：{op}")
+        except PatchError as e:
+            raise PatchError(f"第{number}个操作（{op} {operation['path']}）无法应用：{e}") from e
+    return doc
@@ -0,0 +1,117 @@
+"""增量JSON解析模块 - 在流式输出过程中识别已经完整的JSON对象"""
+
+import json
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+
+class _Frame:
+    """解析栈中的一层容器（对象或数组）"""
+
+    def __init__(self, char: str, start: int, key: Optional[str]):
+        """初始化容器
+
+        Args:
+            char: 开始字符，'{'或'['
+            start: 开始字符在缓冲区中的位置
+            key: 容器所属的键名（数组中的元素继承数组的键名）
+        """
+        self.char = char
+        self.start = start
+        self.key = key
+
+
+class IncrementalJSONParser:
+    """感知括号和字符串的增量JSON解析器
+
+    逐块输入模型输出的文本，每当指定键名的数组中有对象的右括号到达时，
+    立即解析并返回该对象，无需等待整个JSON结束。根对象之前的说明文字或
+    代码块标记会被跳过。
+    """
+
+    def __init__(self, emit_keys: Iterable[str] = ("chapters", "sequentials", "verticals")):
+        """初始化解析器
+
+        Args:
+            emit_keys: 需要逐个输出元素对象的数组键名
+        """
+        self.emit_keys = set(emit_keys)
+        self.buffer = ""
+        self.done = False
+        self._root: Optional[Dict[str, Any]] = None
+        self._pos = 0
+        self._stack: List[_Frame] = []
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._last_string = ""
+        self._pending_key: Optional[str] = None
+
+    def feed(self, chunk: str) -> List[Tuple[str, Dict[str, Any]]]:
+        """输入一段文本
+
+        Args:
+            chunk: 新到达的文本片段
+
+        Returns:
+            本次新完成的(键名, 对象)列表，按右括号到达的顺序排列
+        """
+        self.buffer += chunk
+        completed = []
+        buffer = self.buffer
+
+        i = self._pos
+        while i < len(buffer) and not self.done:
+            ch = buffer[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == '\\':
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    self._last_string = buffer[self._string_start:i + 1]
+            elif not self._stack:
+                # 跳过根对象之前的内容
+                if ch == '{':
+                    self._stack.append(_Frame(ch, i, None))
+            elif ch == '"':
+                self._in_string = True
+                self._string_start = i
+            elif ch == ':':
+                if self._stack[-1].char == '{':
+                    try:
+                        self._pending_key = json.loads(self._last_string)
+                    except ValueError:
+                        self._pending_key = None
+            elif ch == ',':
+                self._pending_key = None
+            elif ch in '{[':
+                parent = self._stack[-1]
+                key = self._pending_key if parent.char == '{' else parent.key
+                self._stack.append(_Frame(ch, i, key))
+                self._pending_key = None
+            elif ch in '}]':
+                frame = self._stack.pop()
+                if not self._stack:
+                    self.done = True
+                    try:
+                        self._root = json.loads(buffer[frame.start:i + 1])
+                    except ValueError:
+                        self._root = None
+                elif ch == '}' and self._stack[-1].char == '[' and frame.key in self.emit_keys:
+                    try:
+                        completed.append((frame.key, json.loads(buffer[frame.start:i + 1])))
+                    except ValueError:
+                        pass
+            i += 1
+
+        self._pos = i
+        return completed
+
+    def result(self) -> Optional[Dict[str, Any]]:
+        """获取完整的根对象
+
+        Returns:
+            根对象，尚未结束或无法解析时返回None
+        """
+        return self._root
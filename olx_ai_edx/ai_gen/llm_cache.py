@@ -0,0 +1,190 @@
+"""LLM响应缓存模块 - 基于SQLite的内容寻址持久化缓存"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import textwrap
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from .conversation import message_content
+
+
+def normalize_messages(messages: List[Any]) -> List[Dict[str, str]]:
+    """规范化消息列表，忽略缩进和行尾空白等不影响语义的差异
+
+    Args:
+        messages: 消息列表
+
+    Returns:
+        仅包含role和content的规范化消息列表
+    """
+    normalized = []
+    for message in messages:
+        role = message.get("role") if isinstance(message, dict) else getattr(message, "role", "")
+        content = textwrap.dedent(message_content(message)).strip()
+        content = "\n".join(line.rstrip() for line in content.splitlines())
+        normalized.append({"role": role, "content": content})
+    return normalized
+
+
+def make_request_key(model: str, messages: List[Any], **params: Any) -> str:
+    """根据模型、规范化消息和请求参数计算内容哈希键
+
+    Args:
+        model: 模型名称
+        messages: 消息列表
+        **params: 影响输出的其他请求参数
+
+    Returns:
+        SHA-256十六进制摘要
+    """
+    payload = {"model": model, "messages": normalize_messages(messages), "params": params}
+    raw = json.dumps(payload, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class LLMResponseCache:
+    """持久化LLM响应缓存，支持按容量的LRU淘汰、TTL过期和命中统计"""
+
+    def __init__(self, path: str = ".cache/llm_responses.sqlite3", max_bytes: int = 64 * 1024 * 1024,
+                 ttl: Optional[float] = 7 * 24 * 3600):
+        """初始化缓存
+
+        Args:
+            path: SQLite数据库文件路径
+            max_bytes: 缓存内容的最大总字节数，超出时淘汰最久未访问的条目
+            ttl: 条目有效期（秒），None表示永不过期
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY,"
+            " model TEXT NOT NULL,"
+            " content TEXT NOT NULL,"
+            " usage TEXT NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_accessed ON responses (accessed_at)")
+        self._conn.commit()
+
+    @classmethod
+    def from_env(cls) -> Optional['LLMResponseCache']:
+        """根据环境变量创建缓存
+
+        LLM_CACHE_PATH为空时不启用缓存；LLM_CACHE_MAX_MB和LLM_CACHE_TTL_HOURS分别设置容量和有效期。
+
+        Returns:
+            缓存实例，未启用时返回None
+        """
+        path = os.getenv("LLM_CACHE_PATH", ".cache/llm_responses.sqlite3")
+        if not path:
+            return None
+        max_mb = float(os.getenv("LLM_CACHE_MAX_MB", "64"))
+        ttl_hours = float(os.getenv("LLM_CACHE_TTL_HOURS", "168"))
+        return cls(path, max_bytes=int(max_mb * 1024 * 1024), ttl=ttl_hours * 3600 if ttl_hours > 0 else None)
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """读取缓存条目
+
+        Args:
+            key: 请求哈希键
+
+        Returns:
+            包含model、content和usage的字典，未命中或已过期时返回None
+        """
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT model, content, usage, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            model, content, usage, created_at = row
+            if self.ttl is not None and now - created_at > self.ttl:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._conn.commit()
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+        return {"model": model, "content": content, "usage": json.loads(usage)}
+
+    def set(self, key: str, model: str, content: str, usage: Optional[Dict[str, int]] = None) -> None:
+        """写入缓存条目，并在超出容量时淘汰最久未访问的条目
+
+        Args:
+            key: 请求哈希键
+            model: 生成回复的模型
+            content: 回复文本
+            usage: token用量字典（可选）
+        """
+        now = time.time()
+        size = len(content.encode("utf-8"))
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, model, content, usage, size, created_at, accessed_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, model, content, json.dumps(usage or {}), size, now, now)
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self) -> None:
+        """淘汰最久未访问的条目，直到总大小不超过max_bytes（调用方需持有锁）"""
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = self._conn.execute("SELECT key, size FROM responses ORDER BY accessed_at ASC").fetchall()
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            total -= size
+            self.evictions += 1
+
+    def clear(self) -> None:
+        """清空缓存"""
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        """获取缓存统计信息
+
+        Returns:
+            包含命中、未命中、淘汰、过期次数以及条目数和总字节数的字典
+        """
+        with self._lock:
+            entries, total = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "entries": entries,
+            "bytes": total
+        }
@@ -0,0 +1,177 @@
+"""LLM响应对象 - 与OpenAI SDK响应结构兼容的轻量实现（用于缓存命中等非实时来源）"""
+
+from typing import Any, Dict, Iterator, Optional
+
+
+class ChatMessage:
+    """聊天消息"""
+
+    def __init__(self, content: str, role: str = "assistant"):
+        """初始化消息
+
+        Args:
+            content: 消息文本
+            role: 消息角色
+        """
+        self.role = role
+        self.content = content
+
+
+class ChatChoice:
+    """候选回复"""
+
+    def __init__(self, message: ChatMessage, finish_reason: str = "stop"):
+        """初始化候选回复
+
+        Args:
+            message: 回复消息
+            finish_reason: 结束原因
+        """
+        self.index = 0
+        self.message = message
+        self.finish_reason = finish_reason
+
+
+class ChatUsage:
+    """token用量"""
+
+    def __init__(self, prompt_tokens: int = 0, completion_tokens: int = 0, cached_tokens: int = 0):
+        """初始化token用量
+
+        Args:
+            prompt_tokens: 输入token数
+            completion_tokens: 输出token数
+            cached_tokens: 输入中命中服务端前缀缓存的token数
+        """
+        self.prompt_tokens = prompt_tokens
+        self.completion_tokens = completion_tokens
+        self.cached_tokens = cached_tokens
+        self.total_tokens = prompt_tokens + completion_tokens
+
+    def to_dict(self) -> Dict[str, int]:
+        """转换为字典
+
+        Returns:
+            token用量字典
+        """
+        return {"prompt_tokens": self.prompt_tokens, "completion_tokens": self.completion_tokens,
+                "cached_tokens": self.cached_tokens}
+
+
+class ChatResponse:
+    """聊天补全响应，可通过response.choices[0].message.content读取回复"""
+
+    def __init__(self, content: str, model: str, usage: Optional[Dict[str, int]] = None, cached: bool = False):
+        """初始化响应
+
+        Args:
+            content: 回复文本
+            model: 生成回复的模型
+            usage: token用量字典（可选）
+            cached: 是否来自本地缓存
+        """
+        self.model = model
+        self.choices = [ChatChoice(ChatMessage(content))]
+        self.usage = ChatUsage(**(usage or {}))
+        self.cached = cached
+        # 是否与同时进行的相同请求合并（结果来自另一个请求）
+        self.coalesced = False
+        # 流式接收时首个token到达的耗时（秒）
+        self.ttft: Optional[float] = None
+
+
+class ChatDelta:
+    """流式回复中的增量文本"""
+
+    def __init__(self, content: Optional[str]):
+        """初始化增量文本
+
+        Args:
+            content: 增量文本
+        """
+        self.content = content
+
+
+class ChunkChoice:
+    """流式数据块中的候选增量"""
+
+    def __init__(self, delta: ChatDelta):
+        """初始化候选增量
+
+        Args:
+            delta: 增量文本
+        """
+        self.index = 0
+        self.delta = delta
+
+
+class ChatChunk:
+    """流式回复的一个数据块，可通过chunk.choices[0].delta.content读取增量文本"""
+
+    def __init__(self, content: Optional[str] = None, usage: Optional[Dict[str, int]] = None):
+        """初始化数据块
+
+        Args:
+            content: 增量文本（为None时表示仅携带usage的末尾数据块）
+            usage: token用量字典（可选）
+        """
+        self.choices = [ChunkChoice(ChatDelta(content))] if content is not None else []
+        self.usage = ChatUsage(**usage) if usage is not None else None
+
+
+def stream_chunks(content: str, usage: Optional[Dict[str, int]] = None, chunk_size: int = 16) -> Iterator[ChatChunk]:
+    """将完整回复拆分为流式数据块
+
+    Args:
+        content: 完整回复文本
+        usage: token用量字典（可选，附在最后一个数据块上）
+        chunk_size: 每个数据块的字符数
+
+    Yields:
+        流式数据块
+    """
+    for i in range(0, len(content), chunk_size):
+        yield ChatChunk(content[i:i + chunk_size])
+    yield ChatChunk(usage=usage or {})
+
+
+def _usage_field(usage: Any, name: str) -> Any:
+    """读取usage字段（兼容字典和对象）
+
+    Args:
+        usage: usage字典或对象
+        name: 字段名
+
+    Returns:
+        字段值，不存在时返回None
+    """
+    if isinstance(usage, dict):
+        return usage.get(name)
+    return getattr(usage, name, None)
+
+
+def usage_to_dict(usage: Any) -> Dict[str, int]:
+    """将SDK或本地的usage对象（或批处理结果中的usage字典）转换为字典
+
+    命中服务端前缀缓存的输入token数：DeepSeek为prompt_cache_hit_tokens，
+    OpenAI兼容接口（如GLM）为prompt_tokens_details.cached_tokens。
+
+    Args:
+        usage: usage对象或字典（可为None）
+
+    Returns:
+        包含prompt_tokens、completion_tokens和cached_tokens的字典
+    """
+    if usage is None:
+        return {"prompt_tokens": 0, "completion_tokens": 0, "cached_tokens": 0}
+    cached = _usage_field(usage, "prompt_cache_hit_tokens")
+    if cached is None:
+        details = _usage_field(usage, "prompt_tokens_details")
+        cached = _usage_field(details, "cached_tokens") if details is not None else None
+    if cached is None:
+        cached = _usage_field(usage, "cached_tokens")
+    return {
+        "prompt_tokens": _usage_field(usage, "prompt_tokens") or 0,
+        "completion_tokens": _usage_field(usage, "completion_tokens") or 0,
+        "cached_tokens": cached or 0
+    }
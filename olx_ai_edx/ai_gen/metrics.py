@@ -0,0 +1,370 @@
+"""调用指标模块 - 记录每次LLM调用的token、耗时和费用，并输出到可插拔的指标接收器
+
+内置接收器：内存聚合（生成每门课程的汇总）、JSONL文件和Prometheus文本格式。
+"""
+
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from .model_tiers import tier_for_stage
+
+# 各模型每百万token的估算价格（元）：(输入, 命中前缀缓存的输入, 输出)
+MODEL_PRICES: Dict[str, Tuple[float, float, float]] = {
+    "deepseek-chat": (2.0, 0.5, 8.0),
+    "deepseek-reasoner": (4.0, 1.0, 16.0),
+    "glm-4-long": (1.0, 1.0, 1.0),
+    "glm-4-flash": (0.0, 0.0, 0.0)
+}
+
+
+def estimate_cost(model: str, prompt_tokens: int, completion_tokens: int, cached_tokens: int = 0) -> float:
+    """按价格表估算一次调用的费用
+
+    Args:
+        model: 模型名称
+        prompt_tokens: 输入token数（包含命中缓存的部分）
+        completion_tokens: 输出token数
+        cached_tokens: 输入中命中服务端前缀缓存的token数
+
+    Returns:
+        估算费用（元），未知模型返回0
+    """
+    input_price, cached_price, output_price = MODEL_PRICES.get(model, (0.0, 0.0, 0.0))
+    return ((prompt_tokens - cached_tokens) * input_price + cached_tokens * cached_price
+            + completion_tokens * output_price) / 1000000
+
+
+class CallRecord:
+    """一次LLM调用的指标"""
+
+    def __init__(self, stage: str, model: str, prompt_tokens: int = 0, completion_tokens: int = 0,
+                 wall_time: float = 0.0, ttft: Optional[float] = None, cache_hit: bool = False,
+                 error: Optional[str] = None, cached_tokens: int = 0, coalesced: bool = False):
+        """初始化调用记录
+
+        Args:
+            stage: 流水线阶段名称（如generate_chapter_content）
+            model: 模型名称
+            prompt_tokens: 输入token数
+            completion_tokens: 输出token数
+            wall_time: 总耗时（秒）
+            ttft: 首个token到达的耗时（秒），非流式调用等于总耗时
+            cache_hit: 是否命中本地缓存
+            error: 调用失败时的错误信息
+            cached_tokens: 输入中命中服务端前缀缓存的token数
+            coalesced: 是否与同时进行的相同请求合并（未实际发送）
+        """
+        self.stage = stage
+        self.model = model
+        self.prompt_tokens = prompt_tokens
+        self.completion_tokens = completion_tokens
+        self.wall_time = wall_time
+        self.ttft = ttft if ttft is not None else wall_time
+        self.cache_hit = cache_hit
+        self.error = error
+        self.cached_tokens = cached_tokens
+        self.coalesced = coalesced
+        self.cost = 0.0 if cache_hit or coalesced else estimate_cost(model, prompt_tokens, completion_tokens, cached_tokens)
+        self.timestamp = time.time()
+
+    def to_dict(self) -> Dict[str, Any]:
+        """转换为字典
+
+        Returns:
+            调用记录字典
+        """
+        return {
+            "timestamp": self.timestamp,
+            "stage": self.stage,
+            "model": self.model,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "cached_tokens": self.cached_tokens,
+            "wall_time": round(self.wall_time, 4),
+            "ttft": round(self.ttft, 4),
+            "cache_hit": self.cache_hit,
+            "coalesced": self.coalesced,
+            "cost": round(self.cost, 6),
+            "error": self.error
+        }
+
+
+class MetricsSink:
+    """指标接收器基类"""
+
+    def emit(self, record: CallRecord) -> None:
+        """接收一条调用记录
+
+        Args:
+            record: 调用记录
+
+        Raises:
+            NotImplementedError: 子类必须实现此方法
+        """
+        raise NotImplementedError("子类必须实现emit方法")
+
+
+class InMemoryAggregator(MetricsSink):
+    """在内存中保存调用记录，并按阶段汇总"""
+
+    def __init__(self):
+        """初始化内存聚合器"""
+        self.records: List[CallRecord] = []
+        self._lock = threading.Lock()
+
+    def emit(self, record: CallRecord) -> None:
+        with self._lock:
+            self.records.append(record)
+
+    def summary(self, since: int = 0, top_n: int = 5) -> Dict[str, Any]:
+        """汇总调用记录
+
+        Args:
+            since: 只汇总该序号之后的记录（用于单门课程的汇总）
+            top_n: 列出耗时最长的调用数
+
+        Returns:
+            包含总计、按阶段汇总、按模型级别汇总和最慢调用的字典
+        """
+        with self._lock:
+            records = self.records[since:]
+
+        by_stage: Dict[str, Dict[str, Any]] = {}
+        for r in records:
+            stage = by_stage.setdefault(r.stage, {
+                "calls": 0, "errors": 0, "cache_hits": 0, "coalesced": 0, "prompt_tokens": 0, "completion_tokens": 0,
+                "cached_tokens": 0, "wall_time": 0.0, "max_wall_time": 0.0, "ttft": 0.0, "cost": 0.0, "models": set()
+            })
+            stage["calls"] += 1
+            stage["errors"] += 1 if r.error else 0
+            stage["cache_hits"] += 1 if r.cache_hit else 0
+            stage["coalesced"] += 1 if r.coalesced else 0
+            stage["prompt_tokens"] += r.prompt_tokens
+            stage["completion_tokens"] += r.completion_tokens
+            stage["cached_tokens"] += r.cached_tokens
+            stage["wall_time"] += r.wall_time
+            stage["max_wall_time"] = max(stage["max_wall_time"], r.wall_time)
+            stage["ttft"] += r.ttft
+            stage["cost"] += r.cost
+            stage["models"].add(r.model)
+        for stage in by_stage.values():
+            stage["avg_wall_time"] = stage["wall_time"] / stage["calls"]
+            stage["avg_ttft"] = stage.pop("ttft") / stage["calls"]
+            stage["models"] = sorted(stage["models"])
+
+        # 按模型级别汇总，用于调整阶段到模型的映射
+        by_tier: Dict[str, Dict[str, Any]] = {}
+        for r in records:
+            tier = by_tier.setdefault(tier_for_stage(r.stage) or "other", {
+                "calls": 0, "wall_time": 0.0, "cost": 0.0, "models": set()
+            })
+            tier["calls"] += 1
+            tier["wall_time"] += r.wall_time
+            tier["cost"] += r.cost
+            tier["models"].add(r.model)
+        for tier in by_tier.values():
+            tier["avg_wall_time"] = tier["wall_time"] / tier["calls"]
+            tier["models"] = sorted(tier["models"])
+
+        slowest = sorted(records, key=lambda r: r.wall_time, reverse=True)[:top_n]
+        return {
+            "calls": len(records),
+            "errors": sum(1 for r in records if r.error),
+            "cache_hits": sum(1 for r in records if r.cache_hit),
+            "coalesced": sum(1 for r in records if r.coalesced),
+            "prompt_tokens": sum(r.prompt_tokens for r in records),
+            "completion_tokens": sum(r.completion_tokens for r in records),
+            "cached_tokens": sum(r.cached_tokens for r in records),
+            "wall_time": sum(r.wall_time for r in records),
+            "cost": sum(r.cost for r in records),
+            "by_stage": by_stage,
+            "by_tier": by_tier,
+            "slowest": [r.to_dict() for r in slowest]
+        }
+
+
+class JSONLSink(MetricsSink):
+    """将每条调用记录追加写入JSONL文件"""
+
+    def __init__(self, path: str):
+        """初始化JSONL接收器
+
+        Args:
+            path: 输出文件路径
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def emit(self, record: CallRecord) -> None:
+        line = json.dumps(record.to_dict(), ensure_ascii=False)
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+
+class PrometheusTextSink(MetricsSink):
+    """按(阶段, 模型)累计计数器，并以Prometheus文本格式输出"""
+
+    METRICS = [
+        ("llm_calls_total", "counter", "LLM调用次数"),
+        ("llm_errors_total", "counter", "失败的LLM调用次数"),
+        ("llm_cache_hits_total", "counter", "命中本地缓存的调用次数"),
+        ("llm_coalesced_total", "counter", "与同时进行的相同请求合并的调用次数"),
+        ("llm_prompt_tokens_total", "counter", "输入token总数"),
+        ("llm_completion_tokens_total", "counter", "输出token总数"),
+        ("llm_prompt_cache_hit_tokens_total", "counter", "命中服务端前缀缓存的输入token总数"),
+        ("llm_cost_total", "counter", "估算费用总额（元）"),
+        ("llm_call_seconds_sum", "counter", "调用总耗时（秒）"),
+        ("llm_ttft_seconds_sum", "counter", "首个token耗时总和（秒）")
+    ]
+
+    def __init__(self, path: Optional[str] = None):
+        """初始化Prometheus接收器
+
+        Args:
+            path: 输出文件路径（可选，设置后每次调用都会覆盖写入，供node_exporter文本采集）
+        """
+        self.path = path
+        self._counters: Dict[Tuple[str, str], Dict[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def emit(self, record: CallRecord) -> None:
+        with self._lock:
+            counters = self._counters.setdefault(
+                (record.stage, record.model), {name: 0.0 for name, _, _ in self.METRICS}
+            )
+            counters["llm_calls_total"] += 1
+            counters["llm_errors_total"] += 1 if record.error else 0
+            counters["llm_cache_hits_total"] += 1 if record.cache_hit else 0
+            counters["llm_coalesced_total"] += 1 if record.coalesced else 0
+            counters["llm_prompt_tokens_total"] += record.prompt_tokens
+            counters["llm_completion_tokens_total"] += record.completion_tokens
+            counters["llm_prompt_cache_hit_tokens_total"] += record.cached_tokens
+            counters["llm_cost_total"] += record.cost
+            counters["llm_call_seconds_sum"] += record.wall_time
+            counters["llm_ttft_seconds_sum"] += record.ttft
+        if self.path:
+            text = self.render()
+            with self._lock:
+                tmp_path = f"{self.path}.tmp"
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    f.write(text)
+                os.replace(tmp_path, self.path)
+
+    def render(self) -> str:
+        """以Prometheus文本格式输出所有计数器
+
+        Returns:
+            Prometheus文本
+        """
+        with self._lock:
+            items = sorted(self._counters.items())
+            lines = []
+            for name, metric_type, help_text in self.METRICS:
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {metric_type}")
+                for (stage, model), counters in items:
+                    lines.append(f'{name}{{stage="{stage}",model="{model}"}} {counters[name]:g}')
+        return "\n".join(lines) + "\n"
+
+
+def metric_sinks_from_env() -> List[MetricsSink]:
+    """根据环境变量创建额外的指标接收器
+
+    LLM_METRICS_JSONL设置JSONL文件路径，LLM_METRICS_PROM设置Prometheus文本文件路径。
+
+    Returns:
+        指标接收器列表
+    """
+    sinks: List[MetricsSink] = []
+    if os.getenv("LLM_METRICS_JSONL"):
+        sinks.append(JSONLSink(os.getenv("LLM_METRICS_JSONL")))
+    if os.getenv("LLM_METRICS_PROM"):
+        sinks.append(PrometheusTextSink(os.getenv("LLM_METRICS_PROM")))
+    return sinks
+
+
+class MetricsRecorder:
+    """将调用记录分发给内存聚合器和其他指标接收器"""
+
+    def __init__(self, sinks: Optional[List[MetricsSink]] = None):
+        """初始化指标记录器
+
+        Args:
+            sinks: 额外的指标接收器（可选，可在多个记录器之间共享）
+        """
+        self.aggregator = InMemoryAggregator()
+        self.sinks = [self.aggregator] + list(sinks or [])
+
+    def record(self, record: CallRecord) -> None:
+        """记录一次调用，接收器出错不影响生成流程
+
+        Args:
+            record: 调用记录
+        """
+        for sink in self.sinks:
+            try:
+                sink.emit(record)
+            except Exception as e:
+                print(f"指标记录失败（{type(sink).__name__}）: {e}")
+
+    def mark(self) -> int:
+        """返回当前记录数，用作summary的起点
+
+        Returns:
+            当前记录数
+        """
+        return len(self.aggregator.records)
+
+    def summary(self, since: int = 0, top_n: int = 5) -> Dict[str, Any]:
+        """汇总调用记录
+
+        Args:
+            since: 只汇总该序号之后的记录
+            top_n: 列出耗时最长的调用数
+
+        Returns:
+            汇总字典
+        """
+        return self.aggregator.summary(since, top_n)
+
+
+def format_summary(summary: Dict[str, Any]) -> str:
+    """将汇总格式化为便于阅读的文本
+
+    Args:
+        summary: InMemoryAggregator.summary()返回的汇总
+
+    Returns:
+        多行文本
+    """
+    lines = [
+        f"LLM调用 {summary['calls']} 次（失败 {summary['errors']}，缓存命中 {summary['cache_hits']}，"
+        f"合并 {summary.get('coalesced', 0)}），"
+        f"输入 {summary['prompt_tokens']} tokens（前缀缓存命中 {summary['cached_tokens']}），"
+        f"输出 {summary['completion_tokens']} tokens，"
+        f"累计耗时 {summary['wall_time']:.2f} 秒，估算费用 ¥{summary['cost']:.4f}"
+    ]
+    for name, stage in sorted(summary["by_stage"].items(), key=lambda item: -item[1]["wall_time"]):
+        lines.append(
+            f"  {name}: {stage['calls']} 次，输入 {stage['prompt_tokens']}（缓存命中 {stage['cached_tokens']}），"
+            f"输出 {stage['completion_tokens']}，"
+            f"平均耗时 {stage['avg_wall_time']:.2f} 秒，平均首token {stage['avg_ttft']:.2f} 秒，"
+            f"最长 {stage['max_wall_time']:.2f} 秒，费用 ¥{stage['cost']:.4f}（{', '.join(stage['models'])}）"
+        )
+    if summary.get("by_tier"):
+        lines.append("  按模型级别:")
+        for name, tier in sorted(summary["by_tier"].items(), key=lambda item: -item[1]["cost"]):
+            lines.append(f"    {name}: {tier['calls']} 次，平均耗时 {tier['avg_wall_time']:.2f} 秒，"
+                         f"费用 ¥{tier['cost']:.4f}（{', '.join(tier['models'])}）")
+    if summary["slowest"]:
+        lines.append("  最慢的调用:")
+        for r in summary["slowest"]:
+            lines.append(f"    {r['stage']} [{r['model']}] {r['wall_time']:.2f} 秒")
+    return "\n".join(lines)
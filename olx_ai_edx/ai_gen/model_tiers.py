@@ -0,0 +1,149 @@
+"""模型分级模块 - 按流水线阶段选择模型
+
+评审、评估分析等简单任务可以交给便宜、快速的模型，编写大纲和章节内容仍使用能力更强的模型。
+阶段按用途归入outline（大纲）、review（评审）、chapter（章节内容）、assessment（评估问题和增量评估）
+和analysis（评估分析）五个级别，每个级别可以单独指定模型，未指定时使用生成器的默认模型。
+"""
+
+import json
+import os
+from typing import Dict, Optional
+
+TIERS = ("outline", "review", "chapter", "assessment", "analysis")
+
+# 流水线阶段所属的级别
+STAGE_TIERS: Dict[str, str] = {
+    "generate_initial_outline": "outline",
+    "update_outline": "outline",
+    "update_full_course": "outline",
+    "review_outline": "review",
+    "review_chapter_content": "review",
+    "review_full_course": "review",
+    "generate_chapter_content": "chapter",
+    "update_chapter_content": "chapter",
+    "generate_assessment_questions": "assessment",
+    "estimate_assessment": "assessment",
+    "analyze_user_responses": "analysis"
+}
+
+
+def tier_for_stage(stage: str) -> Optional[str]:
+    """判断阶段所属的级别
+
+    修复请求（repair_<阶段>）和补丁请求（<阶段>_patch）与原阶段属于同一级别。
+
+    Args:
+        stage: 流水线阶段名称
+
+    Returns:
+        级别名称，未知阶段返回None
+    """
+    if stage.startswith("repair_"):
+        stage = stage[len("repair_"):]
+    if stage.endswith("_patch"):
+        stage = stage[:-len("_patch")]
+    return STAGE_TIERS.get(stage)
+
+
+def parse_tier_spec(spec: str) -> Dict[str, str]:
+    """解析级别配置
+
+    支持JSON文件路径、JSON对象文本或“级别=模型”以逗号分隔的写法（如review=glm-4-flash,analysis=glm-4-flash）。
+
+    Args:
+        spec: 配置文本
+
+    Returns:
+        级别到模型的映射
+
+    Raises:
+        ValueError: 配置格式错误或包含未知级别
+    """
+    spec = spec.strip()
+    if not spec:
+        return {}
+    if os.path.isfile(spec):
+        with open(spec, "r", encoding="utf-8") as f:
+            mapping = json.load(f)
+    elif spec.startswith("{"):
+        mapping = json.loads(spec)
+    else:
+        mapping = {}
+        for item in spec.split(","):
+            if not item.strip():
+                continue
+            if "=" not in item:
+                raise ValueError(f"模型分级配置格式错误：{item}（应为级别=模型）")
+            tier, model = item.split("=", 1)
+            mapping[tier.strip()] = model.strip()
+    unknown = set(mapping) - set(TIERS)
+    if unknown:
+        raise ValueError(f"未知的模型级别：{', '.join(sorted(unknown))}（可选{', '.join(TIERS)}）")
+    return {tier: model for tier, model in mapping.items() if model}
+
+
+class ModelTiers:
+    """阶段到模型的映射"""
+
+    def __init__(self, default_model: str, tiers: Optional[Dict[str, str]] = None):
+        """初始化模型分级
+
+        Args:
+            default_model: 未指定级别时使用的模型
+            tiers: 级别到模型的映射（可选）
+        """
+        self.default_model = default_model
+        self.tiers = dict(tiers or {})
+
+    @classmethod
+    def from_env(cls, default_model: str) -> 'ModelTiers':
+        """根据环境变量LLM_MODEL_TIERS创建模型分级（JSON文件路径、JSON对象或“级别=模型”列表）
+
+        Args:
+            default_model: 默认模型
+
+        Returns:
+            模型分级
+        """
+        return cls(default_model, parse_tier_spec(os.getenv("LLM_MODEL_TIERS", "")))
+
+    def with_overrides(self, overrides: Optional[Dict[str, str]] = None,
+                       default_model: Optional[str] = None) -> 'ModelTiers':
+        """创建带覆盖项的副本（如单个会话指定的模型）
+
+        Args:
+            overrides: 覆盖的级别到模型映射（可选，值为空表示恢复为默认模型）
+            default_model: 新的默认模型（可选）
+
+        Returns:
+            新的模型分级
+        """
+        tiers = dict(self.tiers)
+        for tier, model in (overrides or {}).items():
+            if tier not in TIERS:
+                raise ValueError(f"未知的模型级别：{tier}（可选{', '.join(TIERS)}）")
+            if model:
+                tiers[tier] = model
+            else:
+                tiers.pop(tier, None)
+        return ModelTiers(default_model or self.default_model, tiers)
+
+    def model_for(self, stage: Optional[str]) -> str:
+        """获取阶段使用的模型
+
+        Args:
+            stage: 流水线阶段名称（可选）
+
+        Returns:
+            模型名称
+        """
+        tier = tier_for_stage(stage) if stage else None
+        return self.tiers.get(tier, self.default_model) if tier else self.default_model
+
+    def to_dict(self) -> Dict[str, str]:
+        """各级别实际使用的模型
+
+        Returns:
+            级别到模型的映射（包含使用默认模型的级别）
+        """
+        return {tier: self.tiers.get(tier, self.default_model) for tier in TIERS}
@@ -0,0 +1,222 @@
+"""流水线调度模块 - 以有向无环图描述生成步骤，并发执行互不依赖的节点
+
+每个节点声明依赖的节点，依赖全部完成后即可执行；调度器在全局并发数和各服务商并发数的限制内，
+优先启动关键路径（其后续依赖链）最长的就绪节点。节点运行时可以继续添加节点（如生成大纲后按章节数添加章节节点），
+新增或调整步骤时只需声明依赖，执行顺序由调度器自动确定。
+某个节点失败时，不依赖它的节点（如其他章节）继续执行完毕，之后再抛出异常，已完成的工作可以保存到检查点。
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+NodeFunction = Callable[['Pipeline'], Any]
+
+
+def provider_limits_from_env() -> Dict[str, int]:
+    """从环境变量LLM_PROVIDER_CONCURRENCY读取各服务商的并发上限（如deepseek=4,glm=2）
+
+    格式错误的条目被跳过并打印警告，其服务商只受全局并发数限制。
+
+    Returns:
+        服务商到并发上限的映射
+    """
+    limits = {}
+    for item in os.getenv("LLM_PROVIDER_CONCURRENCY", "").split(","):
+        if not item.strip():
+            continue
+        provider, _, limit = item.partition("=")
+        try:
+            value = int(limit)
+        except ValueError:
+            value = None
+        if not provider.strip() or value is None:
+            print(f"警告：忽略格式错误的服务商并发配置：{item.strip()}（应为服务商=整数）")
+            continue
+        limits[provider.strip()] = max(1, value)
+    return limits
+
+
+class PipelineNode:
+    """流水线中的一个步骤"""
+
+    def __init__(self, name: str, fn: NodeFunction, deps: Iterable[str] = (), provider: Optional[str] = None):
+        """初始化节点
+
+        Args:
+            name: 节点名称（在流水线中唯一）
+            fn: 节点函数，以流水线为参数调用，返回值作为节点结果
+            deps: 依赖的节点名称
+            provider: 节点请求的模型服务商（可选，用于服务商并发限制；不调用模型的节点为None）
+        """
+        self.name = name
+        self.fn = fn
+        self.deps = list(deps)
+        self.provider = provider
+        # pending、running、done或failed
+        self.state = "pending"
+        self.result: Any = None
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+
+class Pipeline:
+    """按依赖关系并发执行节点的调度器"""
+
+    def __init__(self, max_workers: int = 4, provider_limits: Optional[Dict[str, int]] = None):
+        """初始化流水线
+
+        Args:
+            max_workers: 同时执行的最大节点数
+            provider_limits: 各服务商同时执行的最大节点数（可选，未列出的服务商只受全局限制）
+        """
+        self.max_workers = max(1, max_workers)
+        self.provider_limits = provider_limits or {}
+        self.nodes: Dict[str, PipelineNode] = {}
+        self.peak_concurrency = 0
+        self._running: Dict[Optional[str], int] = {}
+        self._error: Optional[BaseException] = None
+        self._cond = threading.Condition()
+
+    def add(self, name: str, fn: NodeFunction, deps: Iterable[str] = (),
+            provider: Optional[str] = None) -> PipelineNode:
+        """添加节点（可在其他节点运行时调用）
+
+        依赖的节点可以稍后再添加，但运行结束时必须存在。
+
+        Args:
+            name: 节点名称
+            fn: 节点函数
+            deps: 依赖的节点名称
+            provider: 节点请求的模型服务商（可选）
+
+        Returns:
+            新节点
+
+        Raises:
+            ValueError: 节点名称重复
+        """
+        with self._cond:
+            if name in self.nodes:
+                raise ValueError(f"流水线节点重复：{name}")
+            node = PipelineNode(name, fn, deps, provider)
+            self.nodes[name] = node
+            self._cond.notify_all()
+            return node
+
+    def depend(self, name: str, dep: str) -> None:
+        """为尚未开始的节点追加依赖
+
+        Args:
+            name: 节点名称
+            dep: 追加的依赖节点名称
+
+        Raises:
+            ValueError: 节点不存在或已经开始执行
+        """
+        with self._cond:
+            node = self.nodes.get(name)
+            if node is None or node.state != "pending":
+                raise ValueError(f"无法为节点{name}追加依赖：节点不存在或已开始执行")
+            node.deps.append(dep)
+
+    def result(self, name: str) -> Any:
+        """获取已完成节点的结果
+
+        Args:
+            name: 节点名称
+
+        Returns:
+            节点结果
+        """
+        return self.nodes[name].result
+
+    def _ready(self) -> List[PipelineNode]:
+        """依赖已全部完成的待执行节点，按关键路径长度从长到短排列"""
+        ready = [node for node in self.nodes.values() if node.state == "pending" and all(
+            dep in self.nodes and self.nodes[dep].state == "done" for dep in node.deps)]
+        if len(ready) <= 1:
+            return ready
+
+        dependents: Dict[str, List[str]] = {}
+        for node in self.nodes.values():
+            for dep in node.deps:
+                dependents.setdefault(dep, []).append(node.name)
+        depth: Dict[str, int] = {}
+
+        def path_length(name: str) -> int:
+            if name not in depth:
+                depth[name] = 0
+                depth[name] = 1 + max((path_length(child) for child in dependents.get(name, [])), default=0)
+            return depth[name]
+
+        # 同等关键路径长度时按添加顺序执行
+        return sorted(ready, key=lambda node: -path_length(node.name))
+
+    def _can_start(self, node: PipelineNode) -> bool:
+        """节点是否在全局和服务商并发限制之内"""
+        if sum(self._running.values()) >= self.max_workers:
+            return False
+        limit = self.provider_limits.get(node.provider) if node.provider else None
+        return limit is None or self._running.get(node.provider, 0) < limit
+
+    def _execute(self, node: PipelineNode) -> None:
+        """在工作线程中执行节点"""
+        try:
+            result = node.fn(self)
+            error = None
+        except BaseException as e:
+            result, error = None, e
+        with self._cond:
+            node.finished_at = time.perf_counter()
+            self._running[node.provider] -= 1
+            if error is None:
+                node.result = result
+                node.state = "done"
+            else:
+                node.state = "failed"
+                if self._error is None:
+                    self._error = error
+            self._cond.notify_all()
+
+    def run(self) -> Dict[str, Any]:
+        """执行所有节点，直到全部完成
+
+        Returns:
+            节点名称到结果的映射
+
+        Raises:
+            ValueError: 存在无法满足的依赖（依赖的节点不存在或有环）
+            Exception: 节点抛出的第一个异常（不依赖失败节点的其他节点全部执行完毕后抛出）
+        """
+        start = time.perf_counter()
+        executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        try:
+            with self._cond:
+                while True:
+                    # 失败节点的后续节点永远不会就绪，其余节点照常执行
+                    for node in self._ready():
+                        if self._can_start(node):
+                            node.state = "running"
+                            node.started_at = time.perf_counter()
+                            self._running[node.provider] = self._running.get(node.provider, 0) + 1
+                            executor.submit(self._execute, node)
+                    running = sum(self._running.values())
+                    self.peak_concurrency = max(self.peak_concurrency, running)
+
+                    if running == 0:
+                        if self._error is not None:
+                            raise self._error
+                        pending = [node.name for node in self.nodes.values() if node.state == "pending"]
+                        if not pending:
+                            break
+                        raise ValueError(f"流水线存在无法满足的依赖：{', '.join(pending)}")
+                    self._cond.wait()
+        finally:
+            executor.shutdown(wait=False)
+
+        print(f"流水线完成：{len(self.nodes)}个节点，耗时{time.perf_counter() - start:.2f}秒，"
+              f"最大并发{self.peak_concurrency}")
+        return {name: node.result for name, node in self.nodes.items()}
@@ -0,0 +1,224 @@
+"""提示编译模块 - 按阶段精简嵌入提示的数据，并在本地统计节省的输入token
+
+每个阶段只保留需要的字段（如评审大纲只需要标题和描述），数据以紧凑JSON（不转义中文、无多余空格）渲染；
+为阶段设置了token预算时，超出预算的数据会逐步截短最长的文本字段。token数优先用tiktoken计算，
+未安装时使用字符数估算。节省量相对于直接把数据以Python repr嵌入f-string的写法计算。
+"""
+
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from .conversation import estimate_tokens
+from .prompts import PromptLayout, render_value
+
+try:
+    import tiktoken
+except ImportError:  # 可选依赖，未安装时使用估算
+    tiktoken = None
+
+# 字段白名单：字典表示只保留列出的键（值为None时保留整个子树），列表表示对每个元素应用同一规则
+OUTLINE_FIELDS = {"course_title": None, "chapters": [{"title": None, "description": None}]}
+CHAPTER_FIELDS = {
+    "chapter_title": None,
+    "sequentials": [{"title": None, "verticals": [{"html": None, "problem": None}]}]
+}
+# 整体审校时章节已替换为详细内容，同时保留大纲条目和章节内容的字段
+COURSE_FIELDS = {
+    "course_title": None,
+    "chapters": [{"title": None, "description": None, "chapter_title": None,
+                  "sequentials": CHAPTER_FIELDS["sequentials"]}]
+}
+ASSESSMENT_FIELDS = {"level": None, "confidence": None, "explanation": None, "objectives": None,
+                     "learning_path": None}
+
+# 各阶段每个字段的白名单（按字段名）
+STAGE_FIELDS: Dict[str, Dict[str, Any]] = {
+    "review_outline": {"课程大纲": OUTLINE_FIELDS},
+    "update_outline": {"当前大纲": OUTLINE_FIELDS},
+    "review_full_course": {"完整课程": COURSE_FIELDS},
+    "update_full_course": {"当前课程": COURSE_FIELDS},
+    "review_chapter_content": {"章节内容": CHAPTER_FIELDS},
+    "update_chapter_content": {"当前内容": CHAPTER_FIELDS},
+    "estimate_assessment": {"当前评估": ASSESSMENT_FIELDS}
+}
+
+# 各阶段嵌入数据的token预算；只为只读数据的阶段设置（修订阶段的补丁需要基于完整内容）
+STAGE_BUDGETS: Dict[str, int] = {
+    "review_chapter_content": 4000,
+    "review_full_course": 4000,
+    "analyze_user_responses": 2000,
+    "estimate_assessment": 1500
+}
+
+# 截短文本字段时保留的最少字符数
+MIN_TEXT_CHARS = 32
+
+_encoding = None
+
+
+def count_tokens(text: str) -> int:
+    """计算文本的token数（安装了tiktoken时精确计算，否则估算）
+
+    Args:
+        text: 文本
+
+    Returns:
+        token数
+    """
+    global _encoding
+    if tiktoken is None:
+        return estimate_tokens(text)
+    if _encoding is None:
+        _encoding = tiktoken.get_encoding("cl100k_base")
+    return len(_encoding.encode(text))
+
+
+def project(value: Any, fields: Any) -> Any:
+    """按白名单裁剪数据
+
+    Args:
+        value: 数据
+        fields: 白名单（None表示全部保留）
+
+    Returns:
+        裁剪后的数据（原数据不会被修改）
+    """
+    if fields is None:
+        return value
+    if isinstance(fields, dict) and isinstance(value, dict):
+        return {key: project(value[key], sub) for key, sub in fields.items() if key in value}
+    if isinstance(fields, list) and isinstance(value, list):
+        return [project(item, fields[0]) for item in value]
+    return value
+
+
+def _longest_text(value: Any) -> int:
+    """数据中最长的字符串长度"""
+    if isinstance(value, str):
+        return len(value)
+    if isinstance(value, dict):
+        return max((_longest_text(item) for item in value.values()), default=0)
+    if isinstance(value, list):
+        return max((_longest_text(item) for item in value), default=0)
+    return 0
+
+
+def _truncate(value: Any, max_chars: int) -> Any:
+    """把数据中超过max_chars的字符串截短"""
+    if isinstance(value, str):
+        return value if len(value) <= max_chars else value[:max_chars] + "…"
+    if isinstance(value, dict):
+        return {key: _truncate(item, max_chars) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_truncate(item, max_chars) for item in value]
+    return value
+
+
+class PromptCompiler:
+    """按阶段精简提示中的数据字段、执行token预算，并统计节省的token"""
+
+    def __init__(self, stage_fields: Optional[Dict[str, Dict[str, Any]]] = None,
+                 stage_budgets: Optional[Dict[str, int]] = None):
+        """初始化提示编译器
+
+        Args:
+            stage_fields: 各阶段的字段白名单（可选，默认STAGE_FIELDS）
+            stage_budgets: 各阶段嵌入数据的token预算（可选，默认STAGE_BUDGETS）
+        """
+        self.stage_fields = STAGE_FIELDS if stage_fields is None else stage_fields
+        self.stage_budgets = STAGE_BUDGETS if stage_budgets is None else stage_budgets
+        self._stats: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    def request(self, layout: PromptLayout, stage: str, instruction: str,
+                *fields: Tuple[str, Any]) -> Dict[str, str]:
+        """编译一条用户请求
+
+        Args:
+            layout: 提示布局
+            stage: 流水线阶段名称（决定字段白名单和token预算）
+            instruction: 固定的指令文本
+            *fields: (字段名, 值)
+
+        Returns:
+            用户消息
+        """
+        whitelist = self.stage_fields.get(stage, {})
+        compiled = [(label, project(value, whitelist.get(label))) for label, value in fields]
+        truncated = 0
+        budget = self.stage_budgets.get(stage)
+        if budget is not None:
+            compiled, truncated = self._fit(compiled, budget)
+
+        baseline = sum(count_tokens(f"{label}：{value}") for label, value in fields)
+        tokens = sum(count_tokens(f"{label}：{render_value(value)}") for label, value in compiled)
+        with self._lock:
+            stats = self._stats.setdefault(stage, {"requests": 0, "baseline_tokens": 0, "compiled_tokens": 0,
+                                                   "truncated": 0})
+            stats["requests"] += 1
+            stats["baseline_tokens"] += baseline
+            stats["compiled_tokens"] += tokens
+            stats["truncated"] += truncated
+        return layout.request(instruction, *compiled)
+
+    @staticmethod
+    def _fit(fields: List[Tuple[str, Any]], budget: int) -> Tuple[List[Tuple[str, Any]], int]:
+        """逐步截短最长的文本字段，直到嵌入的数据不超过预算
+
+        Args:
+            fields: (字段名, 值)列表
+            budget: token预算
+
+        Returns:
+            (截短后的字段列表, 截短次数)
+        """
+        def size(items: List[Tuple[str, Any]]) -> int:
+            return sum(count_tokens(f"{label}：{render_value(value)}") for label, value in items)
+
+        rounds = 0
+        while size(fields) > budget:
+            longest = max((_longest_text(value) for _, value in fields), default=0)
+            if longest <= MIN_TEXT_CHARS:
+                break
+            max_chars = max(MIN_TEXT_CHARS, longest // 2)
+            fields = [(label, _truncate(value, max_chars)) for label, value in fields]
+            rounds += 1
+        if rounds:
+            print(f"提示数据超过{budget} tokens预算，已截短较长的文本字段（{rounds}轮）")
+        return fields, rounds
+
+    def summary(self) -> Dict[str, Any]:
+        """汇总节省的token
+
+        Returns:
+            包含baseline_tokens、compiled_tokens、saved_tokens和按阶段明细by_stage的字典
+        """
+        with self._lock:
+            by_stage = {stage: dict(stats, saved_tokens=stats["baseline_tokens"] - stats["compiled_tokens"])
+                        for stage, stats in self._stats.items()}
+        baseline = sum(stats["baseline_tokens"] for stats in by_stage.values())
+        compiled = sum(stats["compiled_tokens"] for stats in by_stage.values())
+        return {
+            "baseline_tokens": baseline,
+            "compiled_tokens": compiled,
+            "saved_tokens": baseline - compiled,
+            "by_stage": by_stage
+        }
+
+
+def format_savings(summary: Dict[str, Any]) -> str:
+    """将节省统计格式化为便于阅读的文本
+
+    Args:
+        summary: PromptCompiler.summary()返回的汇总
+
+    Returns:
+        多行文本
+    """
+    baseline = summary["baseline_tokens"]
+    ratio = summary["saved_tokens"] / baseline if baseline else 0.0
+    lines = [f"提示数据 {summary['compiled_tokens']} tokens，节省 {summary['saved_tokens']} tokens（{ratio:.0%}）"]
+    for name, stage in sorted(summary["by_stage"].items(), key=lambda item: -item[1]["saved_tokens"]):
+        lines.append(f"  {name}: {stage['requests']} 次，{stage['baseline_tokens']} → {stage['compiled_tokens']} tokens"
+                     + (f"，截短 {stage['truncated']} 轮" if stage["truncated"] else ""))
+    return "\n".join(lines)
@@ -0,0 +1,107 @@
+"""提示布局模块 - 按“稳定系统提示 → 共享上下文 → 本次变量”的顺序组装消息
+
+DeepSeek等服务商会缓存请求中重复出现的前缀，命中部分的输入token计费更低、首token更快。
+因此所有请求都以固定不变的系统提示开头，同一门课程的章节请求共享同一段课程上下文，
+每次调用才变化的内容（标题、评审意见、当前内容等）一律放在消息末尾。
+"""
+
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+# 课程设计相关请求共用的系统提示，内容必须保持不变才能命中前缀缓存
+COURSE_SYSTEM_PROMPT = (
+    "你是一个专业课程设计师，负责为Open edX平台设计个性化课程。"
+    "课程由章节（chapter）组成，章节由单元（sequential）组成，单元由页面（vertical）组成，"
+    "每个页面包含HTML讲解内容（html）和一道练习题（problem，使用Open edX的problem XML格式）。"
+    "要求输出JSON时，只输出一个JSON对象，不要添加解释或Markdown代码块。"
+)
+
+# 技能评估相关请求共用的系统提示
+ASSESSMENT_SYSTEM_PROMPT = (
+    "你是一位教育评估专家，通过开放式问答判断用户在某个技能领域的水平（初级/中级/高级）和学习意图。"
+)
+
+
+def compact_json(value: Any) -> str:
+    """序列化为紧凑JSON（不转义中文，分隔符后无空格）
+
+    Args:
+        value: 数据
+
+    Returns:
+        JSON文本
+    """
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+
+
+def render_value(value: Any) -> str:
+    """将变量渲染为提示文本，字典和列表输出为紧凑JSON，保证相同数据总是得到相同文本
+
+    Args:
+        value: 变量值
+
+    Returns:
+        文本
+    """
+    if isinstance(value, (dict, list)):
+        return compact_json(value)
+    return str(value)
+
+
+class PromptLayout:
+    """以固定系统提示开头、变量放在末尾的消息组装器"""
+
+    def __init__(self, system_prompt: str):
+        """初始化布局
+
+        Args:
+            system_prompt: 固定不变的系统提示
+        """
+        self.system_prompt = system_prompt
+
+    def system_message(self, shared_context: Optional[str] = None) -> Dict[str, str]:
+        """创建系统消息：固定系统提示在前，多次请求共享的上下文（如课程大纲）在后
+
+        Args:
+            shared_context: 共享上下文（可选）
+
+        Returns:
+            系统消息
+        """
+        content = self.system_prompt
+        if shared_context:
+            content += "\n\n" + shared_context
+        return {"role": "system", "content": content}
+
+    def request(self, instruction: str, *fields: Tuple[str, Any]) -> Dict[str, str]:
+        """创建用户请求：不含变量的指令在前，按顺序排列的变量字段在后
+
+        Args:
+            instruction: 固定的指令文本
+            *fields: (字段名, 值)，变化最频繁或篇幅最长的字段应放在最后
+
+        Returns:
+            用户消息
+        """
+        parts = [instruction]
+        if fields:
+            parts.append("\n".join(f"{label}：{render_value(value)}" for label, value in fields))
+        return {"role": "user", "content": "\n\n".join(parts)}
+
+    def ensure_system(self, messages: List[Any]) -> List[Any]:
+        """对话历史为空或不以系统消息开头时，在开头插入固定系统消息
+
+        Args:
+            messages: 对话历史（原地修改）
+
+        Returns:
+            对话历史
+        """
+        first = messages[0] if messages else None
+        if not isinstance(first, dict) or first.get("role") != "system":
+            messages.insert(0, self.system_message())
+        return messages
+
+
+COURSE_LAYOUT = PromptLayout(COURSE_SYSTEM_PROMPT)
+ASSESSMENT_LAYOUT = PromptLayout(ASSESSMENT_SYSTEM_PROMPT)
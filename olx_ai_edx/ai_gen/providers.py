@@ -0,0 +1,43 @@
+"""模型服务商配置 - DeepSeek与GLM的API地址和密钥环境变量"""
+
+import os
+from typing import Dict, Optional
+
+PROVIDERS: Dict[str, Dict[str, str]] = {
+    "deepseek": {
+        "base_url": "https://api.deepseek.com",
+        "api_key_env": "DEEPSEEK_API_KEY",
+        "default_model": "deepseek-chat"
+    },
+    "glm": {
+        "base_url": "https://open.bigmodel.cn/api/paas/v4/",
+        "api_key_env": "GLM_API_KEY",
+        "default_model": "glm-4-long"
+    }
+}
+
+
+def provider_for_model(model: Optional[str]) -> str:
+    """根据模型名称判断服务商
+
+    Args:
+        model: 模型名称
+
+    Returns:
+        服务商名称（"deepseek"或"glm"）
+    """
+    if model and "glm" in model.lower():
+        return "glm"
+    return "deepseek"
+
+
+def provider_api_key(provider: str) -> Optional[str]:
+    """从环境变量读取服务商的API密钥
+
+    Args:
+        provider: 服务商名称
+
+    Returns:
+        API密钥，未配置时返回None
+    """
+    return os.getenv(PROVIDERS[provider]["api_key_env"])
@@ -0,0 +1,267 @@
+"""评估题库模块 - 按技能缓存评估问题，命中时无需等待LLM生成
+
+技能名称先规范化（如“Python 编程”“python编程”“Python”都对应python），
+题目保存在本地SQLite中；过了刷新期限的题目仍然立即返回，同时在后台重新生成，
+超过有效期的题目才需要同步生成。热门技能可以通过命令行预先生成。
+"""
+
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Set
+
+# 规范化时去掉的技能名称后缀（按长度从长到短匹配）
+SKILL_SUFFIXES = ["编程语言", "programming", "language", "编程", "语言", "开发", "入门", "课程"]
+
+# 题库为空时用于预热的常见技能
+POPULAR_SKILLS = [
+    "Python 编程", "Java", "JavaScript", "SQL", "数据分析", "机器学习", "C++", "Go", "Linux", "深度学习"
+]
+
+QuestionGenerator = Callable[[str], List[str]]
+
+
+def normalize_skill_name(skill_name: str) -> str:
+    """规范化技能名称，作为题库的键
+
+    统一全角/半角和大小写，去掉空白、标点和“编程”“语言”等通用后缀。
+
+    Args:
+        skill_name: 用户输入的技能名称
+
+    Returns:
+        规范化后的技能键
+    """
+    text = unicodedata.normalize("NFKC", skill_name).lower()
+    text = re.sub(r"[\s\"'“”‘’「」《》()（）\[\]【】,，.。、:：;；!！?？]+", "", text)
+    stripped = text
+    changed = True
+    while changed:
+        changed = False
+        for suffix in SKILL_SUFFIXES:
+            if stripped.endswith(suffix) and len(stripped) > len(suffix):
+                stripped = stripped[:-len(suffix)]
+                changed = True
+    return stripped or text
+
+
+class QuestionBank:
+    """按规范化技能名称保存评估问题的本地题库，支持后台刷新和预热"""
+
+    def __init__(self, path: str = ".cache/question_bank.sqlite3", refresh_after: Optional[float] = 24 * 3600,
+                 ttl: Optional[float] = 30 * 24 * 3600, max_workers: int = 2):
+        """初始化题库
+
+        Args:
+            path: SQLite数据库文件路径
+            refresh_after: 题目生成超过该秒数后，读取时在后台重新生成（None表示不刷新）
+            ttl: 题目有效期（秒），过期后需要同步生成（None表示永不过期）
+            max_workers: 后台刷新的并发数
+        """
+        self.path = path
+        self.refresh_after = refresh_after
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self._lock = threading.Lock()
+        self._refreshing: Set[str] = set()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS question_sets ("
+            " skill_key TEXT PRIMARY KEY,"
+            " skill_name TEXT NOT NULL,"
+            " questions TEXT NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " requests INTEGER NOT NULL DEFAULT 0)"
+        )
+        self._conn.commit()
+
+    @classmethod
+    def from_env(cls) -> Optional['QuestionBank']:
+        """根据环境变量创建题库
+
+        QUESTION_BANK_PATH为空时不启用题库；QUESTION_BANK_REFRESH_HOURS和QUESTION_BANK_TTL_HOURS
+        分别设置后台刷新期限和有效期。
+
+        Returns:
+            题库实例，未启用时返回None
+        """
+        path = os.getenv("QUESTION_BANK_PATH", ".cache/question_bank.sqlite3")
+        if not path:
+            return None
+        refresh_hours = float(os.getenv("QUESTION_BANK_REFRESH_HOURS", "24"))
+        ttl_hours = float(os.getenv("QUESTION_BANK_TTL_HOURS", "720"))
+        return cls(path,
+                   refresh_after=refresh_hours * 3600 if refresh_hours > 0 else None,
+                   ttl=ttl_hours * 3600 if ttl_hours > 0 else None)
+
+    def get(self, skill_name: str) -> Optional[Dict[str, Any]]:
+        """读取技能的题目，并累计该技能的请求次数
+
+        Args:
+            skill_name: 技能名称
+
+        Returns:
+            包含questions和created_at的字典，不存在或已过期时返回None
+        """
+        key = normalize_skill_name(skill_name)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO question_sets (skill_key, skill_name, questions, created_at, requests)"
+                " VALUES (?, ?, '[]', 0, 1)"
+                " ON CONFLICT(skill_key) DO UPDATE SET requests = requests + 1",
+                (key, skill_name)
+            )
+            self._conn.commit()
+            questions, created_at = self._conn.execute(
+                "SELECT questions, created_at FROM question_sets WHERE skill_key = ?", (key,)
+            ).fetchone()
+            questions = json.loads(questions)
+            if not questions or (self.ttl is not None and now - created_at > self.ttl):
+                self.misses += 1
+                return None
+            self.hits += 1
+        return {"questions": questions, "created_at": created_at}
+
+    def put(self, skill_name: str, questions: List[str]) -> None:
+        """保存技能的题目
+
+        Args:
+            skill_name: 技能名称
+            questions: 问题列表
+        """
+        key = normalize_skill_name(skill_name)
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO question_sets (skill_key, skill_name, questions, created_at, requests)"
+                " VALUES (?, ?, ?, ?, 0)"
+                " ON CONFLICT(skill_key) DO UPDATE SET questions = excluded.questions,"
+                " created_at = excluded.created_at",
+                (key, skill_name, json.dumps(questions, ensure_ascii=False), time.time())
+            )
+            self._conn.commit()
+
+    def get_or_generate(self, skill_name: str, generate: QuestionGenerator) -> List[str]:
+        """返回技能的题目：命中时立即返回（过了刷新期限则同时在后台重新生成），未命中时同步生成
+
+        Args:
+            skill_name: 技能名称
+            generate: 生成问题列表的函数
+
+        Returns:
+            问题列表
+        """
+        entry = self.get(skill_name)
+        if entry is None:
+            questions = generate(skill_name)
+            self.put(skill_name, questions)
+            return questions
+        if self.refresh_after is not None and time.time() - entry["created_at"] > self.refresh_after:
+            self.refresh_in_background(skill_name, generate)
+        return entry["questions"]
+
+    def refresh_in_background(self, skill_name: str, generate: QuestionGenerator) -> bool:
+        """在后台重新生成技能的题目（同一技能同时只有一个刷新任务）
+
+        Args:
+            skill_name: 技能名称
+            generate: 生成问题列表的函数
+
+        Returns:
+            提交了新的刷新任务时返回True
+        """
+        key = normalize_skill_name(skill_name)
+        with self._lock:
+            if key in self._refreshing:
+                return False
+            self._refreshing.add(key)
+
+        def refresh() -> None:
+            try:
+                self.put(skill_name, generate(skill_name))
+                with self._lock:
+                    self.refreshes += 1
+            except Exception as e:
+                print(f"后台刷新{skill_name}的评估问题失败: {e}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        self._executor.submit(refresh)
+        return True
+
+    def top_skills(self, n: int) -> List[str]:
+        """按请求次数列出最热门的技能，不足n个时用常见技能补齐
+
+        Args:
+            n: 技能数
+
+        Returns:
+            技能名称列表
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT skill_name FROM question_sets ORDER BY requests DESC, skill_key ASC LIMIT ?", (n,)
+            ).fetchall()
+        skills = [row[0] for row in rows]
+        keys = {normalize_skill_name(skill) for skill in skills}
+        for skill in POPULAR_SKILLS:
+            if len(skills) >= n:
+                break
+            if normalize_skill_name(skill) not in keys:
+                skills.append(skill)
+                keys.add(normalize_skill_name(skill))
+        return skills[:n]
+
+    def prewarm(self, skills: List[str], generate: QuestionGenerator, max_workers: int = 4) -> Dict[str, int]:
+        """为指定技能预先生成题目
+
+        Args:
+            skills: 技能名称列表
+            generate: 生成问题列表的函数
+            max_workers: 并发生成数
+
+        Returns:
+            技能名称到生成的问题数的映射（失败为0）
+        """
+        def warm(skill_name: str) -> int:
+            try:
+                questions = generate(skill_name)
+            except Exception as e:
+                print(f"预热{skill_name}的评估问题失败: {e}")
+                return 0
+            self.put(skill_name, questions)
+            print(f"已预热{skill_name}的{len(questions)}个评估问题")
+            return len(questions)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return dict(zip(skills, executor.map(warm, skills)))
+
+    def stats(self) -> Dict[str, Any]:
+        """获取题库统计信息
+
+        Returns:
+            包含命中、未命中、后台刷新次数和已保存技能数的字典
+        """
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM question_sets WHERE questions != '[]'").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "refreshes": self.refreshes,
+            "entries": entries
+        }
@@ -0,0 +1,230 @@
+"""限流与重试模块 - 按服务商共享的令牌桶限流器和指数退避重试策略"""
+
+import email.utils
+import os
+import random
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+import openai
+
+# 各服务商默认配额：(每分钟请求数, 每分钟token数)，可通过<PROVIDER>_RPM和<PROVIDER>_TPM环境变量覆盖
+DEFAULT_RATE_LIMITS: Dict[str, Tuple[int, int]] = {
+    "deepseek": (300, 1000000),
+    "glm": (120, 500000)
+}
+
+# 可重试的HTTP状态码
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """令牌桶，允许透支，透支部分按补充速率折算为等待时间"""
+
+    def __init__(self, capacity: float, refill_per_second: float):
+        """初始化令牌桶
+
+        Args:
+            capacity: 桶容量（最大突发量）
+            refill_per_second: 每秒补充的令牌数
+        """
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        """按经过的时间补充令牌（调用方需持有锁）"""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.refill_per_second)
+        self._updated = now
+
+    def reserve(self, amount: float) -> float:
+        """预留令牌
+
+        Args:
+            amount: 需要的令牌数
+
+        Returns:
+            令牌可用前需要等待的秒数
+        """
+        with self._lock:
+            self._refill()
+            self.tokens -= amount
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.refill_per_second
+
+    def adjust(self, amount: float) -> None:
+        """调整令牌数（正数退还，负数追加扣除）
+
+        Args:
+            amount: 调整量
+        """
+        with self._lock:
+            self._refill()
+            self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class ProviderRateLimiter:
+    """单个服务商的限流器，同时限制每分钟请求数和每分钟token数"""
+
+    def __init__(self, requests_per_minute: int, tokens_per_minute: int):
+        """初始化限流器
+
+        Args:
+            requests_per_minute: 每分钟请求数上限
+            tokens_per_minute: 每分钟token数上限
+        """
+        self.requests = TokenBucket(requests_per_minute, requests_per_minute / 60.0)
+        self.tokens = TokenBucket(tokens_per_minute, tokens_per_minute / 60.0)
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self, estimated_tokens: int) -> float:
+        """阻塞直到配额允许发送一次请求
+
+        Args:
+            estimated_tokens: 本次请求预计消耗的token数（输入加预计输出）
+
+        Returns:
+            实际等待的秒数
+        """
+        wait = max(self.requests.reserve(1), self.tokens.reserve(estimated_tokens))
+        with self._lock:
+            wait = max(wait, self._paused_until - time.monotonic())
+        if wait > 0:
+            time.sleep(wait)
+        return max(wait, 0.0)
+
+    def record_usage(self, estimated_tokens: int, actual_tokens: int) -> None:
+        """根据实际用量修正token桶
+
+        Args:
+            estimated_tokens: 请求前预留的token数
+            actual_tokens: 服务端返回的实际token数
+        """
+        if actual_tokens > 0:
+            self.tokens.adjust(estimated_tokens - actual_tokens)
+
+    def pause(self, seconds: float) -> None:
+        """在服务端限流时暂停该服务商的所有请求
+
+        Args:
+            seconds: 暂停秒数
+        """
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+class RetryPolicy:
+    """指数退避加随机抖动的重试策略，优先遵循服务端的Retry-After"""
+
+    def __init__(self, max_retries: int = 5, base_delay: float = 1.0, max_delay: float = 60.0):
+        """初始化重试策略
+
+        Args:
+            max_retries: 最大重试次数
+            base_delay: 首次重试的基础等待秒数
+            max_delay: 单次等待的最大秒数
+        """
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """计算第attempt次重试前的等待时间
+
+        Args:
+            attempt: 已重试次数（从0开始）
+            retry_after: 服务端要求的等待秒数（可选）
+
+        Returns:
+            等待秒数
+        """
+        if retry_after is not None:
+            return min(retry_after, self.max_delay)
+        backoff = min(self.max_delay, self.base_delay * (2 ** attempt))
+        return random.uniform(backoff / 2, backoff)
+
+
+def error_status_code(error: Exception) -> Optional[int]:
+    """获取异常对应的HTTP状态码
+
+    Args:
+        error: 异常
+
+    Returns:
+        状态码，无法确定时返回None
+    """
+    return getattr(error, "status_code", None)
+
+
+def is_retryable(error: Exception) -> bool:
+    """判断异常是否为可重试的瞬时错误（限流、服务端错误、连接错误或超时）
+
+    Args:
+        error: 异常
+
+    Returns:
+        可重试时返回True
+    """
+    if isinstance(error, (openai.APIConnectionError, openai.APITimeoutError)):
+        return True
+    return error_status_code(error) in RETRYABLE_STATUS_CODES
+
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    """从异常的响应头中读取Retry-After
+
+    Args:
+        error: 异常
+
+    Returns:
+        等待秒数，没有该响应头时返回None
+    """
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return float(value) / 1000.0
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        try:
+            parsed = email.utils.parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        return max(0.0, parsed.timestamp() - time.time())
+
+
+_limiters: Dict[str, ProviderRateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(provider: str) -> ProviderRateLimiter:
+    """获取服务商的进程级共享限流器
+
+    Args:
+        provider: 服务商名称
+
+    Returns:
+        限流器实例
+    """
+    with _limiters_lock:
+        if provider not in _limiters:
+            rpm, tpm = DEFAULT_RATE_LIMITS.get(provider, DEFAULT_RATE_LIMITS["deepseek"])
+            rpm = int(os.getenv(f"{provider.upper()}_RPM", rpm))
+            tpm = int(os.getenv(f"{provider.upper()}_TPM", tpm))
+            _limiters[provider] = ProviderRateLimiter(rpm, tpm)
+        return _limiters[provider]
@@ -0,0 +1,328 @@
+"""服务商路由模块 - 基于延迟的路由和对冲请求
+
+每个请求发给所请求模型所属的服务商；只有为该模型显式配置了其他服务商的等价模型时才会路由和对冲：
+路由器记录每个服务商最近请求的延迟，优先把请求发给p50延迟最低的服务商，
+如果该请求在对冲延迟内没有返回，则向另一个服务商的等价模型发送相同的请求，
+采用最先返回的有效回复。尚未开始的落后请求会被取消，但已经发出的请求无法中止：它会继续执行完毕并消耗服务商配额，
+结果被丢弃。因此主服务商还没有延迟样本（对冲延迟未知）时不发送对冲请求，只在主请求失败时切换服务商。
+发往其他服务商的请求先获取该服务商的限流配额（所请求模型的服务商配额由调用方获取）。
+两路流式输出无法合并，因此流式请求沿用基类实现：完整请求后再拆分为数据块。
+路由器通过get_hedged_router在进程内共享，所有会话共用同一份延迟记录和请求线程池。
+"""
+
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from .backends import LLMBackend, OpenAIBackend
+from .conversation import estimate_messages_tokens
+from .llm_response import usage_to_dict
+from .providers import PROVIDERS, provider_for_model
+from .rate_limiter import get_rate_limiter
+
+
+def parse_equivalents(spec: str) -> Dict[str, List[str]]:
+    """解析等价模型配置
+
+    Args:
+        spec: 逗号分隔的模型=模型列表（如deepseek-chat=glm-4-long），两个模型互为等价模型
+
+    Returns:
+        模型名称到其等价模型列表的映射
+
+    Raises:
+        ValueError: 配置格式错误
+    """
+    equivalents: Dict[str, List[str]] = {}
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        left, sep, right = item.partition("=")
+        left, right = left.strip(), right.strip()
+        if not sep or not left or not right:
+            raise ValueError(f"等价模型配置格式错误：{item}（应为模型=模型）")
+        equivalents.setdefault(left, []).append(right)
+        equivalents.setdefault(right, []).append(left)
+    return equivalents
+
+
+class LatencyTracker:
+    """按服务商记录最近若干次请求的延迟，并计算分位数"""
+
+    def __init__(self, window: int = 50):
+        """初始化延迟记录器
+
+        Args:
+            window: 每个服务商保留的最近样本数
+        """
+        self.window = window
+        self._samples: Dict[str, Deque[float]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, provider: str, seconds: float) -> None:
+        """记录一次请求的延迟
+
+        Args:
+            provider: 服务商名称
+            seconds: 延迟秒数
+        """
+        with self._lock:
+            self._samples.setdefault(provider, deque(maxlen=self.window)).append(seconds)
+
+    def percentile(self, provider: str, q: float) -> Optional[float]:
+        """计算服务商延迟的分位数
+
+        Args:
+            provider: 服务商名称
+            q: 分位数（0~1）
+
+        Returns:
+            延迟秒数，没有样本时返回None
+        """
+        with self._lock:
+            samples = sorted(self._samples.get(provider, ()))
+        if not samples:
+            return None
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+
+class HedgedRouter(LLMBackend):
+    """在多个服务商之间按延迟路由，并在主请求过慢时发送对冲请求的后端"""
+
+    def __init__(self, routes: Dict[str, LLMBackend], equivalents: Optional[Dict[str, List[str]]] = None,
+                 hedge_delay: Optional[float] = None,
+                 hedge_quantile: float = 0.95, default_hedge_delay: Optional[float] = None,
+                 validator: Optional[Callable[[Any], bool]] = None, max_workers: int = 16,
+                 tracker: Optional[LatencyTracker] = None):
+        """初始化路由器
+
+        Args:
+            routes: 服务商名称到后端的映射，按优先级排列
+            equivalents: 模型名称到其他服务商等价模型列表的映射（可选），未列出的模型只发给其所属的服务商
+            hedge_delay: 固定的对冲延迟（秒），None表示使用主服务商延迟的hedge_quantile分位数
+            hedge_quantile: 自适应对冲延迟使用的分位数
+            default_hedge_delay: 主服务商还没有延迟样本时使用的对冲延迟（秒），None表示此时不发送对冲请求
+            validator: 判断回复是否有效的函数（可选，默认要求回复文本非空）
+            max_workers: 并发请求线程数
+            tracker: 延迟记录器（可选）
+        """
+        self.routes = routes
+        self.equivalents = equivalents or {}
+        self.hedge_delay = hedge_delay
+        self.hedge_quantile = hedge_quantile
+        self.default_hedge_delay = default_hedge_delay
+        self.validator = validator or (lambda response: bool(response.choices[0].message.content))
+        self.tracker = tracker or LatencyTracker()
+        self.hedges = 0
+        self.wins = {provider: 0 for provider in routes}
+        self.errors = {provider: 0 for provider in routes}
+        # 为其他服务商预留配额时对单次回复token数的估计
+        self.expected_completion_tokens = 1024
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, model: Optional[str] = None, api_key: Optional[str] = None,
+                 base_url: Optional[str] = None) -> 'HedgedRouter':
+        """根据环境变量创建DeepSeek与GLM之间的路由器
+
+        LLM_HEDGE_MODELS设置等价模型（默认为两个服务商的默认模型deepseek-chat=glm-4-long），
+        LLM_HEDGE_DELAY设置固定对冲延迟（秒），未设置时按延迟分位数自适应。
+
+        Args:
+            model: 调用方的模型名称（可选），api_key和base_url用于该模型所属的服务商
+            api_key: API密钥（可选，默认从服务商对应的环境变量读取）
+            base_url: API地址（可选，默认使用服务商的地址）
+
+        Returns:
+            路由器实例
+
+        Raises:
+            ValueError: 等价模型配置格式错误
+        """
+        own = provider_for_model(model) if model else None
+        routes = {
+            provider: OpenAIBackend.for_model(config["default_model"], api_key, base_url) if provider == own
+            else OpenAIBackend.for_model(config["default_model"])
+            for provider, config in PROVIDERS.items()
+        }
+        default_equivalents = "=".join(config["default_model"] for config in PROVIDERS.values())
+        equivalents = parse_equivalents(os.getenv("LLM_HEDGE_MODELS", default_equivalents))
+        hedge_delay = os.getenv("LLM_HEDGE_DELAY", "")
+        return cls(routes, equivalents, hedge_delay=float(hedge_delay) if hedge_delay else None)
+
+    def candidates(self, model: str) -> List[Tuple[str, str]]:
+        """请求该模型时可用的(服务商, 模型)，按p50延迟从低到高排列（没有样本的服务商优先，以便获得样本）
+
+        Args:
+            model: 请求的模型名称
+
+        Returns:
+            (服务商名称, 模型名称)列表，第一项之外都是其他服务商的等价模型
+        """
+        options = []
+        for name in [model] + self.equivalents.get(model, []):
+            provider = provider_for_model(name)
+            if provider in self.routes and provider not in [p for p, _ in options]:
+                options.append((provider, name))
+        order = list(self.routes)
+        return sorted(options, key=lambda option: (self.tracker.percentile(option[0], 0.5) or 0.0,
+                                                   order.index(option[0])))
+
+    def _delay_for(self, provider: str) -> Optional[float]:
+        """计算主请求发往provider时的对冲延迟
+
+        Args:
+            provider: 主服务商名称
+
+        Returns:
+            对冲延迟秒数，延迟未知且没有默认值时返回None（不发送对冲请求）
+        """
+        if self.hedge_delay is not None:
+            return self.hedge_delay
+        observed = self.tracker.percentile(provider, self.hedge_quantile)
+        return observed if observed is not None else self.default_hedge_delay
+
+    def _timed(self, provider: str, model: str, requested: str, messages: List[Dict[str, Any]],
+               params: Dict[str, Any]) -> Any:
+        """向服务商发送请求并记录延迟
+
+        Args:
+            provider: 服务商名称
+            model: 发给该服务商的模型名称
+            requested: 调用方请求的模型名称（其服务商的配额已由调用方获取）
+            messages: 消息列表
+            params: 其他请求参数
+
+        Returns:
+            响应对象
+        """
+        backend = self.routes[provider]
+        rate_limiter = None
+        if provider != provider_for_model(requested):
+            rate_limiter = get_rate_limiter(provider)
+            estimated = estimate_messages_tokens(messages) + self.expected_completion_tokens
+            rate_limiter.acquire(estimated)
+        start = time.perf_counter()
+        try:
+            response = backend.complete(model, messages, **params)
+        except Exception:
+            with self._lock:
+                self.errors[provider] += 1
+            raise
+        self.tracker.record(provider, time.perf_counter() - start)
+        if rate_limiter is not None:
+            usage = usage_to_dict(getattr(response, "usage", None))
+            rate_limiter.record_usage(estimated, usage["prompt_tokens"] + usage["completion_tokens"])
+        return response
+
+    def complete(self, model: str, messages: List[Dict[str, Any]], **params: Any) -> Any:
+        """发送请求，主请求超过对冲延迟时向下一个服务商的等价模型发送对冲请求
+
+        Args:
+            model: 请求的模型名称
+            messages: 消息列表
+            **params: 其他请求参数
+
+        Returns:
+            最先返回的有效响应
+
+        Raises:
+            Exception: 所有服务商都失败时抛出最后一个错误
+        """
+        ranked = self.candidates(model)
+        if not ranked:
+            raise ValueError(f"没有可处理模型{model}的服务商")
+        delay = self._delay_for(ranked[0][0])
+        pending: Dict[Future, str] = {}
+        launched = 0
+        errors = []
+
+        def launch() -> None:
+            nonlocal launched
+            provider, target = ranked[launched]
+            launched += 1
+            pending[self._executor.submit(self._timed, provider, target, model, messages, params)] = provider
+
+        launch()
+        while pending:
+            timeout = delay if launched < len(ranked) and delay is not None else None
+            done, _ = wait(list(pending), timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                # 主请求超过对冲延迟，向下一个服务商发送相同请求
+                with self._lock:
+                    self.hedges += 1
+                launch()
+                continue
+            for future in done:
+                provider = pending.pop(future)
+                try:
+                    response = future.result()
+                except Exception as e:
+                    errors.append(e)
+                    continue
+                if not self.validator(response):
+                    errors.append(ValueError(f"{provider}返回了无效回复"))
+                    continue
+                # 取消落后的请求：尚未开始的直接取消，已经发出的请求无法中止，执行完毕后结果被丢弃
+                for other in pending:
+                    other.cancel()
+                with self._lock:
+                    self.wins[provider] += 1
+                return response
+            if not pending and launched < len(ranked):
+                # 已发出的请求全部失败，立即切换到下一个服务商
+                launch()
+
+        raise errors[-1] if errors else RuntimeError("没有可用的服务商")
+
+    def stats(self) -> Dict[str, Any]:
+        """获取路由统计信息
+
+        Returns:
+            包含对冲次数以及各服务商p50/p95延迟、胜出次数和错误次数的字典
+        """
+        return {
+            "hedges": self.hedges,
+            "providers": {
+                provider: {
+                    "p50": self.tracker.percentile(provider, 0.5),
+                    "p95": self.tracker.percentile(provider, 0.95),
+                    "wins": self.wins[provider],
+                    "errors": self.errors[provider]
+                }
+                for provider in self.routes
+            }
+        }
+
+
+_routers: Dict[Tuple[str, str, str], HedgedRouter] = {}
+_routers_lock = threading.Lock()
+
+
+def get_hedged_router(model: Optional[str] = None, api_key: Optional[str] = None,
+                      base_url: Optional[str] = None) -> HedgedRouter:
+    """获取进程级共享的路由器，不存在时根据环境变量创建
+
+    使用相同凭据的所有会话共用一个路由器，延迟记录随请求不断积累，请求线程池也只创建一次。
+
+    Args:
+        model: 调用方的模型名称（可选），api_key和base_url用于该模型所属的服务商
+        api_key: API密钥（可选，默认从服务商对应的环境变量读取）
+        base_url: API地址（可选，默认使用服务商的地址）
+
+    Returns:
+        路由器实例
+    """
+    provider = provider_for_model(model) if model else ""
+    key = (provider, api_key or "", (base_url or "").rstrip("/"))
+    with _routers_lock:
+        router = _routers.get(key)
+        if router is None:
+            router = HedgedRouter.from_env(model, api_key, base_url)
+            _routers[key] = router
+        return router
@@ -0,0 +1,273 @@
+"""结构化输出校验模块 - 大纲和章节JSON的模式定义与预编译校验器
+
+模式使用JSON Schema的一个子集（type、properties、required、items、minItems、minLength），
+预先编译为嵌套的校验函数，每次校验不再重复解释模式。
+"""
+
+import json
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# 校验错误：(出错位置的路径, 错误说明)
+Path = Tuple[Any, ...]
+ValidationError = Tuple[Path, str]
+
+OUTLINE_SCHEMA: Dict[str, Any] = {
+    "type": "object",
+    "required": ["course_title", "chapters"],
+    "properties": {
+        "course_title": {"type": "string", "minLength": 1},
+        "chapters": {
+            "type": "array",
+            "minItems": 1,
+            "items": {
+                "type": "object",
+                "required": ["title", "description"],
+                "properties": {
+                    "title": {"type": "string", "minLength": 1},
+                    "description": {"type": "string"}
+                }
+            }
+        }
+    }
+}
+
+CHAPTER_SCHEMA: Dict[str, Any] = {
+    "type": "object",
+    "required": ["chapter_title", "sequentials"],
+    "properties": {
+        "chapter_title": {"type": "string", "minLength": 1},
+        "sequentials": {
+            "type": "array",
+            "minItems": 1,
+            "items": {
+                "type": "object",
+                "required": ["title", "verticals"],
+                "properties": {
+                    "title": {"type": "string", "minLength": 1},
+                    "verticals": {
+                        "type": "array",
+                        "minItems": 1,
+                        "items": {
+                            "type": "object",
+                            "required": ["html"],
+                            "properties": {
+                                "html": {"type": "string", "minLength": 1},
+                                "problem": {"type": "string"}
+                            }
+                        }
+                    }
+                }
+            }
+        }
+    }
+}
+
+# 完整课程：章节已替换为详细内容的大纲
+COURSE_SCHEMA: Dict[str, Any] = {
+    "type": "object",
+    "required": ["course_title", "chapters"],
+    "properties": {
+        "course_title": {"type": "string", "minLength": 1},
+        "chapters": {"type": "array", "minItems": 1, "items": CHAPTER_SCHEMA}
+    }
+}
+
+_TYPE_CHECKS: Dict[str, Callable[[Any], bool]] = {
+    "object": lambda value: isinstance(value, dict),
+    "array": lambda value: isinstance(value, list),
+    "string": lambda value: isinstance(value, str),
+    "integer": lambda value: isinstance(value, int) and not isinstance(value, bool),
+    "number": lambda value: isinstance(value, (int, float)) and not isinstance(value, bool),
+    "boolean": lambda value: isinstance(value, bool)
+}
+
+_TYPE_NAMES = {"object": "对象", "array": "数组", "string": "字符串", "integer": "整数", "number": "数字",
+               "boolean": "布尔值"}
+
+Check = Callable[[Any, Path, List[ValidationError]], None]
+
+
+def _compile(schema: Dict[str, Any]) -> Check:
+    """将模式编译为校验函数
+
+    Args:
+        schema: 模式字典
+
+    Returns:
+        校验函数，以(值, 路径, 错误列表)调用，错误追加到列表中
+    """
+    expected = schema.get("type")
+    type_check = _TYPE_CHECKS[expected] if expected else None
+    required = schema.get("required", [])
+    properties = {key: _compile(sub) for key, sub in schema.get("properties", {}).items()}
+    items = _compile(schema["items"]) if "items" in schema else None
+    min_items = schema.get("minItems")
+    min_length = schema.get("minLength")
+
+    def check(value: Any, path: Path, errors: List[ValidationError]) -> None:
+        if type_check is not None and not type_check(value):
+            errors.append((path, f"应为{_TYPE_NAMES[expected]}，实际为{type(value).__name__}"))
+            return
+        if isinstance(value, dict):
+            for key in required:
+                if key not in value:
+                    errors.append((path, f"缺少必填字段{key}"))
+            for key, sub_check in properties.items():
+                if key in value:
+                    sub_check(value[key], path + (key,), errors)
+        if isinstance(value, list):
+            if min_items is not None and len(value) < min_items:
+                errors.append((path, f"至少需要{min_items}项，实际为{len(value)}项"))
+            if items is not None:
+                for index, item in enumerate(value):
+                    items(item, path + (index,), errors)
+        if isinstance(value, str) and min_length is not None and len(value.strip()) < min_length:
+            errors.append((path, "不能为空"))
+
+    return check
+
+
+def format_path(path: Path) -> str:
+    """将路径格式化为便于阅读的形式，如$.sequentials[0].title
+
+    Args:
+        path: 路径
+
+    Returns:
+        路径字符串
+    """
+    return "$" + "".join(f"[{part}]" if isinstance(part, int) else f".{part}" for part in path)
+
+
+class SchemaValidator:
+    """预编译的模式校验器"""
+
+    def __init__(self, schema: Dict[str, Any]):
+        """编译模式
+
+        Args:
+            schema: 模式字典
+        """
+        self.schema = schema
+        self._check = _compile(schema)
+
+    def validate(self, value: Any) -> List[ValidationError]:
+        """校验数据
+
+        Args:
+            value: 待校验的数据
+
+        Returns:
+            错误列表，通过校验时为空
+        """
+        errors: List[ValidationError] = []
+        self._check(value, (), errors)
+        return errors
+
+    def subschema(self, path: Path) -> Dict[str, Any]:
+        """获取路径处数据对应的模式
+
+        Args:
+            path: 路径
+
+        Returns:
+            模式字典
+        """
+        schema = self.schema
+        for part in path:
+            schema = schema["items"] if isinstance(part, int) else schema["properties"][part]
+        return schema
+
+
+def extract_json(content: str) -> Tuple[str, Any]:
+    """从回复文本中提取并解析JSON对象
+
+    Args:
+        content: 回复文本
+
+    Returns:
+        (JSON文本, 解析结果)
+
+    Raises:
+        ValueError: 回复中没有JSON对象或JSON无法解析
+    """
+    start = content.find('{')
+    end = content.rfind('}') + 1
+    if start < 0 or end <= start:
+        raise ValueError("回复中没有JSON对象")
+    json_str = content[start:end]
+    try:
+        return json_str, json.loads(json_str)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"JSON解析失败：{e}") from e
+
+
+def repair_target(errors: List[ValidationError]) -> Path:
+    """确定需要修复的最小片段：第一个错误所在的最外层数组元素，没有数组元素时为整个文档
+
+    Args:
+        errors: 校验错误列表
+
+    Returns:
+        片段的路径
+    """
+    path = errors[0][0]
+    for index, part in enumerate(path):
+        if isinstance(part, int):
+            return path[:index + 1]
+    return ()
+
+
+def get_at(value: Any, path: Path) -> Any:
+    """读取路径处的数据
+
+    Args:
+        value: 文档
+        path: 路径
+
+    Returns:
+        路径处的数据
+    """
+    for part in path:
+        value = value[part]
+    return value
+
+
+def set_at(value: Any, path: Path, replacement: Any) -> Any:
+    """替换路径处的数据
+
+    Args:
+        value: 文档
+        path: 路径，空路径表示替换整个文档
+        replacement: 新数据
+
+    Returns:
+        替换后的文档
+    """
+    if not path:
+        return replacement
+    get_at(value, path[:-1])[path[-1]] = replacement
+    return value
+
+
+def errors_to_text(errors: List[ValidationError], base: Optional[Path] = None, limit: int = 5) -> str:
+    """将校验错误格式化为文本，路径相对于base
+
+    Args:
+        errors: 校验错误列表
+        base: 片段的路径（可选）
+        limit: 最多列出的错误数
+
+    Returns:
+        每行一个错误的文本
+    """
+    base = base or ()
+    lines = [f"{format_path(path[len(base):])}: {message}" for path, message in errors[:limit]]
+    if len(errors) > limit:
+        lines.append(f"……另有{len(errors) - limit}个错误")
+    return "\n".join(lines)
+
+
+OUTLINE_VALIDATOR = SchemaValidator(OUTLINE_SCHEMA)
+CHAPTER_VALIDATOR = SchemaValidator(CHAPTER_SCHEMA)
+COURSE_VALIDATOR = SchemaValidator(COURSE_SCHEMA)
@@ -0,0 +1,94 @@
+"""请求合并模块 - 同一时刻相同的LLM请求只向服务商发送一次
+
+多个会话同时为同一技能请求评估问题或大纲时，第一个请求（领头请求）实际发送，
+在它完成之前到达的相同请求（相同模型、规范化消息和请求参数）等待并共享同一个结果；
+领头请求失败时，等待的请求收到同一个异常。请求完成后立即移除，不做缓存（缓存由LLMResponseCache负责）。
+"""
+
+import os
+import threading
+from typing import Any, Callable, Dict, Optional, Tuple
+
+
+class _Call:
+    """一次进行中的请求"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """按键合并并发的相同请求"""
+
+    def __init__(self):
+        """初始化请求合并器"""
+        self._calls: Dict[str, _Call] = {}
+        self._lock = threading.Lock()
+        self._leaders = 0
+        self._coalesced = 0
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """执行请求，相同键的请求正在进行时等待其结果
+
+        Args:
+            key: 请求键（如make_request_key的结果）
+            fn: 实际发送请求的函数
+
+        Returns:
+            (结果, 是否为合并的请求)：合并的请求没有执行fn，结果来自相同键的进行中请求
+
+        Raises:
+            Exception: 领头请求抛出的异常
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = _Call()
+                self._calls[key] = call
+                self._leaders += 1
+                leader = True
+            else:
+                self._coalesced += 1
+                leader = False
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+    def stats(self) -> Dict[str, int]:
+        """合并统计
+
+        Returns:
+            包含实际发送的请求数leaders、合并的请求数coalesced和进行中的请求数in_flight的字典
+        """
+        with self._lock:
+            return {"leaders": self._leaders, "coalesced": self._coalesced, "in_flight": len(self._calls)}
+
+
+_single_flight = SingleFlight()
+
+
+def get_single_flight() -> Optional[SingleFlight]:
+    """获取进程级共享的请求合并器（环境变量LLM_SINGLE_FLIGHT设为0时不合并请求）
+
+    Returns:
+        请求合并器，未启用时返回None
+    """
+    if os.getenv("LLM_SINGLE_FLIGHT", "1") == "0":
+        return None
+    return _single_flight
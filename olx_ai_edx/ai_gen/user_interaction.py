@@ -3,6 +3,7 @@ from typing import List, Dict, Any, Tuple
 from ..models import UserProfile
 from ..models import Skill
 from .ai_gen_content import AIGenerator
+from .assessment import AdaptiveAssessment, ProgressiveAssessment
 
 class UserInteractionManager:
     def __init__(self, max_iterations: int = 1, aigenerator: AIGenerator = None):
@@ -26,15 +27,25 @@ class UserInteractionManager:
             assessment_questions = self.aigenerator.generate_assessment_questions(skill_name)
             print(f"以下是{skill_name}的评估问题:\n{assessment_questions}")
 
-            # 收集用户回答
-            user_responses = []
-            for question in assessment_questions:
-                response = input(f"{question} ")
-                user_responses.append({"question": question, "answer": response})
+            confidence_threshold = float(os.getenv("ASSESSMENT_CONFIDENCE", "0.8"))
+            if os.getenv("ASSESSMENT_ADAPTIVE") == "1":
+                # 根据回答选择下一个问题，水平判断足够确定时提前结束
+                assessment = AdaptiveAssessment(self.aigenerator, skill_name, assessment_questions,
+                                                confidence_threshold=confidence_threshold)
+                question = assessment.current_question
+                while question is not None:
+                    question = assessment.answer(input(f"{question} "))
+            else:
+                # 收集用户回答，用户输入下一个回答时后台已在分析前面的回答
+                assessment = ProgressiveAssessment(self.aigenerator, skill_name,
+                                                   confidence_threshold=confidence_threshold)
+                for question in assessment_questions:
+                    response = input(f"{question} ")
+                    assessment.add_response(question, response)
             
-            # 调用ai_gen_content.py中的函数分析用户回答
+            # 汇总后台评估结果，必要时再分析一次
             print("正在分析您的回答...")
-            assessment_result = self.aigenerator.analyze_user_responses(skill_name, user_responses)
+            assessment_result = assessment.finalize()
             return assessment_result
             
         except Exception as e:
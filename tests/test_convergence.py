@@ -0,0 +1,31 @@
+"""收敛检测测试"""
+
+from olx_ai_edx.ai_gen import ConvergenceDetector
+
+
+def _chapter(texts):
+    return {"sequentials": [{"title": f"单元{i}", "html": text} for i, text in enumerate(texts)]}
+
+
+def test_single_rewritten_field_in_large_object_is_not_converged():
+    texts = [f"<p>第{i}个单元的内容，保持不变。</p>" for i in range(20)]
+    old = _chapter(texts)
+    rewritten = list(texts)
+    rewritten[7] = "<pre><code>for item in items:\n    print(item)</code></pre>"
+    new = _chapter(rewritten)
+
+    detector = ConvergenceDetector()
+    assert not detector.converged("章节 1", old, new, iteration=1, remaining=2)
+    assert detector.stops == []
+
+
+def test_tiny_change_in_large_object_is_converged():
+    texts = [f"<p>第{i}个单元的内容，保持不变。</p>" for i in range(20)]
+    old = _chapter(texts)
+    edited = list(texts)
+    edited[7] = edited[7].replace("。", "！")
+    new = _chapter(edited)
+
+    detector = ConvergenceDetector()
+    assert detector.converged("章节 1", old, new, iteration=1, remaining=2)
+    assert detector.stops[0]["skipped"] == 2
@@ -0,0 +1,20 @@
+"""请求合并测试"""
+
+from olx_ai_edx.ai_gen import AIGenerator, SingleFlight, StubBackend, get_single_flight
+
+
+def test_none_disables_coalescing():
+    generator = AIGenerator(api_key="test", backend=StubBackend(), single_flight=None)
+    assert generator.single_flight is None
+
+
+def test_default_uses_shared_instance():
+    generator = AIGenerator(api_key="test", backend=StubBackend())
+    assert generator.single_flight is get_single_flight()
+
+
+def test_separate_instance_is_isolated():
+    single_flight = SingleFlight()
+    generator = AIGenerator(api_key="test", backend=StubBackend(), single_flight=single_flight)
+    generator._call_llm_api([{"role": "user", "content": "你好"}], stage="test", use_cache=False)
+    assert single_flight.stats()["leaders"] == 1
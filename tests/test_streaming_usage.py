@@ -0,0 +1,47 @@
+"""流式调用的token用量测试"""
+
+from olx_ai_edx.ai_gen import AIGenerator, MetricsSink, OpenAIBackend
+from olx_ai_edx.ai_gen.llm_response import stream_chunks
+
+
+class _Completions:
+    """模拟OpenAI客户端：只有请求了include_usage时才在末尾数据块返回用量"""
+
+    def __init__(self):
+        self.calls = []
+
+    def create(self, model, messages, stream=False, **params):
+        self.calls.append(params)
+        include_usage = params.get("stream_options", {}).get("include_usage", False)
+        usage = {"prompt_tokens": 12, "completion_tokens": 5} if include_usage else None
+        chunks = list(stream_chunks('{"ok": true}', usage))
+        return chunks if include_usage else chunks[:-1]
+
+
+class _Client:
+    def __init__(self):
+        self.chat = type("Chat", (), {})()
+        self.chat.completions = _Completions()
+
+
+class _Collector(MetricsSink):
+    def __init__(self):
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+def test_streamed_call_records_usage():
+    client = _Client()
+    sink = _Collector()
+    generator = AIGenerator(api_key="test", model="deepseek-chat", backend=OpenAIBackend(client),
+                            metric_sinks=[sink], single_flight=None)
+
+    generator._call_llm_api([{"role": "user", "content": "你好"}], stage="test", use_cache=False, stream=True)
+
+    assert client.chat.completions.calls[0]["stream_options"] == {"include_usage": True}
+    record = sink.records[-1]
+    assert record.prompt_tokens == 12
+    assert record.completion_tokens == 5
+    assert record.cost > 0